@@ -1,25 +1,49 @@
 import os
 import json
+import math
 import uuid
 import asyncio
 import aiohttp
 import websockets
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, UploadFile, File, Form, HTTPException, BackgroundTasks, Depends
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect, UploadFile, File, Form, HTTPException, BackgroundTasks, Depends
+from fastapi.responses import JSONResponse, FileResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel, Field
-from typing import Optional, List, Dict, Any, Union
+from pydantic import BaseModel, Field, ValidationError
+from typing import Optional, List, Dict, Any, Union, Tuple
 import base64
 import time
 import logging
 from concurrent.futures import ThreadPoolExecutor
-import glob
 from pathlib import Path
-from dataclasses import dataclass
 from enum import Enum
-import psutil
 import platform
+import functools
+import contextlib
+import aiofiles
+import socket
+import ipaddress
+from pipeline import (
+    JobScheduler, SchedulerFullError, ResultCache, hash_file, make_result_key, normalize_sketch,
+    SketchFingerprint, sketch_fingerprint, AdaptiveDebounce
+)
+from realtime import (
+    FrameError, FRAME_SKETCH_UPDATE, FRAME_RESULT_IMAGE, FRAME_CANVAS_KEYFRAME, FRAME_CANVAS_PATCH,
+    encode_frame, decode_frame, decode_patch, SketchCanvas, ImageHeaderError, validate_image_header
+)
+from monitoring import (
+    monitoring_settings, resource_sampler, render_metrics,
+    UPLOAD_SECONDS, SKETCH_DECODE_SECONDS, WORKFLOW_BUILD_SECONDS, COMFYUI_SUBMIT_SECONDS,
+    COMFYUI_QUEUE_WAIT_SECONDS, COMFYUI_EXECUTION_SECONDS, COMFYUI_RESULT_FETCH_SECONDS,
+    STROKE_TO_IMAGE_SECONDS, ACTIVE_SESSIONS, OPEN_WEBSOCKETS, PROMPTS_IN_FLIGHT, SESSION_MEMORY_BYTES,
+    SKETCH_CHANGE_CHECKS, SKETCH_FINGERPRINT_SECONDS, SKETCH_DEBOUNCE_SECONDS, SKETCH_DEBOUNCE_WINDOW,
+    Trace, TraceContextFilter, current_trace, tracer
+)
+from sessions import (
+    SessionRecord, SessionStore, MemorySessionStore, SlotLimiter, RateLimiter, TimerWheel, create_session_store,
+    MEMORY_SKETCH, MEMORY_CANVAS, MemoryBudget, MemoryBudgetExceeded
+)
+from comfyui import ComfyUIClient, ComfyUIBackend, ComfyUIBackendPool, WorkflowTemplateCache, LISTENER_DISCONNECTED, is_success_event, is_failure_event
 
 # 配置类
 class Environment(str, Enum):
@@ -30,14 +54,77 @@ class Config:
     """应用配置"""
     ENV: Environment = Environment(os.getenv("ENVIRONMENT", "development"))
     COMFYUI_SERVER: str = os.getenv("COMFYUI_SERVER", "http://127.0.0.1:8188")
+    # 多个ComfyUI节点，逗号分隔；未设置时只使用 COMFYUI_SERVER
+    COMFYUI_SERVERS: List[str] = [
+        url.strip() for url in os.getenv("COMFYUI_SERVERS", "").split(",") if url.strip()
+    ] or [COMFYUI_SERVER]
+    COMFYUI_HEALTH_INTERVAL: float = float(os.getenv("COMFYUI_HEALTH_INTERVAL", "5"))  # 节点健康检查间隔
+    COMFYUI_FAILURE_THRESHOLD: int = int(os.getenv("COMFYUI_FAILURE_THRESHOLD", "3"))  # 连续失败多少次后剔除节点
+    COMFYUI_EJECT_SECONDS: float = float(os.getenv("COMFYUI_EJECT_SECONDS", "30"))  # 节点剔除时长
+    COMFYUI_WS_ENABLED: bool = os.getenv("COMFYUI_WS_ENABLED", "true").lower() == "true"  # 使用事件流跟踪进度
+    COMFYUI_POLL_INTERVAL: float = float(os.getenv("COMFYUI_POLL_INTERVAL", "0.5"))  # 事件流不可用时的轮询间隔
+    COMFYUI_EVENT_TIMEOUT: float = float(os.getenv("COMFYUI_EVENT_TIMEOUT", "10"))  # 无事件时核对一次历史记录
+    COMFYUI_POOL_SIZE: int = int(os.getenv("COMFYUI_POOL_SIZE", "100"))  # ComfyUI连接池总连接数
+    COMFYUI_POOL_PER_HOST: int = int(os.getenv("COMFYUI_POOL_PER_HOST", "32"))  # 单个ComfyUI节点最大连接数
+    COMFYUI_KEEPALIVE_TIMEOUT: float = float(os.getenv("COMFYUI_KEEPALIVE_TIMEOUT", "30"))
+    COMFYUI_CONNECT_TIMEOUT: float = float(os.getenv("COMFYUI_CONNECT_TIMEOUT", "5"))
+    COMFYUI_READ_TIMEOUT: float = float(os.getenv("COMFYUI_READ_TIMEOUT", "60"))
+    # 有新草图时取消过时的prompt；旧版ComfyUI的 /interrupt 会中断任意正在执行的任务，多用户共享时慎用
+    COMFYUI_CANCEL_STALE: bool = os.getenv("COMFYUI_CANCEL_STALE", "false").lower() == "true"
     MAX_WORKERS: int = int(os.getenv("MAX_WORKERS", "4"))
+    MAX_PROMPTS_IN_FLIGHT: int = int(os.getenv("MAX_PROMPTS_IN_FLIGHT", "2"))  # 同时提交到ComfyUI的prompt数
+    MAX_QUEUED_JOBS: int = int(os.getenv("MAX_QUEUED_JOBS", "100"))  # 调度队列上限，超出则拒绝
     SESSION_TIMEOUT: int = int(os.getenv("SESSION_TIMEOUT", "1800"))  # 30分钟
-    CLEANUP_INTERVAL: int = int(os.getenv("CLEANUP_INTERVAL", "300"))  # 5分钟
-    MAX_ACTIVE_SESSIONS: int = int(os.getenv("MAX_ACTIVE_SESSIONS", "100"))  # 最大活动会话数
+    CLEANUP_INTERVAL: int = int(os.getenv("CLEANUP_INTERVAL", "300"))  # 系统资源检查间隔，5分钟
+    HEARTBEAT_TIMEOUT: float = float(os.getenv("HEARTBEAT_TIMEOUT", "30"))  # 超过该时间无心跳则断开
+    TIMER_TICK: float = float(os.getenv("TIMER_TICK", "1"))  # 会话过期/心跳定时器精度（秒）
+    HOST: str = os.getenv("HOST", "0.0.0.0")
+    PORT: int = int(os.getenv("PORT", "8000"))
+    WORKERS: int = int(os.getenv("WORKERS", str(os.cpu_count() or 1)))  # serve.py 启动的 worker 进程数
+    SHUTDOWN_DRAIN_TIMEOUT: float = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "30"))  # 停止时等待运行中任务完成的时间
+    SESSION_STORE: str = os.getenv("SESSION_STORE", "memory").lower()  # memory 单进程；redis 多 worker 共享会话
+    REDIS_URL: str = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    SESSION_STORE_PREFIX: str = os.getenv("SESSION_STORE_PREFIX", "drawing")
+    MAX_ACTIVE_SESSIONS: int = int(os.getenv("MAX_ACTIVE_SESSIONS", "10000"))  # 最大活动会话数
+    # 会话内存预算（草图与服务端画布，0为不限制）：超出时淘汰空闲会话，仍不足则拒绝新数据
+    SESSION_MEMORY_BUDGET: int = int(os.getenv("SESSION_MEMORY_BUDGET", str(1024 * 1024 * 1024)))  # 1GB
+    SESSION_MAX_BYTES: int = int(os.getenv("SESSION_MAX_BYTES", str(80 * 1024 * 1024)))  # 单会话上限，80MB
+    # 速率限制：每个窗口内的最大次数，0为不限制
+    RATE_LIMIT_WINDOW: float = float(os.getenv("RATE_LIMIT_WINDOW", "60"))
+    RATE_LIMIT_HTTP: int = int(os.getenv("RATE_LIMIT_HTTP", "300"))  # 每个客户端IP的API请求数
+    RATE_LIMIT_SKETCH_UPDATES: int = int(os.getenv("RATE_LIMIT_SKETCH_UPDATES", "600"))  # 每个会话的草图更新消息数
+    RATE_LIMIT_JOBS: int = int(os.getenv("RATE_LIMIT_JOBS", "120"))  # 每个客户端IP提交的生成任务数
+    RATE_LIMIT_SHARED: bool = os.getenv("RATE_LIMIT_SHARED", "true").lower() == "true"  # 使用共享会话存储时各 worker 合计计数
+    # 信任其 X-Forwarded-For 的反向代理地址（IP或网段，逗号分隔，* 为任意对端）；限流按代理转发的真实客户端IP计数
+    FORWARDED_ALLOW_IPS: str = os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1")
+    UPLOAD_CHUNK_SIZE: int = int(os.getenv("UPLOAD_CHUNK_SIZE", str(256 * 1024)))  # 上传文件分块写入大小
+    UPLOAD_MAX_BYTES: int = int(os.getenv("UPLOAD_MAX_BYTES", str(20 * 1024 * 1024)))  # 上传草图大小上限，20MB
+    DOWNLOAD_CHUNK_SIZE: int = int(os.getenv("DOWNLOAD_CHUNK_SIZE", str(256 * 1024)))  # 下载ComfyUI输出的分块大小
+    # 提交前将草图上传到ComfyUI的 /upload/image（按内容哈希命名），关闭则直接传本地路径（需共享目录）
+    COMFYUI_UPLOAD_SKETCHES: bool = os.getenv("COMFYUI_UPLOAD_SKETCHES", "true").lower() == "true"
+    # ComfyUI输出获取方式：auto 本地存在则直接读取，否则通过 /view 下载；local 只读共享目录；remote 总是下载
+    COMFYUI_OUTPUT_MODE: str = os.getenv("COMFYUI_OUTPUT_MODE", "auto").lower()
+    CANVAS_MAX_SIZE: int = int(os.getenv("CANVAS_MAX_SIZE", "4096"))  # 服务端画布最大边长
+    # 提交前按工作流模板的 "input" 声明缩小草图、对齐尺寸并转换像素格式
+    SKETCH_NORMALIZE: bool = os.getenv("SKETCH_NORMALIZE", "true").lower() == "true"
+    # 与上次提交的草图相比变化的格子占比低于该值时不重新生成（64x64灰度指纹），0 表示关闭。
+    # 默认约 2/4096：只跳过局限在单个格子内的变化（如点击留下的小点），跨两个格子的短笔画也会重新生成
+    SKETCH_CHANGE_THRESHOLD: float = float(os.getenv("SKETCH_CHANGE_THRESHOLD", "0.0005"))
+    SKETCH_CHANGE_PIXEL_DELTA: int = int(os.getenv("SKETCH_CHANGE_PIXEL_DELTA", "8"))  # 格子灰度差超过该值才算变化
+    # 草图更新后静默多久再提交生成：空闲时用最小窗口，队列繁忙时按预计等待时间延长，0 表示立即提交
+    SKETCH_DEBOUNCE_MIN: float = float(os.getenv("SKETCH_DEBOUNCE_MIN", "0.15"))
+    SKETCH_DEBOUNCE_MAX: float = float(os.getenv("SKETCH_DEBOUNCE_MAX", "2"))  # 也是从首次更新起的最长等待
+    SKETCH_DEBOUNCE_LOAD_FACTOR: float = float(os.getenv("SKETCH_DEBOUNCE_LOAD_FACTOR", "0.5"))  # 窗口占预计等待时间的比例
+    SKETCH_DEBOUNCE_TICK: float = float(os.getenv("SKETCH_DEBOUNCE_TICK", "0.05"))  # 防抖定时器精度（秒）
     UPLOAD_DIR: str = "uploads"
     OUTPUT_DIR: str = "output"
     STATIC_DIR: str = "static"
     WORKFLOW_DIR: str = "workflow"
+    RESULT_CACHE_ENABLED: bool = os.getenv("RESULT_CACHE_ENABLED", "true").lower() == "true"  # 相同草图直接返回缓存结果
+    RESULT_CACHE_DIR: str = os.getenv("RESULT_CACHE_DIR", "cache/results")
+    RESULT_CACHE_MAX_ENTRIES: int = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "1000"))
+    RESULT_CACHE_MAX_BYTES: int = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))  # 1GB
+    WORKFLOW_RELOAD_INTERVAL: float = float(os.getenv("WORKFLOW_RELOAD_INTERVAL", "2"))  # 工作流模板变更检查间隔
 
 config = Config()
 
@@ -47,8 +134,11 @@ def setup_logging():
     log_level = logging.DEBUG if config.ENV == Environment.DEVELOPMENT else logging.INFO
     logging.basicConfig(
         level=log_level,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+        format='%(asctime)s - %(name)s - %(levelname)s - [%(trace_id)s] %(message)s'
     )
+    # 日志中附带当前草图的 trace_id
+    for handler in logging.getLogger().handlers:
+        handler.addFilter(TraceContextFilter())
     return logging.getLogger(__name__)
 
 logger = setup_logging()
@@ -64,83 +154,285 @@ class WebSocketMessage(BaseModel):
     sketch_data: Optional[str] = None
     style: Optional[str] = None
     image_data: Optional[str] = None
+    binary_results: Optional[bool] = None
+
+@functools.lru_cache(maxsize=256)
+def style_config_for(style_name: str) -> StyleConfig:
+    """同名风格共用一个配置对象，会话只保存引用"""
+    return StyleConfig(style_name=style_name)
 
-@dataclass
 class Session:
-    """会话状态"""
-    session_id: str
-    sketch_path: Optional[str] = None
-    result_path: Optional[str] = None
-    style_config: Optional[StyleConfig] = None
-    is_processing: bool = False
-    last_update: float = Field(default_factory=time.time)
-    websocket: Optional[WebSocket] = None
-    needs_reprocess: bool = False
-    last_heartbeat: float = Field(default_factory=time.time)
-    is_alive: bool = True
+    """会话状态
+
+    使用 ``__slots__`` 而非实例字典，风格配置按名称共用，单个会话的固定开销约为原来的三分之一；
+    草图、画布等大块数据的占用另由 ``AppState.memory`` 记账。
+    """
+    __slots__ = (
+        "session_id", "sketch_path", "result_path", "style_config", "is_processing", "last_update",
+        "websocket", "needs_reprocess", "processing_sketch_path", "prompt_id", "binary_results",
+        "sketch_seq", "processing_seq", "comfyui_backend", "canvas", "sketch_received_at", "trace",
+        "last_heartbeat", "is_alive", "client_host", "sent_fingerprint", "checked_fingerprint", "debounce_window", "debounce_since",
+    )
+
+    def __init__(
+        self,
+        session_id: str,
+        sketch_path: Optional[str] = None,
+        result_path: Optional[str] = None,
+        style_config: Optional[StyleConfig] = None,
+        last_update: Optional[float] = None,
+        websocket: Optional[WebSocket] = None,
+        comfyui_backend: Optional[str] = None,
+    ):
+        now = time.time()
+        self.session_id = session_id
+        self.sketch_path = sketch_path
+        self.result_path = result_path
+        self.style_config = style_config
+        self.is_processing = False
+        self.last_update = now if last_update is None else last_update
+        self.websocket = websocket
+        self.needs_reprocess = False
+        self.processing_sketch_path: Optional[str] = None
+        self.prompt_id: Optional[str] = None
+        self.binary_results = False  # 以二进制帧推送结果图像
+        self.sketch_seq = 0  # 最新草图帧的序号
+        self.processing_seq = 0  # 正在处理的草图帧序号
+        self.comfyui_backend = comfyui_backend  # 上次处理该会话的ComfyUI节点，优先沿用以保持模型缓存
+        self.canvas: Optional[SketchCanvas] = None  # 增量更新模式下的服务端画布
+        self.sketch_received_at = 0.0  # 最新草图到达时间（monotonic），用于端到端延迟统计
+        self.trace: Optional[Trace] = None  # 等待处理的最新草图的 trace
+        self.last_heartbeat = now
+        self.is_alive = True
+        self.client_host: Optional[str] = None  # 最近一次请求的客户端IP，用于按客户端限制生成任务
+        # 当前结果对应的 (风格, 草图指纹)，用于跳过变化过小的草图
+        self.sent_fingerprint: Optional[Tuple[str, SketchFingerprint]] = None
+        # 最近一次变化检测时计算的 (草图路径, 指纹)，生成成功后记为 sent_fingerprint
+        self.checked_fingerprint: Optional[Tuple[str, SketchFingerprint]] = None
+        self.debounce_window = 0.0  # 最近一次提交使用的防抖窗口
+        self.debounce_since = 0.0  # 当前防抖等待开始的时间（monotonic）
+
+def session_from_record(record: SessionRecord) -> Session:
+    """由共享存储中的记录创建本地会话"""
+    return Session(
+        session_id=record.session_id,
+        sketch_path=record.sketch_path,
+        result_path=record.result_path,
+        style_config=style_config_for(record.style_name),
+        last_update=record.last_update or time.time(),
+        comfyui_backend=record.comfyui_backend,
+    )
 
 # 应用状态
 class AppState:
-    """应用状态管理"""
-    def __init__(self):
+    """应用状态管理
+
+    ``active_sessions`` 保存本 worker 上的会话（含 WebSocket 等本地状态），
+    会话的共享部分保存在 ``store`` 中，其他 worker 创建的会话在首次访问时载入。
+    会话过期和心跳超时由同一个时间轮 ``timers`` 按到期时间触发，不再定期扫描全部会话。
+    各会话的草图和画布占用记入 ``memory``，超出全局预算时优先淘汰最久未活动的空闲会话。
+    草图防抖需要亚秒级精度，使用单独的时间轮 ``debounce_timers``。
+    """
+    def __init__(self, store: Optional[SessionStore] = None, worker_id: Optional[str] = None):
         self.active_sessions: Dict[str, Session] = {}
+        self.store = store or MemorySessionStore()
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
         self.executor = ThreadPoolExecutor(max_workers=config.MAX_WORKERS)
+        self.timers = TimerWheel(tick=config.TIMER_TICK)
+        self.debounce_timers = TimerWheel(tick=config.SKETCH_DEBOUNCE_TICK)
+        self.memory = MemoryBudget(config.SESSION_MEMORY_BUDGET, config.SESSION_MAX_BYTES)
         self._lock = asyncio.Lock()
 
     async def create_session(self, session_id: str) -> Optional[Session]:
         """创建新会话，带并发控制"""
         async with self._lock:
-            if len(self.active_sessions) >= config.MAX_ACTIVE_SESSIONS:
+            session = Session(session_id=session_id)
+            record = SessionRecord(session_id=session_id, last_update=session.last_update)
+            if not await self.store.create(record, config.MAX_ACTIVE_SESSIONS):
                 logger.warning(f"达到最大会话数限制: {config.MAX_ACTIVE_SESSIONS}")
                 return None
-            session = Session(session_id=session_id)
             self.active_sessions[session_id] = session
+            self.watch_idle(session)
             return session
 
     def get_session(self, session_id: str) -> Optional[Session]:
         """获取会话"""
         return self.active_sessions.get(session_id)
 
+    async def load_session(self, session_id: str) -> Optional[Session]:
+        """获取会话，本 worker 没有时从共享存储载入"""
+        session = self.active_sessions.get(session_id)
+        if session is not None:
+            return session
+        record = await self.store.get(session_id)
+        if record is None:
+            return None
+        # 等待期间可能已被并发请求载入
+        if session_id in self.active_sessions:
+            return self.active_sessions[session_id]
+        session = self.active_sessions[session_id] = session_from_record(record)
+        self.watch_idle(session)
+        return session
+
     def remove_session(self, session_id: str):
         """移除会话"""
         if session_id in self.active_sessions:
             del self.active_sessions[session_id]
+        self.timers.cancel(("idle", session_id))
+        self.timers.cancel(("heartbeat", session_id))
+        self.debounce_timers.cancel(("debounce", session_id))
+        self.memory.release(session_id)
+
+    async def reserve_memory(self, session: Session, kind: str, nbytes: int):
+        """将会话该类别的内存占用记为 ``nbytes``
+
+        超出全局预算时先淘汰空闲会话腾出空间，仍不足或超出单会话上限时抛出 MemoryBudgetExceeded。
+        """
+        session_id = session.session_id
+        self.memory.check(session_id, kind, nbytes)
+        shortfall = self.memory.shortfall(session_id, kind, nbytes)
+        if shortfall:
+            await self.evict_idle_sessions(shortfall, exclude=session_id)
+        self.memory.charge(session_id, kind, nbytes)
+
+    async def evict_idle_sessions(self, nbytes: int, exclude: Optional[str] = None) -> int:
+        """按最久未活动的顺序释放没有连接、不在处理中的会话，直到腾出 ``nbytes``，返回释放的字节数"""
+        candidates = sorted(
+            (
+                session for session in self.active_sessions.values()
+                if session.session_id != exclude and session.session_id in self.memory
+                and not session.websocket and not session.is_processing
+            ),
+            key=lambda session: session.last_update
+        )
+        freed = 0
+        for session in candidates:
+            if freed >= nbytes:
+                break
+            freed += self.memory.usage(session.session_id)
+            logger.warning(f"会话内存超出预算，淘汰空闲会话: {session.session_id}")
+            await self.release_session(session, force=True)
+        return freed
+
+    def watch_idle(self, session: Session):
+        """在会话空闲超时的时刻检查是否过期"""
+        remaining = session.last_update + config.SESSION_TIMEOUT - time.time()
+        session_id = session.session_id
+        self.timers.schedule_in(("idle", session_id), remaining, lambda: spawn(self.expire_session(session_id)))
+
+    async def expire_session(self, session_id: str):
+        """空闲定时器到期：期间有活动则按最新活动时间重新计时，否则清理会话"""
+        session = self.active_sessions.get(session_id)
+        if session is None:
+            return
+        if time.time() - session.last_update <= config.SESSION_TIMEOUT:
+            self.watch_idle(session)
+            return
+        await self.release_session(session)
 
     async def cleanup_expired_sessions(self):
-        """清理过期会话，带资源释放"""
+        """立即清理所有已过期的会话（资源紧张时调用，平时由定时器逐个清理）"""
         current_time = time.time()
         expired_sessions = [
-            session_id for session_id, session in self.active_sessions.items()
+            session for session in self.active_sessions.values()
             if current_time - session.last_update > config.SESSION_TIMEOUT
         ]
-        
-        for session_id in expired_sessions:
-            session = self.active_sessions.get(session_id)
-            if session:
-                # 清理会话资源
-                if session.websocket:
-                    try:
-                        await session.websocket.close()
-                    except Exception as e:
-                        logger.error(f"关闭WebSocket连接失败: {session_id}, {str(e)}")
-                
-                # 清理临时文件
-                if session.sketch_path and os.path.exists(session.sketch_path):
-                    try:
-                        os.remove(session.sketch_path)
-                    except Exception as e:
-                        logger.error(f"删除草图文件失败: {session.sketch_path}, {str(e)}")
-                
-                if session.result_path and os.path.exists(session.result_path):
-                    try:
-                        os.remove(session.result_path)
-                    except Exception as e:
-                        logger.error(f"删除结果文件失败: {session.result_path}, {str(e)}")
-                
+        for session in expired_sessions:
+            await self.release_session(session)
+
+    async def release_session(self, session: Session, force: bool = False):
+        """释放过期会话的资源，``force`` 为True时不论是否过期（内存不足时的淘汰）"""
+        session_id = session.session_id
+        current_time = time.time()
+        # 会话仍在其他 worker 上活动时只丢弃本地副本
+        record = await self.store.get(session_id)
+        if record is not None and not session.websocket:
+            if force:
+                shared = record.owner is not None and record.owner != self.worker_id
+            else:
+                shared = current_time - record.last_update <= config.SESSION_TIMEOUT
+            if shared:
                 self.remove_session(session_id)
-                logger.info(f"已清理过期会话: {session_id}")
+                return
+        
+        # 清理会话资源
+        if session.websocket:
+            try:
+                await session.websocket.close()
+            except Exception as e:
+                logger.error(f"关闭WebSocket连接失败: {session_id}, {str(e)}")
+        
+        # 清理临时文件
+        if session.sketch_path and os.path.exists(session.sketch_path):
+            try:
+                os.remove(session.sketch_path)
+            except Exception as e:
+                logger.error(f"删除草图文件失败: {session.sketch_path}, {str(e)}")
+        
+        # 缓存中的结果由结果缓存负责淘汰
+        if (session.result_path and os.path.exists(session.result_path)
+                and not result_cache.owns(session.result_path)):
+            try:
+                os.remove(session.result_path)
+            except Exception as e:
+                logger.error(f"删除结果文件失败: {session.result_path}, {str(e)}")
+        
+        self.remove_session(session_id)
+        await self.store.delete(session_id)
+        logger.info(f"已清理过期会话: {session_id}")
 
-state = AppState()
+state = AppState(create_session_store(
+    config.SESSION_STORE,
+    url=config.REDIS_URL,
+    prefix=config.SESSION_STORE_PREFIX,
+    session_ttl=config.SESSION_TIMEOUT,
+))
+comfyui_client = ComfyUIClient(
+    config.COMFYUI_SERVER,
+    pool_size=config.COMFYUI_POOL_SIZE,
+    pool_per_host=config.COMFYUI_POOL_PER_HOST,
+    keepalive_timeout=config.COMFYUI_KEEPALIVE_TIMEOUT,
+    connect_timeout=config.COMFYUI_CONNECT_TIMEOUT,
+    read_timeout=config.COMFYUI_READ_TIMEOUT,
+)
+comfyui_pool = ComfyUIBackendPool(
+    config.COMFYUI_SERVERS,
+    health_interval=config.COMFYUI_HEALTH_INTERVAL,
+    failure_threshold=config.COMFYUI_FAILURE_THRESHOLD,
+    eject_seconds=config.COMFYUI_EJECT_SECONDS,
+)
+workflow_templates = WorkflowTemplateCache(
+    config.WORKFLOW_DIR,
+    check_interval=config.WORKFLOW_RELOAD_INTERVAL,
+)
+result_cache = ResultCache(
+    config.RESULT_CACHE_DIR,
+    max_entries=config.RESULT_CACHE_MAX_ENTRIES,
+    max_bytes=config.RESULT_CACHE_MAX_BYTES,
+)
+job_scheduler = JobScheduler(
+    max_in_flight=config.MAX_PROMPTS_IN_FLIGHT,
+    max_queue=config.MAX_QUEUED_JOBS,
+    # 共享会话存储时，所有 worker 合计的在途prompt数受同一上限约束
+    limiter=SlotLimiter(state.store, "comfyui", config.MAX_PROMPTS_IN_FLIGHT)
+    if config.SESSION_STORE != "memory" else None,
+)
+# 速率限制计数与会话存储放在一起，共享存储时所有 worker 合计
+rate_limit_store = state.store if config.RATE_LIMIT_SHARED else MemorySessionStore()
+http_rate_limiter = RateLimiter(rate_limit_store, "http", config.RATE_LIMIT_HTTP, config.RATE_LIMIT_WINDOW)
+sketch_rate_limiter = RateLimiter(
+    rate_limit_store, "sketch_update", config.RATE_LIMIT_SKETCH_UPDATES, config.RATE_LIMIT_WINDOW
+)
+job_rate_limiter = RateLimiter(rate_limit_store, "jobs", config.RATE_LIMIT_JOBS, config.RATE_LIMIT_WINDOW)
+sketch_debounce = AdaptiveDebounce(
+    min_window=config.SKETCH_DEBOUNCE_MIN,
+    max_window=config.SKETCH_DEBOUNCE_MAX,
+    load_factor=config.SKETCH_DEBOUNCE_LOAD_FACTOR,
+)
+# 采集时读取当前会话数（state 可能在测试中被替换，因此不直接绑定对象）
+ACTIVE_SESSIONS.set_function(lambda: len(state.active_sessions))
+SESSION_MEMORY_BYTES.set_function(lambda: state.memory.total)
+SKETCH_DEBOUNCE_WINDOW.set_function(lambda: sketch_debounce.last_window)
 
 # 工具函数
 def create_required_directories():
@@ -153,17 +445,82 @@ def image_to_base64(image_path: str) -> str:
     with open(image_path, "rb") as img_file:
         return base64.b64encode(img_file.read()).decode('utf-8')
 
+# 分块解码的块大小，需为4的倍数；b64decode 执行期间持有GIL，分块后事件循环线程可及时获得GIL
+BASE64_CHUNK_SIZE = 256 * 1024
+
 def base64_to_image(base64_string: str, output_path: str) -> str:
-    """将base64转换为图像"""
-    img_data = base64.b64decode(base64_string)
+    """将base64转换为图像（分块解码写入）"""
     with open(output_path, "wb") as f:
-        f.write(img_data)
+        for start in range(0, len(base64_string), BASE64_CHUNK_SIZE):
+            f.write(base64.b64decode(base64_string[start:start + BASE64_CHUNK_SIZE]))
     return output_path
 
+def strip_data_url(data: str) -> str:
+    """去掉 data URL 前缀，只保留base64内容"""
+    if data.startswith("data:"):
+        return data.split(",", 1)[1]
+    return data
+
+def write_bytes_to_file(data: bytes, output_path: str) -> str:
+    """将二进制数据写入文件"""
+    with open(output_path, "wb") as f:
+        f.write(data)
+    return output_path
+
+def read_result_frame(result_path: str, seq: int) -> bytes:
+    """读取结果图像并编码为二进制帧"""
+    with open(result_path, "rb") as f:
+        return encode_frame(FRAME_RESULT_IMAGE, seq, f.read())
+
+# 定时器回调等创建的后台任务，保持引用直到完成
+_background_tasks = set()
+
+def spawn(coro) -> asyncio.Task:
+    """创建后台任务"""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+async def run_blocking(func, *args, **kwargs):
+    """在线程池中执行阻塞操作（文件读写、解码、哈希），避免阻塞事件循环"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(state.executor, functools.partial(func, *args, **kwargs))
+
+async def save_upload_file(file: UploadFile, output_path: str, head: bytes = b"", max_bytes: int = 0) -> int:
+    """分块将上传文件写入磁盘，返回写入字节数
+
+    ``head`` 为调用方已读取（用于校验文件头）的开头部分；超过 ``max_bytes`` 时删除已写入的部分并返回413。
+    """
+    size = 0
+    try:
+        async with aiofiles.open(output_path, "wb") as buffer:
+            chunk = head or await file.read(config.UPLOAD_CHUNK_SIZE)
+            while chunk:
+                size += len(chunk)
+                if max_bytes and size > max_bytes:
+                    raise HTTPException(status_code=413, detail="File too large")
+                await buffer.write(chunk)
+                chunk = await file.read(config.UPLOAD_CHUNK_SIZE)
+    except HTTPException:
+        remove_file(output_path)
+        raise
+    return size
+
+def remove_file(path: str):
+    """删除文件，失败时只记录日志"""
+    try:
+        if os.path.exists(path):
+            os.remove(path)
+    except Exception as e:
+        logger.error(f"删除文件失败: {path}, {str(e)}")
+
 # ComfyUI 相关函数
-async def send_workflow_to_comfyui(session: aiohttp.ClientSession, workflow: dict) -> Optional[str]:
-    """发送工作流到ComfyUI并获取prompt_id"""
-    async with session.post(f"{config.COMFYUI_SERVER}/api/prompt", json=workflow) as response:
+async def send_workflow_to_comfyui(session: aiohttp.ClientSession, backend: ComfyUIBackend, workflow: dict) -> Optional[str]:
+    """发送工作流到ComfyUI节点并获取prompt_id"""
+    # 携带 client_id，ComfyUI 才会把该 prompt 的事件推送到共享事件流
+    payload = {**workflow, "client_id": backend.events.client_id}
+    async with session.post(f"{backend.url}/api/prompt", json=payload) as response:
         if response.status != 200:
             error_text = await response.text()
             logger.error(f"发送工作流到 ComfyUI 失败: {error_text}")
@@ -178,6 +535,38 @@ async def send_workflow_to_comfyui(session: aiohttp.ClientSession, workflow: dic
         logger.info(f"从 ComfyUI 获取到 prompt_id: {prompt_id}")
         return prompt_id
 
+def comfyui_image_name(sketch_path: str, sketch_digest: str) -> str:
+    """按内容哈希命名上传到ComfyUI的草图，相同内容总是得到相同名称"""
+    extension = os.path.splitext(sketch_path)[1] or ".png"
+    return f"sketch_{sketch_digest[:32]}{extension}"
+
+async def upload_sketch_to_comfyui(
+    session: aiohttp.ClientSession,
+    backend: ComfyUIBackend,
+    sketch_path: str,
+    image_name: str
+) -> bool:
+    """将草图上传到ComfyUI节点的输入目录，节点上已有同名图像时跳过"""
+    if backend.has_upload(image_name):
+        return True
+    async with aiofiles.open(sketch_path, "rb") as f:
+        data = await f.read()
+    form = aiohttp.FormData()
+    form.add_field("image", data, filename=image_name, content_type="application/octet-stream")
+    form.add_field("type", "input")
+    form.add_field("overwrite", "true")
+    async with session.post(f"{backend.url}/api/upload/image", data=form) as response:
+        if response.status != 200:
+            error_text = await response.text()
+            logger.error(f"上传草图到 ComfyUI 失败: {error_text}")
+            return False
+        uploaded = await response.json()
+    if uploaded.get("name") != image_name or uploaded.get("subfolder"):
+        logger.error(f"ComfyUI 保存的草图名称不一致: {uploaded}")
+        return False
+    backend.remember_upload(image_name)
+    return True
+
 def calculate_progress(messages: List) -> float:
     """计算处理进度"""
     if not messages:
@@ -186,35 +575,135 @@ def calculate_progress(messages: List) -> float:
     completed_messages = sum(1 for msg in messages if msg[0] in ['execution_cached', 'execution_success'])
     return completed_messages / total_messages if total_messages > 0 else 0
 
-async def wait_for_comfyui_processing(session: aiohttp.ClientSession, prompt_id: str, session_id: str) -> bool:
-    """等待ComfyUI处理完成并发送进度更新"""
+async def send_progress(session_id: str, progress: float):
+    """向客户端发送进度更新"""
+    if session := state.get_session(session_id):
+        if session.websocket:
+            if config.ENV == Environment.DEVELOPMENT:
+                logger.debug(f"处理进度: {progress * 100:.1f}%")
+            
+            await session.websocket.send_json({
+                "status": "processing",
+                "progress": progress
+            })
+
+def observe_comfyui_timings(submitted_at: float, started_at: Optional[float] = None, execution: Optional[float] = None):
+    """记录prompt的排队等待和执行时间"""
+    total = time.monotonic() - submitted_at
+    # 提交到完成的总耗时，用于调整草图防抖窗口
+    sketch_debounce.record_latency(total)
+    if execution is None and started_at is not None:
+        execution = time.monotonic() - started_at
+    if execution is None:
+        COMFYUI_QUEUE_WAIT_SECONDS.observe(total)
+        return
+    COMFYUI_EXECUTION_SECONDS.observe(execution)
+    COMFYUI_QUEUE_WAIT_SECONDS.observe(max(0.0, total - execution))
+
+def history_execution_time(messages: List) -> Optional[float]:
+    """根据历史记录中的事件时间戳（毫秒，ComfyUI服务器时钟）计算执行时间"""
+    timestamps = {name: data.get("timestamp") for name, data in messages if isinstance(data, dict)}
+    start, end = timestamps.get("execution_start"), timestamps.get("execution_success")
+    if start is None or end is None:
+        return None
+    return max(0.0, (end - start) / 1000)
+
+async def check_comfyui_history(
+    session: aiohttp.ClientSession,
+    backend: ComfyUIBackend,
+    prompt_id: str,
+    session_id: str,
+    submitted_at: Optional[float] = None
+) -> Optional[bool]:
+    """查询单个prompt的历史记录，未完成时返回None"""
+    async with session.get(f"{backend.url}/api/history/{prompt_id}") as history_response:
+        history_data = await history_response.json()
+        queue_data = history_data.get(prompt_id, {})
+        status = queue_data.get('status', {})
+        
+        if status.get('status_str') == 'success' and status.get('completed'):
+            logger.info(f"ComfyUI 处理完成，prompt_id: {prompt_id}")
+            if submitted_at is not None:
+                observe_comfyui_timings(submitted_at, execution=history_execution_time(status.get('messages', [])))
+            return True
+        elif status.get('status_str') == 'error':
+            error_msg = status.get('error')
+            logger.error(f"ComfyUI 处理出错: {error_msg}")
+            return False
+        
+        if status:
+            await send_progress(session_id, calculate_progress(status.get('messages', [])))
+        return None
+
+async def poll_comfyui_history(
+    session: aiohttp.ClientSession,
+    backend: ComfyUIBackend,
+    prompt_id: str,
+    session_id: str,
+    submitted_at: Optional[float] = None
+) -> bool:
+    """轮询历史记录等待处理完成（事件流不可用时的回退方案）"""
     while True:
-        async with session.get(f"{config.COMFYUI_SERVER}/api/history") as history_response:
-            history_data = await history_response.json()
-            queue_data = history_data.get(prompt_id, {})
-            status = queue_data.get('status', {})
+        result = await check_comfyui_history(session, backend, prompt_id, session_id, submitted_at)
+        if result is not None:
+            return result
+        await asyncio.sleep(config.COMFYUI_POLL_INTERVAL)
+
+async def wait_for_comfyui_events(
+    session: aiohttp.ClientSession,
+    backend: ComfyUIBackend,
+    prompt_id: str,
+    session_id: str,
+    submitted_at: Optional[float] = None
+) -> Optional[bool]:
+    """通过事件流等待处理完成，事件流中断时返回None"""
+    queue = backend.events.subscribe(prompt_id)
+    started_at = None
+    try:
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=config.COMFYUI_EVENT_TIMEOUT)
+            except asyncio.TimeoutError:
+                # 排队期间没有事件属正常情况，核对一次历史记录以防事件丢失
+                result = await check_comfyui_history(session, backend, prompt_id, session_id, submitted_at)
+                if result is not None:
+                    return result
+                continue
             
-            if status.get('status_str') == 'success' and status.get('completed'):
+            if event["type"] == LISTENER_DISCONNECTED:
+                return None
+            if event["type"] == "execution_start":
+                started_at = time.monotonic()
+            if is_success_event(event):
                 logger.info(f"ComfyUI 处理完成，prompt_id: {prompt_id}")
+                if submitted_at is not None:
+                    observe_comfyui_timings(submitted_at, started_at)
                 return True
-            elif status.get('status_str') == 'error':
-                error_msg = status.get('error')
-                logger.error(f"ComfyUI 处理出错: {error_msg}")
+            if is_failure_event(event):
+                logger.error(f"ComfyUI 处理出错: {event['data'].get('exception_message', event['type'])}")
                 return False
-            
-            # 发送进度更新
-            if session := state.get_session(session_id):
-                if session.websocket:
-                    progress = calculate_progress(status.get('messages', []))
-                    if config.ENV == Environment.DEVELOPMENT:
-                        logger.debug(f"处理进度: {progress * 100:.1f}%")
-                    
-                    await session.websocket.send_json({
-                        "status": "processing",
-                        "progress": progress
-                    })
-            
-            await asyncio.sleep(0.5)
+            if event["type"] == "progress":
+                data = event["data"]
+                if data.get("max"):
+                    await send_progress(session_id, data.get("value", 0) / data["max"])
+    finally:
+        backend.events.unsubscribe(prompt_id)
+
+async def wait_for_comfyui_processing(
+    session: aiohttp.ClientSession,
+    backend: ComfyUIBackend,
+    prompt_id: str,
+    session_id: str,
+    submitted_at: Optional[float] = None
+) -> bool:
+    """等待ComfyUI处理完成并发送进度更新"""
+    if config.COMFYUI_WS_ENABLED and backend.events.connected:
+        result = await wait_for_comfyui_events(session, backend, prompt_id, session_id, submitted_at)
+        if result is not None:
+            return result
+        logger.warning(f"ComfyUI 事件流不可用，回退到轮询: {prompt_id}")
+    
+    return await poll_comfyui_history(session, backend, prompt_id, session_id, submitted_at)
 
 def find_image_output(outputs: Dict) -> Optional[Dict]:
     """在输出中查找图像节点"""
@@ -223,14 +712,19 @@ def find_image_output(outputs: Dict) -> Optional[Dict]:
             return node_output['images'][0]
     return None
 
-def construct_output_path(image_output: Dict) -> Optional[str]:
-    """构建输出文件路径"""
+def local_output_path(image_output: Dict) -> str:
+    """ComfyUI输出在共享输出目录中的路径"""
     image_filename = image_output['filename']
     image_subfolder = image_output.get('subfolder', '')
     
     output_path = os.path.join(config.OUTPUT_DIR, image_filename)
     if image_subfolder:
         output_path = os.path.join(config.OUTPUT_DIR, image_subfolder, image_filename)
+    return output_path
+
+def construct_output_path(image_output: Dict) -> Optional[str]:
+    """构建输出文件路径"""
+    output_path = local_output_path(image_output)
     
     if not os.path.exists(output_path):
         logger.error(f"输出文件不存在: {output_path}")
@@ -238,9 +732,56 @@ def construct_output_path(image_output: Dict) -> Optional[str]:
     
     return output_path
 
-async def get_comfyui_result(session: aiohttp.ClientSession, prompt_id: str) -> Optional[str]:
-    """获取ComfyUI处理结果"""
-    async with session.get(f"{config.COMFYUI_SERVER}/api/history/{prompt_id}") as history_response:
+async def download_comfyui_output(
+    session: aiohttp.ClientSession,
+    backend: ComfyUIBackend,
+    prompt_id: str,
+    image_output: Dict
+) -> Optional[str]:
+    """通过 /view 分块下载ComfyUI输出到本地输出目录，不在内存中缓存整个文件"""
+    params = {
+        "filename": image_output['filename'],
+        "subfolder": image_output.get('subfolder', ''),
+        "type": image_output.get('type', 'output'),
+    }
+    # 不同节点的输出文件名可能相同，以 prompt_id 区分
+    output_path = os.path.join(config.OUTPUT_DIR, f"{prompt_id}_{os.path.basename(params['filename'])}")
+    temp_path = f"{output_path}.part"
+    try:
+        async with session.get(f"{backend.url}/api/view", params=params) as response:
+            if response.status != 200:
+                logger.error(f"下载输出文件失败: {params['filename']}, HTTP {response.status}")
+                return None
+            async with aiofiles.open(temp_path, "wb") as f:
+                async for chunk in response.content.iter_chunked(config.DOWNLOAD_CHUNK_SIZE):
+                    await f.write(chunk)
+        # 写完后再替换，读取方不会看到不完整的文件
+        os.replace(temp_path, output_path)
+    except Exception as e:
+        logger.error(f"下载输出文件失败: {params['filename']}, {str(e)}")
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return None
+    return output_path
+
+async def fetch_comfyui_output(
+    session: aiohttp.ClientSession,
+    backend: ComfyUIBackend,
+    prompt_id: str,
+    image_output: Dict
+) -> Optional[str]:
+    """获取输出文件：共享目录中存在时直接使用，否则从执行节点下载"""
+    if config.COMFYUI_OUTPUT_MODE == "local":
+        return construct_output_path(image_output)
+    if config.COMFYUI_OUTPUT_MODE != "remote":
+        output_path = local_output_path(image_output)
+        if os.path.exists(output_path):
+            return output_path
+    return await download_comfyui_output(session, backend, prompt_id, image_output)
+
+async def get_comfyui_result(session: aiohttp.ClientSession, backend: ComfyUIBackend, prompt_id: str) -> Optional[str]:
+    """从执行该prompt的节点获取处理结果"""
+    async with session.get(f"{backend.url}/api/history/{prompt_id}") as history_response:
         history_data = await history_response.json()
         
         if config.ENV == Environment.DEVELOPMENT:
@@ -260,47 +801,164 @@ async def get_comfyui_result(session: aiohttp.ClientSession, prompt_id: str) ->
         if not image_output:
             logger.error("未找到图像输出")
             return None
-        
-        return construct_output_path(image_output)
-
-def create_comfyui_workflow(sketch_path: str, style_config: StyleConfig) -> dict:
-    """根据风格配置创建ComfyUI工作流"""
-    style_file = Path(config.WORKFLOW_DIR) / f"{style_config.style_name}.json"
-    
-    if not style_file.exists():
-        style_file = Path(config.WORKFLOW_DIR) / "realistic.json"
-    
-    with open(style_file, 'r') as f:
-        workflow = json.load(f)
-    
-    for node_id, node in workflow["prompt"].items():
-        if node.get("class_type") == "LoadImage" and "inputs" in node and "image" in node["inputs"]:
-            if node["inputs"]["image"] == "PLACEHOLDER_PATH":
-                node["inputs"]["image"] = sketch_path
     
-    return workflow
+    return await fetch_comfyui_output(session, backend, prompt_id, image_output)
+
+async def cancel_comfyui_prompt(prompt_id: str, backend_url: Optional[str] = None):
+    """取消过时的prompt：排队中则从队列删除，执行中则中断"""
+    backend = comfyui_pool.get(backend_url)
+    if backend is None:
+        return
+    try:
+        session = comfyui_client.session
+        async with session.post(f"{backend.url}/api/queue", json={"delete": [prompt_id]}) as response:
+            await response.read()
+        async with session.post(f"{backend.url}/api/interrupt", json={"prompt_id": prompt_id}) as response:
+            await response.read()
+        logger.info(f"已取消过时的 prompt: {prompt_id}")
+    except Exception as e:
+        logger.error(f"取消 prompt 失败: {prompt_id}, {str(e)}")
+
+def create_comfyui_workflow(image: str, style_config: StyleConfig) -> dict:
+    """根据风格配置创建ComfyUI工作流（基于缓存的模板，只复制被替换的节点）
+
+    ``image`` 为已上传到ComfyUI的图像名称，或ComfyUI可访问的本地路径。
+    """
+    return workflow_templates.build(style_config.style_name, image=image)
+
+def get_result_cache_key(sketch_digest: str, style_config: StyleConfig) -> Optional[str]:
+    """计算结果缓存键：草图内容 + 风格 + 解析后的工作流模板"""
+    template = workflow_templates.get(style_config.style_name)
+    if template is None:
+        return None
+    return make_result_key(sketch_digest, template.name, template.digest)
+
+async def submit_to_backend(
+    session: aiohttp.ClientSession,
+    workflow: dict,
+    preferred: Optional[str] = None,
+    upload: Optional[Tuple[str, str]] = None
+) -> Optional[Tuple[ComfyUIBackend, str]]:
+    """选择节点提交工作流，失败时换下一个节点重试，返回 (节点, prompt_id)
+
+    ``upload`` 为 (本地草图路径, 上传名称) 时，提交前先确保草图已上传到该节点。
+    """
+    tried: List[ComfyUIBackend] = []
+    while (backend := comfyui_pool.select(preferred, exclude=tried)) is not None:
+        tried.append(backend)
+        prompt_id = None
+        try:
+            if upload is None or await upload_sketch_to_comfyui(session, backend, *upload):
+                prompt_id = await send_workflow_to_comfyui(session, backend, workflow)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error(f"提交到 ComfyUI 节点失败: {backend.url}, {str(e)}")
+        if prompt_id:
+            comfyui_pool.mark_success(backend)
+            return backend, prompt_id
+        if upload is not None:
+            # 提交失败可能是节点上的输入图像已被清理
+            backend.forget_upload(upload[1])
+        comfyui_pool.mark_failure(backend)
+    return None
+
+def normalized_sketch_path(sketch_path: str) -> str:
+    """规范化后的草图保存位置（与原草图同目录）"""
+    return f"{os.path.splitext(sketch_path)[0]}.normalized.png"
+
+async def prepare_sketch(sketch_path: str, style_config: StyleConfig) -> str:
+    """按工作流模板声明的输入要求规范化草图，返回实际提交的文件路径
+
+    模板没有声明或未开启规范化时直接返回原草图。
+    """
+    template = workflow_templates.get(style_config.style_name)
+    spec = template.input_spec if template is not None else None
+    if spec is None or not config.SKETCH_NORMALIZE:
+        return sketch_path
+    output_path = normalized_sketch_path(sketch_path)
+    with tracer.span("normalize") as span, SKETCH_DECODE_SECONDS.labels("normalize").time():
+        size = await run_blocking(
+            normalize_sketch, sketch_path, output_path,
+            spec.width, spec.height, spec.multiple, spec.mode, spec.upscale
+        )
+        if span is not None:
+            span.attributes["size"] = f"{size[0]}x{size[1]}"
+    return output_path
+
+def cached_result_path(session_id: str) -> str:
+    """会话命中结果缓存时的结果文件（每个会话一个，下次命中时覆盖）"""
+    return os.path.join(config.OUTPUT_DIR, f"{session_id}_cached.png")
 
 async def send_to_comfyui(sketch_path: str, style_config: StyleConfig, session_id: str) -> Optional[str]:
     """发送草图到ComfyUI并获取生成的图像"""
+    submit_path = sketch_path
     try:
         logger.info(f"开始处理会话 {session_id} 的草图: {sketch_path}")
-        workflow = create_comfyui_workflow(sketch_path, style_config)
+        cache_key = None
+        sketch_digest = None
+        if config.RESULT_CACHE_ENABLED or config.COMFYUI_UPLOAD_SKETCHES:
+            sketch_digest = await run_blocking(hash_file, sketch_path)
+        if config.RESULT_CACHE_ENABLED:
+            with tracer.span("cache_lookup") as span:
+                cache_key = get_result_cache_key(sketch_digest, style_config)
+                # 每个会话持有自己的链接，缓存之后淘汰该条目时结果仍可访问
+                cached_path = await run_blocking(
+                    result_cache.checkout, cache_key, cached_result_path(session_id)
+                ) if cache_key else None
+                if span is not None:
+                    span.attributes["hit"] = cached_path is not None
+            if cached_path:
+                logger.info(f"命中结果缓存: {session_id}, {cache_key}")
+                return cached_path
+        
+        # 缓存键按原草图计算，命中缓存时不需要规范化
+        submit_path = await prepare_sketch(sketch_path, style_config)
+        upload = None
+        image_ref = submit_path
+        if config.COMFYUI_UPLOAD_SKETCHES:
+            if submit_path != sketch_path:
+                sketch_digest = await run_blocking(hash_file, submit_path)
+            image_ref = comfyui_image_name(submit_path, sketch_digest)
+            upload = (submit_path, image_ref)
+        
+        with tracer.span("workflow_build"), WORKFLOW_BUILD_SECONDS.time():
+            workflow = create_comfyui_workflow(image_ref, style_config)
         logger.info(f"已创建工作流，使用风格: {style_config.style_name}")
         
-        async with aiohttp.ClientSession() as session:
-            prompt_id = await send_workflow_to_comfyui(session, workflow)
-            if not prompt_id:
-                return None
-            
-            success = await wait_for_comfyui_processing(session, prompt_id, session_id)
+        session = comfyui_client.session
+        app_session = state.get_session(session_id)
+        with tracer.span("comfyui_submit") as span, COMFYUI_SUBMIT_SECONDS.time():
+            submitted = await submit_to_backend(
+                session, workflow, app_session.comfyui_backend if app_session else None, upload
+            )
+        if not submitted:
+            return None
+        backend, prompt_id = submitted
+        submitted_at = time.monotonic()
+        if span is not None:
+            span.attributes["backend"] = backend.url
+        
+        if app_session:
+            app_session.prompt_id = prompt_id
+            app_session.comfyui_backend = backend.url
+        
+        with comfyui_pool.track(backend):
+            with tracer.span("comfyui_wait", prompt_id=prompt_id), PROMPTS_IN_FLIGHT.track_inprogress():
+                success = await wait_for_comfyui_processing(session, backend, prompt_id, session_id, submitted_at)
             if not success:
                 return None
             
-            return await get_comfyui_result(session, prompt_id)
+            with tracer.span("result_fetch"), COMFYUI_RESULT_FETCH_SECONDS.time():
+                result_path = await get_comfyui_result(session, backend, prompt_id)
+        if result_path and cache_key:
+            await run_blocking(result_cache.put, cache_key, result_path)
+        return result_path
             
     except Exception as e:
         logger.error(f"处理过程中出错: {str(e)}")
         return None
+    finally:
+        if submit_path != sketch_path:
+            await run_blocking(remove_file, submit_path)
 
 # FastAPI 应用
 app = FastAPI(
@@ -320,6 +978,64 @@ app.add_middleware(
     max_age=3600,
 )
 
+def parse_trusted_proxies(value: str) -> Optional[List[Union[ipaddress.IPv4Network, ipaddress.IPv6Network]]]:
+    """解析受信任代理列表；* 表示信任任意对端，返回 None"""
+    entries = [item.strip() for item in value.split(",") if item.strip()]
+    if "*" in entries:
+        return None
+    return [ipaddress.ip_network(item, strict=False) for item in entries]
+
+def is_trusted_proxy(host: str, proxies) -> bool:
+    """判断地址是否属于受信任代理（IP或网段）"""
+    if proxies is None:
+        return True
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return any(address in network for network in proxies)
+
+trusted_proxies = parse_trusted_proxies(config.FORWARDED_ALLOW_IPS)
+
+def client_address(connection) -> str:
+    """返回用于限流的客户端IP
+
+    对端是受信任代理时，从 X-Forwarded-For 右侧起跳过受信任代理，取第一个其余地址；
+    最左侧的项由客户端自行填写，不可信。信任任意对端（*）时只信任直接对端这一跳。
+    """
+    peer = connection.client.host if connection.client else "unknown"
+    if not is_trusted_proxy(peer, trusted_proxies):
+        return peer
+    forwarded = [host.strip() for host in connection.headers.get("x-forwarded-for", "").split(",") if host.strip()]
+    for host in reversed(forwarded):
+        if trusted_proxies is None or not is_trusted_proxy(host, trusted_proxies):
+            return host
+    return forwarded[0] if forwarded else peer
+
+@app.middleware("http")
+async def reject_oversized_uploads(request: Request, call_next):
+    """声明的请求体超过上传上限时直接返回413，不读取请求体"""
+    if request.method == "POST" and request.url.path == "/api/sketch":
+        content_length = request.headers.get("content-length")
+        # 请求体还包含 multipart 分隔符和其他表单字段，留出少量余量
+        if content_length and content_length.isdigit() and int(content_length) > config.UPLOAD_MAX_BYTES + 64 * 1024:
+            return JSONResponse(status_code=413, content={"detail": "File too large"})
+    return await call_next(request)
+
+@app.middleware("http")
+async def rate_limit_requests(request: Request, call_next):
+    """按客户端IP限制API请求速率，健康检查和指标端点不受限制"""
+    path = request.url.path
+    if path.startswith("/api/") and path not in ("/api/health", monitoring_settings.METRICS_ENDPOINT):
+        retry_after = await http_rate_limiter.acquire(client_address(request))
+        if retry_after:
+            return JSONResponse(
+                status_code=429,
+                content={"detail": "Too many requests"},
+                headers={"Retry-After": str(math.ceil(retry_after))}
+            )
+    return await call_next(request)
+
 # 静态文件
 app.mount("/static", StaticFiles(directory=config.STATIC_DIR), name="static")
 
@@ -331,6 +1047,7 @@ async def read_root():
 
 @app.post("/api/sketch")
 async def upload_sketch(
+    request: Request,
     file: UploadFile = File(...),
     style_name: str = Form("realistic"),
     session_id: Optional[str] = Form(None)
@@ -342,18 +1059,42 @@ async def upload_sketch(
         if not file.content_type.startswith('image/'):
             raise HTTPException(status_code=400, detail="File must be an image")
         
+        # 只解析第一块中的文件头：格式不支持、损坏或尺寸过大时在创建会话和写盘之前拒绝
+        head = await file.read(config.UPLOAD_CHUNK_SIZE)
+        try:
+            image_info = validate_image_header(head, config.CANVAS_MAX_SIZE)
+        except ImageHeaderError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
         session_id = session_id or str(uuid.uuid4())
-        style_config = StyleConfig(style_name=style_name)
+        style_config = style_config_for(style_name)
+        
+        # 先写盘再创建会话，超过大小上限的上传不会留下空会话
+        sketch_path = sketch_file_path(session_id, image_info.format)
+        with UPLOAD_SECONDS.time():
+            size = await save_upload_file(file, sketch_path, head, config.UPLOAD_MAX_BYTES)
         
-        session = state.get_session(session_id) or state.create_session(session_id)
+        session = await state.load_session(session_id) or await state.create_session(session_id)
+        if not session:
+            remove_file(sketch_path)
+            raise HTTPException(status_code=503, detail="Too many active sessions")
         session.style_config = style_config
         session.last_update = time.time()
+        session.client_host = client_address(request)
         
-        sketch_path = os.path.join(config.UPLOAD_DIR, f"{session_id}_{int(time.time())}.png")
-        with open(sketch_path, "wb") as buffer:
-            buffer.write(await file.read())
+        try:
+            await state.reserve_memory(session, MEMORY_SKETCH, size)
+        except MemoryBudgetExceeded as e:
+            remove_stale_sketch(sketch_path, session)
+            raise HTTPException(status_code=503, detail=str(e))
         
+        remove_stale_sketch(session.sketch_path, session)
+        state.memory.set(session_id, MEMORY_CANVAS, 0)
         session.sketch_path = sketch_path
+        session.canvas = None
+        session.sketch_received_at = 0.0
+        await state.store.update(session_id, sketch_path=sketch_path, style_name=style_name)
+        await publish_session_event("uploaded", session_id, sketch_path=sketch_path, style_name=style_name)
         
         return JSONResponse({
             "session_id": session_id,
@@ -361,6 +1102,8 @@ async def upload_sketch(
             "message": "Sketch uploaded successfully",
             "websocket_url": f"/api/ws/{session_id}"
         })
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error uploading sketch: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -369,8 +1112,7 @@ async def upload_sketch(
 async def get_styles():
     """获取可用的风格列表"""
     try:
-        style_files = glob.glob(f"{config.WORKFLOW_DIR}/*.json")
-        styles = [Path(f).stem for f in style_files]
+        styles = workflow_templates.styles()
         return JSONResponse({"styles": styles or ["realistic"]})
     except Exception as e:
         logger.error(f"Error getting styles: {str(e)}")
@@ -379,7 +1121,7 @@ async def get_styles():
 @app.get("/api/result/{session_id}")
 async def get_result(session_id: str):
     """获取生成的图像结果"""
-    session = state.get_session(session_id)
+    session = await state.load_session(session_id)
     if not session or not session.result_path:
         raise HTTPException(status_code=404, detail="Result not found")
     
@@ -391,40 +1133,55 @@ async def get_result(session_id: str):
 @app.websocket("/api/ws/{session_id}")
 async def websocket_endpoint(websocket: WebSocket, session_id: str):
     """WebSocket连接，用于实时更新"""
+    OPEN_WEBSOCKETS.inc()
     try:
         await websocket.accept()
         logger.info(f"WebSocket连接已建立: {session_id}")
         
-        session = state.get_session(session_id)
+        session = await state.load_session(session_id)
         if not session:
             await websocket.close(code=1000, reason="Session not found")
             return
         
         session.websocket = websocket
+        session.client_host = client_address(websocket)
+        previous_owner = await state.store.claim(session_id, state.worker_id)
+        if previous_owner and previous_owner != state.worker_id:
+            # 客户端重连到了本 worker，通知原 worker 关闭旧连接
+            await publish_session_event("claimed", session_id)
         session.last_update = time.time()
         session.last_heartbeat = time.time()
         session.is_alive = True
-        
-        # 启动心跳检测任务
-        heartbeat_task = asyncio.create_task(heartbeat_check(session_id))
+        watch_heartbeat(session, websocket)
         
         if session.sketch_path and not session.is_processing:
-            asyncio.create_task(process_sketch_task(session_id))
+            await schedule_sketch_processing(session)
         
         while True:
             try:
-                data = await websocket.receive_text()
-                message = WebSocketMessage.parse_raw(data)
+                data = await websocket.receive()
+                if data["type"] == "websocket.disconnect":
+                    raise WebSocketDisconnect(data.get("code", 1000))
+                if data.get("bytes") is not None:
+                    if await check_sketch_rate(session):
+                        await handle_binary_frame(session, data["bytes"])
+                    continue
+                
+                message = WebSocketMessage.parse_raw(data.get("text") or "")
                 
                 if message.type == "heartbeat":
                     session.last_heartbeat = time.time()
                     await websocket.send_json({"type": "heartbeat_ack"})
                 elif message.type == "sketch_update" and message.sketch_data:
-                    await handle_sketch_update(session, message)
+                    if await check_sketch_rate(session):
+                        await handle_sketch_update(session, message)
                 elif message.type == "comfyui_image" and message.image_data:
                     await handle_comfyui_image(session, message)
+                elif message.type == "options":
+                    if message.binary_results is not None:
+                        session.binary_results = message.binary_results
                     
-            except json.JSONDecodeError:
+            except (json.JSONDecodeError, ValidationError):
                 logger.error(f"无效的JSON消息: {session_id}")
                 await websocket.send_json({
                     "status": "error",
@@ -435,56 +1192,220 @@ async def websocket_endpoint(websocket: WebSocket, session_id: str):
     except Exception as e:
         logger.error(f"WebSocket连接错误: {session_id}, {str(e)}")
     finally:
-        if session := state.get_session(session_id):
+        OPEN_WEBSOCKETS.dec()
+        # 会话可能已在其他连接或其他 worker 上重新连接
+        if (session := state.get_session(session_id)) and session.websocket is websocket:
             session.websocket = None
             session.is_alive = False
-            # 取消心跳检测任务
-            if 'heartbeat_task' in locals():
-                heartbeat_task.cancel()
+            state.timers.cancel(("heartbeat", session_id))
+            try:
+                await state.store.release(session_id, state.worker_id)
+            except Exception as e:
+                logger.error(f"释放会话归属失败: {session_id}, {str(e)}")
 
-async def heartbeat_check(session_id: str):
-    """WebSocket心跳检测"""
-    while True:
+async def check_sketch_rate(session: Session) -> bool:
+    """草图更新消息是否在该会话的速率限制内，超出时通知客户端并丢弃该消息"""
+    retry_after = await sketch_rate_limiter.acquire(session.session_id)
+    if not retry_after:
+        return True
+    if session.websocket:
+        await session.websocket.send_json({
+            "status": "rate_limited",
+            "message": "Too many sketch updates",
+            "retry_after": round(retry_after, 3)
+        })
+    return False
+
+def watch_heartbeat(session: Session, websocket: WebSocket):
+    """在心跳超时的时刻检查该连接"""
+    remaining = session.last_heartbeat + config.HEARTBEAT_TIMEOUT - time.time()
+    state.timers.schedule_in(
+        ("heartbeat", session.session_id), remaining,
+        functools.partial(check_heartbeat, session.session_id, websocket)
+    )
+
+def check_heartbeat(session_id: str, websocket: WebSocket):
+    """心跳定时器到期：期间收到过心跳则重新计时，否则断开连接"""
+    session = state.get_session(session_id)
+    if not session or session.websocket is not websocket:
+        return
+    if time.time() - session.last_heartbeat <= config.HEARTBEAT_TIMEOUT:
+        watch_heartbeat(session, websocket)
+        # 刷新共享存储中的活动时间，避免连接期间会话过期
+        spawn(touch_session_store(session_id))
+        return
+    logger.warning(f"会话 {session_id} 心跳超时")
+    session.is_alive = False
+    spawn(websocket.close(code=1000, reason="Heartbeat timeout"))
+
+async def touch_session_store(session_id: str):
+    try:
+        await state.store.update(session_id)
+    except Exception as e:
+        logger.error(f"刷新会话存储失败: {session_id}, {str(e)}")
+
+def remove_stale_sketch(sketch_path: Optional[str], session: Session):
+    """删除被新草图覆盖、且未在处理中的草图文件"""
+    if not sketch_path or sketch_path == session.processing_sketch_path:
+        return
+    try:
+        if os.path.exists(sketch_path):
+            os.remove(sketch_path)
+    except Exception as e:
+        logger.error(f"删除过时草图失败: {sketch_path}, {str(e)}")
+
+def sketch_file_path(session_id: str, image_format: str = "png") -> str:
+    """生成新的草图文件路径"""
+    return os.path.join(config.UPLOAD_DIR, f"{session_id}_{int(time.time() * 1000)}.{image_format}")
+
+def new_sketch_path(session: Session, image_format: str = "png") -> str:
+    return sketch_file_path(session.session_id, image_format)
+
+async def materialize_canvas(session: Session):
+    """服务端画布有修改时写为草图文件（仅在开始生成时调用）"""
+    canvas = session.canvas
+    if canvas is None or not canvas.dirty:
+        return
+    sketch_path = new_sketch_path(session)
+    with tracer.span("canvas_save"), SKETCH_DECODE_SECONDS.labels("canvas_save").time():
+        await run_blocking(canvas.save, sketch_path)
+    if session.sketch_path != sketch_path:
+        remove_stale_sketch(session.sketch_path, session)
+    session.sketch_path = sketch_path
+
+async def update_canvas(session: Session, frame):
+    """将关键帧或脏矩形合成到服务端画布"""
+    if frame.type == FRAME_CANVAS_KEYFRAME:
+        # 解码前先检查文件头中的尺寸，避免为超大图像分配内存
+        validate_image_header(frame.payload, config.CANVAS_MAX_SIZE)
+        if session.canvas is None:
+            session.canvas = await run_blocking(SketchCanvas, frame.payload, config.CANVAS_MAX_SIZE)
+        else:
+            await run_blocking(session.canvas.reset, frame.payload)
+    else:
+        if session.canvas is None:
+            raise FrameError("发送增量更新前需要先发送关键帧")
+        x, y, image = decode_patch(frame.payload)
+        validate_image_header(image, config.CANVAS_MAX_SIZE)
+        await run_blocking(session.canvas.apply_patch, x, y, image)
+    try:
+        await state.reserve_memory(session, MEMORY_CANVAS, session.canvas.nbytes)
+    except MemoryBudgetExceeded:
+        session.canvas = None
+        state.memory.set(session.session_id, MEMORY_CANVAS, 0)
+        raise
+
+async def submit_sketch(session: Session, sketch_path: Optional[str] = None, received_at: Optional[float] = None):
+    """记录最新草图并提交处理
+
+    ``sketch_path`` 为空表示服务端画布已更新，开始生成时再写为草图文件。
+    ``received_at`` 为草图到达时间（monotonic），用于统计端到端延迟。
+    """
+    if session.is_processing:
+        # 最新草图覆盖待处理槽位，被覆盖的草图不再需要生成
+        if session.needs_reprocess:
+            remove_stale_sketch(session.sketch_path, session)
+        elif config.COMFYUI_CANCEL_STALE and session.prompt_id:
+            spawn(cancel_comfyui_prompt(session.prompt_id, session.comfyui_backend))
+        session.needs_reprocess = True
+    
+    if sketch_path:
+        # 客户端改为发送完整草图，不再使用服务端画布；未在处理中的旧草图文件不再需要
+        if session.sketch_path != sketch_path:
+            remove_stale_sketch(session.sketch_path, session)
+        session.sketch_path = sketch_path
+        session.canvas = None
+        state.memory.set(session.session_id, MEMORY_CANVAS, 0)
+    session.sketch_received_at = received_at or time.monotonic()
+    # 尚未开始处理的旧草图不会再生成，结束其 trace
+    tracer.finish(session.trace, "superseded")
+    session.trace = current_trace.get()
+    if session.trace is not None:
+        session.trace.mark("queued")
+    session.last_update = time.time()
+    
+    if not session.is_processing:
+        await debounce_sketch_processing(session)
+
+def trace_id_of(trace: Optional[Trace]) -> Optional[str]:
+    """状态消息中携带的 trace_id"""
+    return trace.trace_id if trace is not None else None
+
+async def handle_sketch_update(session: Session, message: WebSocketMessage):
+    """处理草图更新"""
+    trace = tracer.start_trace(session.session_id, source="base64")
+    with tracer.activate(trace):
         try:
-            session = state.get_session(session_id)
-            if not session or not session.is_alive:
-                break
-                
-            current_time = time.time()
-            if current_time - session.last_heartbeat > 30:  # 30秒无心跳则断开
-                logger.warning(f"会话 {session_id} 心跳超时")
-                if session.websocket:
-                    await session.websocket.close(code=1000, reason="Heartbeat timeout")
-                session.is_alive = False
-                break
+            received_at = time.monotonic()
+            with tracer.span("decode"):
+                sketch_data = strip_data_url(message.sketch_data)
+                await state.reserve_memory(session, MEMORY_SKETCH, len(sketch_data) * 3 // 4)
                 
-            await asyncio.sleep(10)  # 每10秒检查一次
+                sketch_path = new_sketch_path(session)
+                with SKETCH_DECODE_SECONDS.labels("base64").time():
+                    await run_blocking(base64_to_image, sketch_data, sketch_path)
+            
+            await submit_sketch(session, sketch_path, received_at)
         except Exception as e:
-            logger.error(f"心跳检测错误: {session_id}, {str(e)}")
-            break
+            tracer.finish(trace, "error")
+            logger.error(f"处理草图更新时出错: {str(e)}")
+            if session.websocket:
+                await session.websocket.send_json({
+                    "status": "error",
+                    "message": f"处理草图更新时出错: {str(e)}",
+                    "trace_id": trace_id_of(trace)
+                })
 
-async def handle_sketch_update(session: Session, message: WebSocketMessage):
-    """处理草图更新"""
-    try:
-        sketch_data = message.sketch_data
-        if sketch_data.startswith("data:image/"):
-            sketch_data = sketch_data.split(",")[1]
-        
-        sketch_path = os.path.join(config.UPLOAD_DIR, f"{session.session_id}_{int(time.time())}.png")
-        base64_to_image(sketch_data, sketch_path)
-        
-        session.sketch_path = sketch_path
-        session.last_update = time.time()
-        
-        if not session.is_processing:
-            asyncio.create_task(process_sketch_task(session.session_id))
-    except Exception as e:
-        logger.error(f"处理草图更新时出错: {str(e)}")
-        if session.websocket:
-            await session.websocket.send_json({
-                "status": "error",
-                "message": f"处理草图更新时出错: {str(e)}"
-            })
+async def handle_binary_frame(session: Session, data: bytes):
+    """处理二进制草图帧（原始PNG/WebP字节，无需base64解码）"""
+    trace = tracer.start_trace(session.session_id, source="binary")
+    with tracer.activate(trace):
+        try:
+            received_at = time.monotonic()
+            frame = decode_frame(data)
+            if trace is not None:
+                trace.attributes.update(frame_type=frame.type, seq=frame.seq)
+            with tracer.span("decode"):
+                if frame.type == FRAME_SKETCH_UPDATE:
+                    image_format = validate_image_header(frame.payload, config.CANVAS_MAX_SIZE).format
+                    await state.reserve_memory(session, MEMORY_SKETCH, len(frame.payload))
+                    sketch_path = new_sketch_path(session, image_format)
+                    with SKETCH_DECODE_SECONDS.labels("binary").time():
+                        await run_blocking(write_bytes_to_file, frame.payload, sketch_path)
+                elif frame.type in (FRAME_CANVAS_KEYFRAME, FRAME_CANVAS_PATCH):
+                    with SKETCH_DECODE_SECONDS.labels("canvas").time():
+                        await update_canvas(session, frame)
+                    sketch_path = None
+                else:
+                    raise FrameError(f"不支持的帧类型: {frame.type}")
+            
+            # 使用二进制协议的客户端同样以二进制帧接收结果
+            session.binary_results = True
+            session.sketch_seq = frame.seq
+            await submit_sketch(session, sketch_path, received_at)
+        except Exception as e:
+            tracer.finish(trace, "error")
+            logger.error(f"处理二进制草图帧时出错: {str(e)}")
+            if session.websocket:
+                await session.websocket.send_json({
+                    "status": "error",
+                    "message": f"处理二进制草图帧时出错: {str(e)}",
+                    "trace_id": trace_id_of(trace)
+                })
+
+async def send_result(session: Session, seq: int = 0):
+    """推送生成结果：二进制帧直接携带图像，否则发送结果URL"""
+    if not session.websocket:
+        return
+    if session.binary_results:
+        frame = await run_blocking(read_result_frame, session.result_path, seq)
+        await session.websocket.send_bytes(frame)
+    else:
+        await session.websocket.send_json({
+            "status": "completed",
+            "result_url": f"/api/result/{session.session_id}",
+            "trace_id": trace_id_of(current_trace.get())
+        })
 
 async def handle_comfyui_image(session: Session, message: WebSocketMessage):
     """处理ComfyUI图像"""
@@ -492,16 +1413,11 @@ async def handle_comfyui_image(session: Session, message: WebSocketMessage):
         if not message.image_data.startswith("data:image/"):
             raise ValueError("图片数据格式错误")
         
-        result_path = os.path.join(config.OUTPUT_DIR, f"{session.session_id}_{int(time.time())}.png")
-        base64_to_image(message.image_data, result_path)
+        result_path = os.path.join(config.OUTPUT_DIR, f"{session.session_id}_{int(time.time() * 1000)}.png")
+        await run_blocking(base64_to_image, strip_data_url(message.image_data), result_path)
         
         session.result_path = result_path
-        
-        if session.websocket:
-            await session.websocket.send_json({
-                "status": "completed",
-                "result_url": f"/api/result/{session.session_id}"
-            })
+        await send_result(session, session.sketch_seq)
     except Exception as e:
         logger.error(f"处理ComfyUI图像时出错: {str(e)}")
         if session.websocket:
@@ -510,78 +1426,317 @@ async def handle_comfyui_image(session: Session, message: WebSocketMessage):
                 "message": f"处理ComfyUI图像时出错: {str(e)}"
             })
 
+async def publish_session_event(event_type: str, session_id: str, **data: Any):
+    """向所有 worker 广播会话事件"""
+    try:
+        await state.store.publish({"type": event_type, "session_id": session_id, "worker": state.worker_id, **data})
+    except Exception as e:
+        logger.error(f"发布会话事件失败: {event_type}, {session_id}, {str(e)}")
+
+async def publish_result(session: Session):
+    """将生成结果写入共享存储并通知其他 worker"""
+    try:
+        await state.store.update(
+            session.session_id,
+            result_path=session.result_path,
+            sketch_path=session.processing_sketch_path,
+            comfyui_backend=session.comfyui_backend,
+        )
+    except Exception as e:
+        logger.error(f"更新会话存储失败: {session.session_id}, {str(e)}")
+    await publish_session_event("completed", session.session_id, result_path=session.result_path)
+
+async def handle_session_event(event: Dict[str, Any]):
+    """处理其他 worker 广播的会话事件，更新本地副本"""
+    if event.get("worker") == state.worker_id:
+        return
+    session = state.get_session(event.get("session_id", ""))
+    if session is None:
+        return
+    event_type = event.get("type")
+    if event_type == "completed":
+        session.result_path = event.get("result_path")
+    elif event_type == "uploaded":
+        session.sketch_path = event.get("sketch_path")
+        session.style_config = style_config_for(event.get("style_name") or "realistic")
+        session.canvas = None
+        state.memory.set(session.session_id, MEMORY_CANVAS, 0)
+    elif event_type == "claimed" and session.websocket:
+        logger.info(f"会话 {session.session_id} 已在其他 worker 上重新连接，关闭本地连接")
+        websocket, session.websocket = session.websocket, None
+        session.is_alive = False
+        try:
+            await websocket.close(code=1000, reason="Session moved")
+        except Exception as e:
+            logger.error(f"关闭WebSocket连接失败: {session.session_id}, {str(e)}")
+
+async def debounce_sketch_processing(session: Session):
+    """最新草图静默一个防抖窗口后再提交调度器，期间的新草图重新计时
+
+    窗口随调度队列负载和生成耗时变化；从首次等待起最长等待 ``SKETCH_DEBOUNCE_MAX``，
+    持续绘制时也会定期出图。时间轮未运行（例如应用未启动）时立即提交，不会丢失草图。
+    """
+    session_id = session.session_id
+    window = sketch_debounce.window(job_scheduler.queue_depth, job_scheduler.in_flight, job_scheduler.max_in_flight)
+    session.debounce_window = window
+    key = ("debounce", session_id)
+    now = time.monotonic()
+    if key not in state.debounce_timers:
+        session.debounce_since = now
+    deadline = min(session.sketch_received_at + window, session.debounce_since + sketch_debounce.max_window)
+    if deadline <= now or not state.debounce_timers.running:
+        state.debounce_timers.cancel(key)
+        await start_debounced_sketch(session)
+        return
+    state.debounce_timers.schedule(key, deadline, lambda: spawn(run_debounced_sketch(session_id)))
+
+async def run_debounced_sketch(session_id: str):
+    """防抖定时器到期"""
+    session = state.get_session(session_id)
+    if not session or session.is_processing:
+        # 处理中收到的草图在任务结束后补跑
+        return
+    trace = session.trace
+    if trace is not None and "queued" in trace.marks:
+        # 只有实际等待过的草图记录防抖阶段
+        trace.record("debounce", trace.marks["queued"], window=round(session.debounce_window, 3))
+        trace.mark("queued")
+    await start_debounced_sketch(session)
+
+async def start_debounced_sketch(session: Session):
+    SKETCH_DEBOUNCE_SECONDS.observe(time.monotonic() - session.debounce_since)
+    await schedule_sketch_processing(session)
+
+async def schedule_sketch_processing(session: Session):
+    """将草图处理提交到全局调度器，排队时通知客户端位置
+
+    与上次生成时的草图相比变化过小时直接沿用上次结果，不占用生成任务额度和调度槽位。
+    """
+    session_id = session.session_id
+    with tracer.activate(session.trace):
+        changed = await check_sketch_change(session)
+        if not changed:
+            logger.info(f"会话 {session_id} 的草图变化过小，沿用上次结果")
+            await send_result(session, session.sketch_seq)
+    if not changed:
+        tracer.finish(session.trace, "unchanged")
+        session.trace = None
+        session.needs_reprocess = False
+        state.memory.set(session_id, MEMORY_SKETCH, 0)
+        return
+    # 同一客户端的所有会话共用生成任务额度
+    retry_after = await job_rate_limiter.acquire(session.client_host or session_id)
+    if retry_after:
+        logger.warning(f"生成任务超出速率限制，暂不处理会话 {session_id} 的草图")
+        if session.websocket:
+            await session.websocket.send_json({
+                "status": "rate_limited",
+                "message": "Too many generation requests, please slow down",
+                "retry_after": round(retry_after, 3),
+                "trace_id": trace_id_of(session.trace)
+            })
+        tracer.finish(session.trace, "rejected")
+        session.trace = None
+        return
+    try:
+        position = job_scheduler.submit(session_id, lambda: process_sketch_task(session_id))
+    except SchedulerFullError:
+        logger.warning(f"调度队列已满，拒绝会话 {session_id} 的任务")
+        if session.websocket:
+            await session.websocket.send_json({
+                "status": "rejected",
+                "message": "Server is busy, please try again later",
+                "trace_id": trace_id_of(session.trace)
+            })
+        tracer.finish(session.trace, "rejected")
+        session.trace = None
+        return
+    
+    if position > 0 and session.websocket:
+        await session.websocket.send_json({
+            "status": "queued",
+            "position": position,
+            "trace_id": trace_id_of(session.trace)
+        })
+
 async def process_sketch_task(session_id: str):
     """处理草图并生成图像的后台任务"""
     session = state.get_session(session_id)
-    if not session or session.is_processing or not session.sketch_path:
+    if not session or session.is_processing or not (session.sketch_path or session.canvas):
         return
     
+    # 通过 HTTP 上传的草图没有在接收时创建 trace
+    trace = session.trace or tracer.start_trace(session_id, source="upload")
+    session.trace = None
+    status = "error"
+    try:
+        with tracer.activate(trace):
+            status = await run_sketch_task(session, trace)
+    finally:
+        tracer.finish(trace, status)
+        session.is_processing = False
+        processed_path = session.processing_sketch_path
+        session.processing_sketch_path = None
+        session.prompt_id = None
+        if processed_path != session.sketch_path:
+            # 处理期间已被新草图（或重新写盘的服务端画布）取代，旧文件不再需要
+            remove_stale_sketch(processed_path, session)
+        if not session.needs_reprocess:
+            # 没有等待处理的新草图
+            state.memory.set(session_id, MEMORY_SKETCH, 0)
+        # 处理期间收到新草图时，仅用最新草图补跑一次（重新排到队尾，与其他会话轮转）
+        if session.needs_reprocess and state.get_session(session_id):
+            await debounce_sketch_processing(session)
+
+async def check_sketch_change(session: Session) -> bool:
+    """与上次生成结果的草图比较，返回是否需要重新生成
+
+    在占用任务额度之前调用，服务端画布会先写为草图文件（生成开始时未再修改则不重复写盘）。
+    """
+    if config.SKETCH_CHANGE_THRESHOLD <= 0:
+        return True
+    try:
+        await materialize_canvas(session)
+    except Exception as e:
+        logger.warning(f"保存服务端画布失败: {session.session_id}, {str(e)}")
+        return True
+    sketch_path = session.sketch_path
+    if not sketch_path:
+        return True
+    sent = session.sent_fingerprint
+    comparable = (
+        sent is not None and sent[0] == session.style_config.style_name
+        and bool(session.result_path) and os.path.exists(session.result_path)
+    )
+    # 只有实际比较时才记录 span；首次生成仍计算指纹，供下次比较
+    with (tracer.span("change_detect") if comparable else contextlib.nullcontext()) as span:
+        try:
+            with SKETCH_FINGERPRINT_SECONDS.time():
+                fingerprint = await run_blocking(sketch_fingerprint, sketch_path)
+        except Exception as e:
+            # 无法解码时不做判断，照常提交
+            logger.warning(f"计算草图指纹失败: {sketch_path}, {str(e)}")
+            session.checked_fingerprint = None
+            return True
+        session.checked_fingerprint = (sketch_path, fingerprint)
+        changed = True
+        if comparable:
+            difference = sent[1].difference(fingerprint, config.SKETCH_CHANGE_PIXEL_DELTA)
+            changed = difference >= config.SKETCH_CHANGE_THRESHOLD
+            if span is not None:
+                span.attributes["difference"] = round(difference, 4)
+    SKETCH_CHANGE_CHECKS.labels("submitted" if changed else "skipped").inc()
+    return changed
+
+async def run_sketch_task(session: Session, trace: Optional[Trace]) -> str:
+    """在当前 trace 中生成并推送结果，返回 trace 状态"""
+    session_id = session.session_id
+    trace_id = trace_id_of(trace)
     try:
         session.is_processing = True
+        session.needs_reprocess = False
+        session.processing_seq = session.sketch_seq
+        received_at = session.sketch_received_at
+        if trace is not None and "queued" in trace.marks:
+            trace.record("queue", trace.marks["queued"])
+        await materialize_canvas(session)
+        session.processing_sketch_path = session.sketch_path
+        checked = session.checked_fingerprint
+        session.checked_fingerprint = None
         
         if session.websocket:
             await session.websocket.send_json({
                 "status": "processing",
-                "message": "Processing sketch..."
+                "message": "Processing sketch...",
+                "trace_id": trace_id
             })
         
-        result_path = await send_to_comfyui(session.sketch_path, session.style_config, session_id)
+        with tracer.span("send_to_comfyui"):
+            result_path = await send_to_comfyui(session.processing_sketch_path, session.style_config, session_id)
         
         if result_path:
             session.result_path = result_path
-            if session.websocket:
-                await session.websocket.send_json({
-                    "status": "completed",
-                    "result_url": f"/api/result/{session_id}"
-                })
+            if checked is not None and checked[0] == session.processing_sketch_path:
+                session.sent_fingerprint = (session.style_config.style_name, checked[1])
+            with tracer.span("deliver"):
+                await send_result(session, session.processing_seq)
+            await publish_result(session)
+            if received_at:
+                STROKE_TO_IMAGE_SECONDS.observe(time.monotonic() - received_at)
+            return "ok"
+        elif session.needs_reprocess:
+            # 已被新草图取代（可能被主动取消），不向客户端报错
+            logger.info(f"会话 {session_id} 的过时草图未生成结果，等待处理最新草图")
+            return "superseded"
         else:
             if session.websocket:
                 await session.websocket.send_json({
                     "status": "error",
-                    "message": "Failed to generate image"
+                    "message": "Failed to generate image",
+                    "trace_id": trace_id
                 })
+            return "error"
     except Exception as e:
         logger.error(f"Error processing sketch: {str(e)}")
         if session.websocket:
             await session.websocket.send_json({
                 "status": "error",
-                "message": f"Error: {str(e)}"
+                "message": f"Error: {str(e)}",
+                "trace_id": trace_id
             })
-    finally:
-        session.is_processing = False
+        return "error"
 
 # 启动和清理
 @app.on_event("startup")
 async def startup_event():
     """应用启动时的初始化"""
     create_required_directories()
+    workflow_templates.reload()
+    if config.RESULT_CACHE_ENABLED:
+        result_cache.load()
+    await comfyui_client.start()
+    await comfyui_pool.start(comfyui_client.session, events=config.COMFYUI_WS_ENABLED)
+    await resource_sampler.start()
+    await state.store.start(handle_session_event)
+    await state.timers.start()
+    await state.debounce_timers.start()
     asyncio.create_task(cleanup_sessions())
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """应用关闭时释放资源：先等待运行中的任务完成，结果写入共享存储后再退出"""
+    await job_scheduler.drain(config.SHUTDOWN_DRAIN_TIMEOUT)
+    await resource_sampler.stop()
+    await comfyui_pool.stop()
+    await comfyui_client.close()
+    await state.timers.stop()
+    await state.debounce_timers.stop()
+    await state.store.close()
+
 async def cleanup_sessions():
-    """定期清理过期会话"""
+    """定期检查系统资源（过期会话由定时器逐个清理）"""
     while True:
         try:
-            await state.cleanup_expired_sessions()
-            # 检查系统资源使用情况
             await check_system_resources()
         except Exception as e:
-            logger.error(f"清理会话时发生错误: {str(e)}")
+            logger.error(f"检查系统资源时发生错误: {str(e)}")
         await asyncio.sleep(config.CLEANUP_INTERVAL)
 
 async def check_system_resources():
     """检查系统资源使用情况"""
     try:
-        process = psutil.Process()
+        # 读取后台采样的最新快照，不在事件循环中等待CPU采样
+        snapshot = resource_sampler.snapshot
         
         # 检查内存使用
-        memory_percent = process.memory_percent()
+        memory_percent = snapshot.process_memory_percent
         if memory_percent > 80:
             logger.warning(f"内存使用率过高: {memory_percent}%")
             # 强制清理一些会话
             await state.cleanup_expired_sessions()
         
         # 检查CPU使用
-        cpu_percent = process.cpu_percent(interval=1)
+        cpu_percent = snapshot.process_cpu_percent
         if cpu_percent > 80:
             logger.warning(f"CPU使用率过高: {cpu_percent}%")
     except Exception as e:
@@ -598,18 +1753,45 @@ class SystemStatus(BaseModel):
     platform: str
     python_version: str
 
+@app.get("/api/debug/traces")
+async def get_traces(limit: int = 50, session_id: Optional[str] = None):
+    """导出最近完成的 trace"""
+    if not tracer.enabled:
+        raise HTTPException(status_code=404, detail="Tracing is disabled")
+    return JSONResponse({"traces": tracer.recent(limit, session_id)})
+
+@app.get(monitoring_settings.METRICS_ENDPOINT)
+async def metrics():
+    """Prometheus 指标导出端点"""
+    data, content_type = render_metrics()
+    return Response(content=data, media_type=content_type)
+
+def debounce_window_summary() -> Dict[str, Any]:
+    """已连接会话最近使用的防抖窗口分布（不逐个列出会话）"""
+    windows = sorted(
+        session.debounce_window for session in state.active_sessions.values() if session.websocket is not None
+    )
+    if not windows:
+        return {"count": 0}
+    return {
+        "count": len(windows),
+        "min": round(windows[0], 6),
+        "p50": round(windows[len(windows) // 2], 6),
+        "max": round(windows[-1], 6),
+    }
+
 @app.get("/api/health")
 async def health_check():
     """健康检查端点"""
     try:
-        process = psutil.Process()
+        snapshot = resource_sampler.snapshot
         system_status = SystemStatus(
-            cpu_percent=process.cpu_percent(),
-            memory_percent=process.memory_percent(),
-            disk_percent=psutil.disk_usage('/').percent,
+            cpu_percent=snapshot.process_cpu_percent,
+            memory_percent=snapshot.process_memory_percent,
+            disk_percent=snapshot.disk_percent,
             active_sessions=len(state.active_sessions),
             max_sessions=config.MAX_ACTIVE_SESSIONS,
-            uptime=time.time() - process.create_time(),
+            uptime=time.time() - resource_sampler.process_start_time,
             platform=platform.platform(),
             python_version=platform.python_version()
         )
@@ -625,6 +1807,20 @@ async def health_check():
         return JSONResponse({
             "status": "healthy" if is_healthy else "unhealthy",
             "system_status": system_status.dict(),
+            "resources": snapshot.to_dict(),
+            "comfyui_pool": comfyui_client.get_stats(),
+            "comfyui_backends": comfyui_pool.get_stats(),
+            "scheduler": job_scheduler.get_stats(),
+            "sketch_debounce": {
+                **sketch_debounce.get_stats(),
+                "sessions": debounce_window_summary(),
+            },
+            "result_cache": result_cache.get_stats(),
+            "rate_limits": {
+                limiter.name: limiter.get_stats()
+                for limiter in (http_rate_limiter, sketch_rate_limiter, job_rate_limiter)
+            },
+            "session_memory": state.memory.get_stats(),
             "timestamp": time.time()
         })
     except Exception as e:
@@ -640,4 +1836,4 @@ async def health_check():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("app:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    uvicorn.run("app:app", host="0.0.0.0", port=8000, reload=True, proxy_headers=False)
\ No newline at end of file
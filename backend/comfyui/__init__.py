@@ -0,0 +1,22 @@
+from .client import ComfyUIClient, PoolStats
+from .events import (
+    ComfyUIEventListener,
+    LISTENER_DISCONNECTED,
+    is_success_event,
+    is_failure_event
+)
+from .workflows import WorkflowTemplate, WorkflowTemplateCache
+from .pool import ComfyUIBackend, ComfyUIBackendPool
+
+__all__ = [
+    'ComfyUIClient',
+    'PoolStats',
+    'ComfyUIEventListener',
+    'LISTENER_DISCONNECTED',
+    'is_success_event',
+    'is_failure_event',
+    'WorkflowTemplate',
+    'WorkflowTemplateCache',
+    'ComfyUIBackend',
+    'ComfyUIBackendPool'
+]
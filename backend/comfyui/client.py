@@ -0,0 +1,154 @@
+import time
+import logging
+from typing import Dict, Any, Optional
+from types import SimpleNamespace
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+
+class PoolStats:
+    """连接池使用统计"""
+
+    def __init__(self):
+        self.requests_total = 0
+        self.requests_in_flight = 0
+        self.request_errors = 0
+        self.connections_created = 0
+        self.connections_reused = 0
+        self.pool_waits = 0
+        self.pool_waiting = 0
+        self.pool_wait_seconds = 0.0
+        self.pool_wait_max = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "requests_total": self.requests_total,
+            "requests_in_flight": self.requests_in_flight,
+            "request_errors": self.request_errors,
+            "connections_created": self.connections_created,
+            "connections_reused": self.connections_reused,
+            "pool_waits": self.pool_waits,
+            "pool_waiting": self.pool_waiting,
+            "pool_wait_seconds": round(self.pool_wait_seconds, 6),
+            "pool_wait_max": round(self.pool_wait_max, 6),
+        }
+
+
+class ComfyUIClient:
+    """应用生命周期内共享的ComfyUI HTTP客户端
+
+    所有到 ComfyUI 的请求复用同一个有界连接池（keep-alive、DNS缓存），
+    并通过 aiohttp 的 TraceConfig 统计连接池饱和度与排队等待时间。
+    """
+
+    def __init__(
+        self,
+        server_url: str,
+        pool_size: int = 100,
+        pool_per_host: int = 32,
+        keepalive_timeout: float = 30.0,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 60.0,
+        dns_cache_ttl: int = 300,
+    ):
+        self.server_url = server_url
+        self.pool_size = pool_size
+        self.pool_per_host = pool_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self.stats = PoolStats()
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """共享的 aiohttp 会话"""
+        if self._session is None or self._session.closed:
+            raise RuntimeError("ComfyUI 客户端未启动")
+        return self._session
+
+    @property
+    def started(self) -> bool:
+        return self._session is not None and not self._session.closed
+
+    async def start(self):
+        """创建连接池"""
+        if self.started:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=self.pool_size,
+            limit_per_host=self.pool_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=self.dns_cache_ttl,
+        )
+        # 不设置 total 超时，避免误伤长连接的事件流；升级为 WebSocket 后 sock_read 会被重置
+        timeout = aiohttp.ClientTimeout(
+            total=None,
+            connect=self.connect_timeout,
+            sock_read=self.read_timeout,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=timeout,
+            trace_configs=[self._create_trace_config()],
+        )
+        logger.info(f"ComfyUI 连接池已创建: limit={self.pool_size}, per_host={self.pool_per_host}")
+
+    async def close(self):
+        """关闭连接池"""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取连接池统计，用于容量规划"""
+        stats = self.stats.to_dict()
+        stats["pool_size"] = self.pool_size
+        stats["pool_per_host"] = self.pool_per_host
+        stats["saturation"] = (
+            round(self.stats.requests_in_flight / self.pool_size, 4) if self.pool_size else 0
+        )
+        return stats
+
+    def _create_trace_config(self) -> aiohttp.TraceConfig:
+        """注册连接池事件回调"""
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(self._on_request_start)
+        trace_config.on_request_end.append(self._on_request_end)
+        trace_config.on_request_exception.append(self._on_request_exception)
+        trace_config.on_connection_queued_start.append(self._on_queued_start)
+        trace_config.on_connection_queued_end.append(self._on_queued_end)
+        trace_config.on_connection_create_end.append(self._on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(self._on_connection_reuseconn)
+        return trace_config
+
+    async def _on_request_start(self, session, ctx: SimpleNamespace, params):
+        self.stats.requests_total += 1
+        self.stats.requests_in_flight += 1
+
+    async def _on_request_end(self, session, ctx: SimpleNamespace, params):
+        self.stats.requests_in_flight -= 1
+
+    async def _on_request_exception(self, session, ctx: SimpleNamespace, params):
+        self.stats.requests_in_flight -= 1
+        self.stats.request_errors += 1
+
+    async def _on_queued_start(self, session, ctx: SimpleNamespace, params):
+        ctx.queued_at = time.monotonic()
+        self.stats.pool_waits += 1
+        self.stats.pool_waiting += 1
+
+    async def _on_queued_end(self, session, ctx: SimpleNamespace, params):
+        self.stats.pool_waiting -= 1
+        waited = time.monotonic() - getattr(ctx, "queued_at", time.monotonic())
+        self.stats.pool_wait_seconds += waited
+        self.stats.pool_wait_max = max(self.stats.pool_wait_max, waited)
+
+    async def _on_connection_create_end(self, session, ctx: SimpleNamespace, params):
+        self.stats.connections_created += 1
+
+    async def _on_connection_reuseconn(self, session, ctx: SimpleNamespace, params):
+        self.stats.connections_reused += 1
@@ -0,0 +1,192 @@
+import asyncio
+import json
+import logging
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional, Any
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+# 监听器断开时推送给所有等待者的事件类型
+LISTENER_DISCONNECTED = "listener_disconnected"
+
+# 与单个prompt相关的ComfyUI事件
+PROMPT_EVENTS = {
+    "execution_start",
+    "execution_cached",
+    "executing",
+    "progress",
+    "executed",
+    "execution_success",
+    "execution_error",
+    "execution_interrupted",
+}
+
+
+def is_success_event(event: Dict[str, Any]) -> bool:
+    """判断事件是否表示prompt执行成功"""
+    if event["type"] == "execution_success":
+        return True
+    # 旧版ComfyUI以 node 为空的 executing 事件表示执行结束
+    return event["type"] == "executing" and event["data"].get("node") is None
+
+
+def is_failure_event(event: Dict[str, Any]) -> bool:
+    """判断事件是否表示prompt执行失败"""
+    return event["type"] in ("execution_error", "execution_interrupted")
+
+
+def build_ws_url(server_url: str, client_id: str) -> str:
+    """根据HTTP地址构建ComfyUI WebSocket地址"""
+    if server_url.startswith("https://"):
+        base = "wss://" + server_url[len("https://"):]
+    elif server_url.startswith("http://"):
+        base = "ws://" + server_url[len("http://"):]
+    else:
+        base = server_url
+    return f"{base.rstrip('/')}/ws?clientId={client_id}"
+
+
+class ComfyUIEventListener:
+    """ComfyUI事件流监听器
+
+    维护一条到 ComfyUI ``/ws`` 的长连接，按 ``prompt_id`` 将事件分发给等待中的任务。
+    提交工作流时需携带 ``client_id``，ComfyUI 才会把该 prompt 的进度事件推送到本连接。
+    """
+
+    def __init__(
+        self,
+        server_url: str,
+        client_id: Optional[str] = None,
+        reconnect_delay: float = 1.0,
+        max_reconnect_delay: float = 30.0,
+        buffer_size: int = 256,
+    ):
+        self.server_url = server_url
+        self.client_id = client_id or uuid.uuid4().hex
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.buffer_size = buffer_size
+        self._subscribers: Dict[str, asyncio.Queue] = {}
+        # 订阅前到达的事件（提交请求返回前执行可能已经开始）
+        self._pending: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+        self._connected = False
+        self._task: Optional[asyncio.Task] = None
+        self._http: Optional[aiohttp.ClientSession] = None
+        self._owns_http = False
+
+    @property
+    def connected(self) -> bool:
+        """事件流是否可用"""
+        return self._connected
+
+    @property
+    def ws_url(self) -> str:
+        return build_ws_url(self.server_url, self.client_id)
+
+    async def start(self, session: Optional[aiohttp.ClientSession] = None):
+        """启动后台监听任务，可传入共享的 aiohttp 会话"""
+        if self._task and not self._task.done():
+            return
+        self._owns_http = session is None
+        self._http = session or aiohttp.ClientSession()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止监听并释放连接"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._http and self._owns_http:
+            await self._http.close()
+        self._http = None
+        self._mark_disconnected()
+
+    async def wait_connected(self, timeout: Optional[float] = None) -> bool:
+        """等待事件流连接建立"""
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while not self._connected:
+            if deadline is not None and loop.time() >= deadline:
+                return False
+            await asyncio.sleep(0.01)
+        return True
+
+    def subscribe(self, prompt_id: str) -> asyncio.Queue:
+        """订阅指定prompt的事件，返回事件队列"""
+        queue: asyncio.Queue = asyncio.Queue()
+        for event in self._pending.pop(prompt_id, []):
+            queue.put_nowait(event)
+        if not self.connected:
+            queue.put_nowait({"type": LISTENER_DISCONNECTED, "data": {}})
+        self._subscribers[prompt_id] = queue
+        return queue
+
+    def unsubscribe(self, prompt_id: str):
+        """取消订阅"""
+        self._subscribers.pop(prompt_id, None)
+        self._pending.pop(prompt_id, None)
+
+    async def _run(self):
+        """连接循环，断线后指数退避重连"""
+        delay = self.reconnect_delay
+        while True:
+            try:
+                async with self._http.ws_connect(self.ws_url, heartbeat=30) as ws:
+                    logger.info(f"已连接 ComfyUI 事件流: {self.ws_url}")
+                    self._connected = True
+                    delay = self.reconnect_delay
+                    await self._listen(ws)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"ComfyUI 事件流连接失败: {str(e)}")
+            self._mark_disconnected()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    async def _listen(self, ws: aiohttp.ClientWebSocketResponse):
+        """读取事件直到连接关闭"""
+        async for msg in ws:
+            if msg.type == aiohttp.WSMsgType.TEXT:
+                try:
+                    self._dispatch(json.loads(msg.data))
+                except (ValueError, TypeError) as e:
+                    logger.error(f"无效的 ComfyUI 事件: {str(e)}")
+            elif msg.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                break
+            # 二进制帧为预览图，忽略
+
+    def _dispatch(self, message: Dict[str, Any]):
+        """按prompt_id分发事件"""
+        event_type = message.get("type")
+        data = message.get("data") or {}
+        prompt_id = data.get("prompt_id")
+        if event_type not in PROMPT_EVENTS or not prompt_id:
+            return
+
+        event = {"type": event_type, "data": data}
+        queue = self._subscribers.get(prompt_id)
+        if queue is not None:
+            queue.put_nowait(event)
+            return
+
+        self._pending.setdefault(prompt_id, []).append(event)
+        self._pending.move_to_end(prompt_id)
+        while len(self._pending) > self.buffer_size:
+            self._pending.popitem(last=False)
+
+    def _mark_disconnected(self):
+        """标记断开并通知所有等待者回退到轮询"""
+        if not self._connected:
+            return
+        self._connected = False
+        logger.warning("ComfyUI 事件流已断开")
+        for queue in self._subscribers.values():
+            queue.put_nowait({"type": LISTENER_DISCONNECTED, "data": {}})
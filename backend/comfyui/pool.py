@@ -0,0 +1,219 @@
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+import aiohttp
+
+from .events import ComfyUIEventListener
+
+logger = logging.getLogger(__name__)
+
+
+class ComfyUIBackend:
+    """单个ComfyUI节点的状态"""
+
+    def __init__(self, url: str, client_id: Optional[str] = None, upload_cache_size: int = 1024, **listener_options):
+        self.url = url.rstrip("/")
+        self.events = ComfyUIEventListener(self.url, client_id=client_id, **listener_options)
+        # 最近一次健康检查得到的队列深度（执行中 + 等待中，包含其他客户端的任务）
+        self.queue_depth = 0
+        # 本进程已提交、尚未完成的prompt数
+        self.in_flight = 0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.last_check: Optional[float] = None
+        self.submitted = 0
+        self.failures = 0
+        # 已上传到该节点的输入图像（按内容哈希命名），相同草图无需重复上传
+        self.uploaded: "OrderedDict[str, None]" = OrderedDict()
+        self.upload_cache_size = upload_cache_size
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.ejected_until
+
+    @property
+    def load(self) -> int:
+        """负载估计：健康检查之间队列深度可能过时，取其与本地在途数的较大值"""
+        return max(self.queue_depth, self.in_flight)
+
+    def has_upload(self, name: str) -> bool:
+        """该节点上是否已有此输入图像"""
+        if name not in self.uploaded:
+            return False
+        self.uploaded.move_to_end(name)
+        return True
+
+    def remember_upload(self, name: str):
+        """记录已上传的输入图像，超出容量时淘汰最久未用的记录"""
+        self.uploaded[name] = None
+        self.uploaded.move_to_end(name)
+        while len(self.uploaded) > self.upload_cache_size:
+            self.uploaded.popitem(last=False)
+
+    def forget_upload(self, name: str):
+        """节点上的输入图像可能已被清理，下次重新上传"""
+        self.uploaded.pop(name, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "queue_depth": self.queue_depth,
+            "in_flight": self.in_flight,
+            "load": self.load,
+            "submitted": self.submitted,
+            "uploaded_images": len(self.uploaded),
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "events_connected": self.events.connected,
+        }
+
+
+class ComfyUIBackendPool:
+    """多ComfyUI节点池
+
+    按负载（``/api/queue`` 队列深度与本地在途prompt数）将prompt路由到最空闲的健康节点，
+    同一会话优先沿用上次的节点以保持模型/VAE缓存。连续失败达到阈值的节点会被
+    暂时剔除，剔除期满或健康检查恢复后重新参与路由。
+    """
+
+    def __init__(
+        self,
+        urls: Sequence[str],
+        health_interval: float = 5.0,
+        health_timeout: float = 2.0,
+        failure_threshold: int = 3,
+        eject_seconds: float = 30.0,
+        sticky_slack: int = 1,
+    ):
+        if not urls:
+            raise ValueError("至少需要一个ComfyUI节点")
+        # 所有节点共用同一个 client_id，事件流按节点分别建立
+        self.backends: List[ComfyUIBackend] = [ComfyUIBackend(urls[0])]
+        client_id = self.backends[0].events.client_id
+        self.backends.extend(ComfyUIBackend(url, client_id=client_id) for url in urls[1:])
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.failure_threshold = failure_threshold
+        self.eject_seconds = eject_seconds
+        # 粘性节点的负载最多比最空闲节点高出这么多时仍沿用
+        self.sticky_slack = sticky_slack
+        self._http: Optional[aiohttp.ClientSession] = None
+        self._health_task: Optional[asyncio.Task] = None
+        self._events_enabled = False
+        self._next = 0
+
+    @property
+    def client_id(self) -> str:
+        return self.backends[0].events.client_id
+
+    def get(self, url: Optional[str]) -> Optional[ComfyUIBackend]:
+        """按地址查找节点"""
+        if url is None:
+            return None
+        url = url.rstrip("/")
+        for backend in self.backends:
+            if backend.url == url:
+                return backend
+        return None
+
+    def select(self, preferred: Optional[str] = None, exclude: Sequence[ComfyUIBackend] = ()) -> Optional[ComfyUIBackend]:
+        """选择处理下一个prompt的节点，没有可用节点时返回None"""
+        candidates = [b for b in self.backends if b.healthy and b not in exclude]
+        if not candidates:
+            # 全部被剔除时仍尝试负载最低的节点，而不是直接失败
+            candidates = [b for b in self.backends if b not in exclude]
+            if not candidates:
+                return None
+        min_load = min(b.load for b in candidates)
+        sticky = self.get(preferred)
+        if sticky is not None and sticky in candidates and sticky.load <= min_load + self.sticky_slack:
+            return sticky
+        # 负载相同的节点轮流分配
+        least = [b for b in candidates if b.load == min_load]
+        backend = least[self._next % len(least)]
+        self._next += 1
+        return backend
+
+    @contextmanager
+    def track(self, backend: ComfyUIBackend) -> Iterator[ComfyUIBackend]:
+        """统计节点上的在途prompt"""
+        backend.in_flight += 1
+        backend.submitted += 1
+        try:
+            yield backend
+        finally:
+            backend.in_flight -= 1
+
+    def mark_success(self, backend: ComfyUIBackend):
+        backend.consecutive_failures = 0
+
+    def mark_failure(self, backend: ComfyUIBackend):
+        """记录节点失败，连续失败达到阈值时剔除"""
+        backend.failures += 1
+        backend.consecutive_failures += 1
+        if backend.consecutive_failures >= self.failure_threshold and backend.healthy:
+            backend.ejected_until = time.monotonic() + self.eject_seconds
+            logger.warning(f"ComfyUI 节点连续失败 {backend.consecutive_failures} 次，暂时剔除: {backend.url}")
+
+    async def start(self, http: aiohttp.ClientSession, events: bool = True):
+        """启动健康检查和各节点的事件流"""
+        self._http = http
+        self._events_enabled = events
+        if events:
+            for backend in self.backends:
+                await backend.events.start(http)
+        await self.check_health()
+        if self._health_task is None and self.health_interval > 0:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def stop(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+        if self._events_enabled:
+            for backend in self.backends:
+                await backend.events.stop()
+
+    async def check_health(self):
+        """查询所有节点的队列深度"""
+        await asyncio.gather(*(self._check_backend(b) for b in self.backends))
+
+    async def _check_backend(self, backend: ComfyUIBackend):
+        try:
+            timeout = aiohttp.ClientTimeout(total=self.health_timeout)
+            async with self._http.get(f"{backend.url}/api/queue", timeout=timeout) as response:
+                if response.status != 200:
+                    raise aiohttp.ClientResponseError(
+                        response.request_info, response.history, status=response.status
+                    )
+                data = await response.json()
+        except Exception as e:
+            logger.warning(f"ComfyUI 节点健康检查失败: {backend.url}, {str(e)}")
+            self.mark_failure(backend)
+            return
+        backend.queue_depth = len(data.get("queue_running", [])) + len(data.get("queue_pending", []))
+        backend.last_check = time.monotonic()
+        if not backend.healthy:
+            logger.info(f"ComfyUI 节点已恢复: {backend.url}")
+        backend.ejected_until = 0.0
+        self.mark_success(backend)
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            try:
+                await self.check_health()
+            except Exception as e:
+                logger.error(f"ComfyUI 健康检查出错: {str(e)}")
+
+    def get_stats(self) -> List[Dict[str, Any]]:
+        return [backend.get_stats() for backend in self.backends]
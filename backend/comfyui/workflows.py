@@ -0,0 +1,214 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple, Any
+
+logger = logging.getLogger(__name__)
+
+IMAGE_PLACEHOLDER = "PLACEHOLDER_PATH"
+SAMPLER_SEED_INPUTS = ("seed", "noise_seed")
+# 模板中声明输入图像要求的字段，仅供服务端预处理使用，不提交给ComfyUI
+INPUT_SPEC_KEY = "input"
+
+
+class ImageInputSpec:
+    """工作流对输入草图的要求
+
+    模板中的写法::
+
+        "input": {"width": 1024, "height": 1024, "multiple": 64, "mode": "RGB"}
+
+    草图按比例缩小到不超过 ``width`` x ``height``，边长取 ``multiple`` 的整数倍，
+    转换为 ``mode`` 像素格式。``upscale`` 为true时较小的草图也放大到目标尺寸。
+    """
+
+    __slots__ = ("width", "height", "multiple", "mode", "upscale")
+
+    def __init__(self, width: int, height: int, multiple: int = 8, mode: str = "RGB", upscale: bool = False):
+        if width <= 0 or height <= 0 or multiple <= 0:
+            raise ValueError(f"无效的输入图像尺寸: {width}x{height}/{multiple}")
+        self.width = width
+        self.height = height
+        self.multiple = multiple
+        self.mode = mode
+        self.upscale = upscale
+
+    @classmethod
+    def from_document(cls, document: Dict[str, Any]) -> Optional["ImageInputSpec"]:
+        spec = document.get(INPUT_SPEC_KEY)
+        if not spec:
+            return None
+        return cls(
+            int(spec["width"]),
+            int(spec["height"]),
+            int(spec.get("multiple", 8)),
+            str(spec.get("mode", "RGB")),
+            bool(spec.get("upscale", False)),
+        )
+
+
+class WorkflowTemplate:
+    """预解析的工作流模板
+
+    加载时记录需要按任务替换的输入位置（LoadImage占位符、采样器种子、正向提示词），
+    生成任务工作流时只复制这些节点，其余节点与模板共享，调用方不得修改。
+    """
+
+    __slots__ = (
+        "name", "path", "stamp", "digest", "document", "input_spec", "image_inputs", "seed_inputs", "text_inputs"
+    )
+
+    def __init__(self, name: str, path: str, stamp: Tuple[int, int], document: Dict[str, Any], digest: str = ""):
+        self.name = name
+        self.path = path
+        # (st_mtime_ns, st_size)，用于判断文件是否变化
+        self.stamp = stamp
+        # 模板内容摘要，模板修改后结果缓存随之失效
+        self.digest = digest
+        self.document = document
+        self.input_spec = ImageInputSpec.from_document(document)
+        self.image_inputs: List[Tuple[str, str]] = []
+        self.seed_inputs: List[Tuple[str, str]] = []
+        self.text_inputs: List[Tuple[str, str]] = []
+        self._index()
+
+    @property
+    def prompt(self) -> Dict[str, Any]:
+        return self.document["prompt"]
+
+    def _index(self):
+        """记录需要替换的节点输入"""
+        prompt = self.prompt
+        for node_id, node in prompt.items():
+            inputs = node.get("inputs") or {}
+            class_type = node.get("class_type")
+            if class_type == "LoadImage" and inputs.get("image") == IMAGE_PLACEHOLDER:
+                self.image_inputs.append((node_id, "image"))
+            for key in SAMPLER_SEED_INPUTS:
+                if key in inputs and isinstance(inputs[key], int):
+                    self.seed_inputs.append((node_id, key))
+            # 正向提示词：采样器 positive 输入连接的文本编码节点
+            positive = inputs.get("positive")
+            if isinstance(positive, list) and positive:
+                source_id = str(positive[0])
+                source = prompt.get(source_id, {})
+                if "text" in source.get("inputs", {}) and (source_id, "text") not in self.text_inputs:
+                    self.text_inputs.append((source_id, "text"))
+
+    def build(
+        self,
+        image: str,
+        seed: Optional[int] = None,
+        positive_prompt: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """生成任务工作流（写时复制，仅复制被替换的节点）"""
+        patches: Dict[str, Dict[str, Any]] = {}
+        for node_id, key in self.image_inputs:
+            patches.setdefault(node_id, {})[key] = image
+        if seed is not None:
+            for node_id, key in self.seed_inputs:
+                patches.setdefault(node_id, {})[key] = seed
+        if positive_prompt is not None:
+            for node_id, key in self.text_inputs:
+                patches.setdefault(node_id, {})[key] = positive_prompt
+
+        prompt = dict(self.prompt)
+        for node_id, values in patches.items():
+            node = dict(prompt[node_id])
+            node["inputs"] = {**node["inputs"], **values}
+            prompt[node_id] = node
+
+        workflow = dict(self.document)
+        workflow.pop(INPUT_SPEC_KEY, None)
+        workflow["prompt"] = prompt
+        return workflow
+
+
+class WorkflowTemplateCache:
+    """工作流模板缓存
+
+    首次访问时加载目录下的所有模板，之后按 ``check_interval`` 节流检查文件修改时间，
+    有新增、删除或修改时自动重新加载对应模板。
+    """
+
+    def __init__(self, workflow_dir: str, default_style: str = "realistic", check_interval: float = 2.0):
+        self.workflow_dir = workflow_dir
+        self.default_style = default_style
+        self.check_interval = check_interval
+        self._templates: Dict[str, WorkflowTemplate] = {}
+        self._last_check: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def styles(self) -> List[str]:
+        """可用的风格列表"""
+        self._refresh_if_due()
+        return sorted(self._templates)
+
+    def get(self, style_name: str) -> Optional[WorkflowTemplate]:
+        """获取风格模板，不存在时回退到默认风格"""
+        self._refresh_if_due()
+        return self._templates.get(style_name) or self._templates.get(self.default_style)
+
+    def build(self, style_name: str, image: str, **params) -> Dict[str, Any]:
+        """按风格生成任务工作流"""
+        template = self.get(style_name)
+        if template is None:
+            raise FileNotFoundError(f"未找到工作流模板: {style_name}")
+        return template.build(image, **params)
+
+    def reload(self):
+        """立即检查并重新加载有变化的模板"""
+        with self._lock:
+            self._last_check = time.monotonic()
+            self._scan()
+
+    def _refresh_if_due(self):
+        if self._last_check is None or time.monotonic() - self._last_check >= self.check_interval:
+            self.reload()
+
+    def _scan(self):
+        """对比目录中的文件与缓存，加载变化的模板"""
+        try:
+            entries = [
+                entry for entry in os.scandir(self.workflow_dir)
+                if entry.is_file() and entry.name.endswith(".json")
+            ]
+        except FileNotFoundError:
+            logger.error(f"工作流目录不存在: {self.workflow_dir}")
+            self._templates = {}
+            return
+
+        templates = {}
+        for entry in entries:
+            name = entry.name[:-len(".json")]
+            stat = entry.stat()
+            stamp = (stat.st_mtime_ns, stat.st_size)
+            cached = self._templates.get(name)
+            if cached is not None and cached.stamp == stamp:
+                templates[name] = cached
+                continue
+            template = self._load(name, entry.path, stamp)
+            if template is not None:
+                templates[name] = template
+            elif cached is not None:
+                # 新版本无法解析时保留旧模板
+                templates[name] = cached
+
+        for name in set(self._templates) - set(templates):
+            logger.info(f"工作流模板已移除: {name}")
+        self._templates = templates
+
+    def _load(self, name: str, path: str, stamp: Tuple[int, int]) -> Optional[WorkflowTemplate]:
+        try:
+            with open(path, "rb") as f:
+                raw = f.read()
+            document = json.loads(raw)
+            template = WorkflowTemplate(name, path, stamp, document, hashlib.sha256(raw).hexdigest())
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.error(f"加载工作流模板失败: {path}, {str(e)}")
+            return None
+        logger.info(f"已加载工作流模板: {name}")
+        return template
@@ -1,12 +1,66 @@
 from .config import monitoring_settings
 from .logger import app_logger
-from .metrics import metrics_collector
+from .metrics import MetricsCollector, metrics_collector
+from .timeseries import RollupSeries, TimeSeries
+from .sampler import ResourceSampler, ResourceSnapshot, resource_sampler
+from .prometheus import (
+    registry,
+    render_metrics,
+    UPLOAD_SECONDS,
+    SKETCH_DECODE_SECONDS,
+    WORKFLOW_BUILD_SECONDS,
+    COMFYUI_SUBMIT_SECONDS,
+    COMFYUI_QUEUE_WAIT_SECONDS,
+    COMFYUI_EXECUTION_SECONDS,
+    COMFYUI_RESULT_FETCH_SECONDS,
+    STROKE_TO_IMAGE_SECONDS,
+    ACTIVE_SESSIONS,
+    OPEN_WEBSOCKETS,
+    SESSION_MEMORY_BYTES,
+    PROMPTS_IN_FLIGHT,
+    SKETCH_CHANGE_CHECKS,
+    SKETCH_FINGERPRINT_SECONDS,
+    SKETCH_DEBOUNCE_SECONDS,
+    SKETCH_DEBOUNCE_WINDOW
+)
+from .tracing import Span, Trace, Tracer, TraceContextFilter, current_trace, to_otlp, tracer
 from .middleware import MonitoringMiddleware, ResourceMonitoringMiddleware
 
 __all__ = [
     'monitoring_settings',
     'app_logger',
+    'MetricsCollector',
     'metrics_collector',
+    'RollupSeries',
+    'TimeSeries',
+    'ResourceSampler',
+    'ResourceSnapshot',
+    'resource_sampler',
+    'registry',
+    'render_metrics',
+    'UPLOAD_SECONDS',
+    'SKETCH_DECODE_SECONDS',
+    'WORKFLOW_BUILD_SECONDS',
+    'COMFYUI_SUBMIT_SECONDS',
+    'COMFYUI_QUEUE_WAIT_SECONDS',
+    'COMFYUI_EXECUTION_SECONDS',
+    'COMFYUI_RESULT_FETCH_SECONDS',
+    'STROKE_TO_IMAGE_SECONDS',
+    'ACTIVE_SESSIONS',
+    'OPEN_WEBSOCKETS',
+    'SESSION_MEMORY_BYTES',
+    'PROMPTS_IN_FLIGHT',
+    'SKETCH_CHANGE_CHECKS',
+    'SKETCH_FINGERPRINT_SECONDS',
+    'SKETCH_DEBOUNCE_SECONDS',
+    'SKETCH_DEBOUNCE_WINDOW',
+    'Span',
+    'Trace',
+    'Tracer',
+    'TraceContextFilter',
+    'current_trace',
+    'to_otlp',
+    'tracer',
     'MonitoringMiddleware',
     'ResourceMonitoringMiddleware'
 ] 
\ No newline at end of file
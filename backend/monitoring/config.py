@@ -1,4 +1,7 @@
-from pydantic import BaseSettings
+try:
+    from pydantic.v1 import BaseSettings
+except ImportError:  # pydantic<2
+    from pydantic import BaseSettings
 import os
 from typing import Dict, Any
 
@@ -17,6 +20,11 @@ class MonitoringSettings(BaseSettings):
     METRICS_INTERVAL: int = 60  # 60秒
     METRICS_RETENTION_DAYS: int = 7
     
+    # 追踪配置
+    TRACING_ENABLED: bool = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+    TRACE_BUFFER_SIZE: int = int(os.getenv("TRACE_BUFFER_SIZE", "200"))  # 保留最近的trace数量
+    TRACE_EXPORT_FILE: str = os.getenv("TRACE_EXPORT_FILE", "")  # OTLP JSON行文件，为空则不导出
+    
     # 错误跟踪配置
     ENABLE_ERROR_TRACKING: bool = True
     ERROR_NOTIFICATION_EMAIL: str = os.getenv("ERROR_NOTIFICATION_EMAIL", "")
@@ -24,6 +32,7 @@ class MonitoringSettings(BaseSettings):
     # 资源监控配置
     ENABLE_RESOURCE_MONITORING: bool = True
     RESOURCE_CHECK_INTERVAL: int = 300  # 5分钟
+    RESOURCE_SAMPLE_INTERVAL: float = float(os.getenv("RESOURCE_SAMPLE_INTERVAL", "5"))  # 后台资源采样间隔（秒）
     RESOURCE_THRESHOLD: Dict[str, float] = {
         "cpu_percent": 80.0,
         "memory_percent": 80.0,
@@ -1 +1,30 @@
- 
\ No newline at end of file
+import logging
+from typing import Any
+
+
+class AppLogger:
+    """应用日志记录器，支持以关键字参数附加结构化字段"""
+
+    def __init__(self, name: str = "app"):
+        self.logger = logging.getLogger(name)
+
+    def _log(self, level: int, message: str, exc_info: bool = False, **fields: Any):
+        if fields:
+            message = f"{message} " + " ".join(f"{key}={value}" for key, value in fields.items())
+        self.logger.log(level, message, exc_info=exc_info)
+
+    def debug(self, message: str, **fields: Any):
+        self._log(logging.DEBUG, message, **fields)
+
+    def info(self, message: str, **fields: Any):
+        self._log(logging.INFO, message, **fields)
+
+    def warning(self, message: str, **fields: Any):
+        self._log(logging.WARNING, message, **fields)
+
+    def error(self, message: str, exc_info: bool = False, **fields: Any):
+        self._log(logging.ERROR, message, exc_info=exc_info, **fields)
+
+
+# 创建全局日志记录器实例
+app_logger = AppLogger()
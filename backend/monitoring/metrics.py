@@ -1,73 +1,82 @@
-import psutil
 import time
-from datetime import datetime, timedelta
-from typing import Dict, List, Any
+from datetime import datetime
+from typing import Dict, Any, Optional, Sequence, Tuple
 from .config import monitoring_settings
 from .logger import app_logger
+from .sampler import ResourceSnapshot, resource_sampler
+from .timeseries import TimeSeries
+
+# 按时间汇总的指标序列
+SERIES_NAMES = ("cpu_percent", "memory_percent", "disk_percent", "request_duration", "request_errors")
+
+
+def default_tiers() -> Tuple[Tuple[float, int], ...]:
+    """1秒粒度保留1小时，1分钟粒度保留1天，1小时粒度保留 METRICS_RETENTION_DAYS 天"""
+    return ((1, 3600), (60, 1440), (3600, 24 * monitoring_settings.METRICS_RETENTION_DAYS))
 
 class MetricsCollector:
-    """性能指标收集器"""
+    """性能指标收集器
     
-    def __init__(self):
-        self.metrics: Dict[str, List[Dict[str, Any]]] = {
-            "cpu": [],
-            "memory": [],
-            "disk": [],
-            "network": [],
-            "requests": []
+    指标写入预分配的多粒度环形缓冲区（见 ``TimeSeries``），内存占用固定，
+    写入为 O(1)，"最近N分钟"之类的窗口查询只读取固定数量的汇总桶。
+    """
+    
+    def __init__(self, tiers: Optional[Sequence[Tuple[float, int]]] = None):
+        tiers = tiers or default_tiers()
+        self.series: Dict[str, TimeSeries] = {name: TimeSeries(tiers) for name in SERIES_NAMES}
+        # 各类系统指标的最新值
+        self.latest: Dict[str, Dict[str, Any]] = {
+            "cpu": {},
+            "memory": {},
+            "disk": {},
+            "network": {}
         }
         self.start_time = time.time()
     
     def collect_system_metrics(self):
-        """收集系统指标"""
+        """记录后台采样器发布的最新系统指标（不在调用方线程中采样）"""
+        self.record_system_metrics(resource_sampler.snapshot)
+    
+    def record_system_metrics(self, snapshot: ResourceSnapshot):
+        """记录一次系统资源快照"""
         try:
-            # CPU指标
-            cpu_percent = psutil.cpu_percent(interval=1)
-            cpu_count = psutil.cpu_count()
-            
-            # 内存指标
-            memory = psutil.virtual_memory()
-            
-            # 磁盘指标
-            disk = psutil.disk_usage('/')
-            
-            # 网络指标
-            net_io = psutil.net_io_counters()
-            
-            timestamp = datetime.now()
+            if not snapshot.timestamp:
+                return
+            timestamp = datetime.fromtimestamp(snapshot.timestamp)
             
             # 存储指标
-            self.metrics["cpu"].append({
+            self.latest["cpu"] = {
                 "timestamp": timestamp,
-                "percent": cpu_percent,
-                "count": cpu_count
-            })
+                "percent": snapshot.cpu_percent,
+                "count": snapshot.cpu_count
+            }
             
-            self.metrics["memory"].append({
+            self.latest["memory"] = {
                 "timestamp": timestamp,
-                "total": memory.total,
-                "available": memory.available,
-                "percent": memory.percent
-            })
+                "total": snapshot.memory_total,
+                "available": snapshot.memory_available,
+                "percent": snapshot.memory_percent
+            }
             
-            self.metrics["disk"].append({
+            self.latest["disk"] = {
                 "timestamp": timestamp,
-                "total": disk.total,
-                "used": disk.used,
-                "free": disk.free,
-                "percent": disk.percent
-            })
+                "total": snapshot.disk_total,
+                "used": snapshot.disk_used,
+                "free": snapshot.disk_free,
+                "percent": snapshot.disk_percent
+            }
             
-            self.metrics["network"].append({
+            self.latest["network"] = {
                 "timestamp": timestamp,
-                "bytes_sent": net_io.bytes_sent,
-                "bytes_recv": net_io.bytes_recv,
-                "packets_sent": net_io.packets_sent,
-                "packets_recv": net_io.packets_recv
-            })
+                "bytes_sent": snapshot.net_bytes_sent,
+                "bytes_recv": snapshot.net_bytes_recv,
+                "packets_sent": snapshot.net_packets_sent,
+                "packets_recv": snapshot.net_packets_recv
+            }
             
-            # 清理旧数据
-            self._cleanup_old_metrics()
+            self.series["cpu_percent"].add(snapshot.cpu_percent, snapshot.timestamp)
+            self.series["memory_percent"].add(snapshot.memory_percent, snapshot.timestamp)
+            self.series["disk_percent"].add(snapshot.disk_percent, snapshot.timestamp)
             
         except Exception as e:
             app_logger.error(f"收集系统指标时出错: {str(e)}")
@@ -75,16 +84,16 @@ class MetricsCollector:
     def record_request(self, path: str, method: str, status_code: int, duration: float):
         """记录请求指标"""
         try:
-            self.metrics["requests"].append({
-                "timestamp": datetime.now(),
-                "path": path,
-                "method": method,
-                "status_code": status_code,
-                "duration": duration
-            })
+            now = time.time()
+            self.series["request_duration"].add(duration, now)
+            self.series["request_errors"].add(1.0 if status_code >= 500 else 0.0, now)
         except Exception as e:
             app_logger.error(f"记录请求指标时出错: {str(e)}")
     
+    def get_window(self, name: str, seconds: float) -> Dict[str, Any]:
+        """汇总某个指标最近 ``seconds`` 秒的数据（count/sum/avg/min/max）"""
+        return self.series[name].aggregate(seconds)
+    
     def get_metrics_summary(self) -> Dict[str, Any]:
         """获取指标摘要"""
         try:
@@ -95,7 +104,7 @@ class MetricsCollector:
                 "disk": self._get_latest_metric("disk"),
                 "network": self._get_latest_metric("network"),
                 "requests": {
-                    "total": len(self.metrics["requests"]),
+                    "total": self.series["request_duration"].total,
                     "recent": self._get_recent_requests()
                 }
             }
@@ -105,27 +114,21 @@ class MetricsCollector:
     
     def _get_latest_metric(self, metric_type: str) -> Dict[str, Any]:
         """获取最新的指标数据"""
-        if not self.metrics[metric_type]:
-            return {}
-        return self.metrics[metric_type][-1]
+        return self.latest[metric_type]
     
-    def _get_recent_requests(self, minutes: int = 5) -> List[Dict[str, Any]]:
-        """获取最近的请求记录"""
-        cutoff = datetime.now() - timedelta(minutes=minutes)
-        return [
-            req for req in self.metrics["requests"]
-            if req["timestamp"] > cutoff
-        ]
-    
-    def _cleanup_old_metrics(self):
-        """清理旧的指标数据"""
-        cutoff = datetime.now() - timedelta(days=monitoring_settings.METRICS_RETENTION_DAYS)
-        
-        for metric_type in self.metrics:
-            self.metrics[metric_type] = [
-                metric for metric in self.metrics[metric_type]
-                if metric["timestamp"] > cutoff
-            ]
+    def _get_recent_requests(self, minutes: int = 5) -> Dict[str, Any]:
+        """获取最近的请求汇总"""
+        window = minutes * 60
+        durations = self.get_window("request_duration", window)
+        errors = self.get_window("request_errors", window)
+        return {
+            "count": durations["count"],
+            "avg_duration": durations["avg"],
+            "max_duration": durations["max"],
+            "errors": int(errors["sum"]),
+            "error_rate": errors["avg"]
+        }
 
 # 创建全局指标收集器实例
-metrics_collector = MetricsCollector() 
\ No newline at end of file
+metrics_collector = MetricsCollector()
+resource_sampler.add_listener(metrics_collector.record_system_metrics)
@@ -4,6 +4,7 @@ import time
 from .config import monitoring_settings
 from .logger import app_logger
 from .metrics import metrics_collector
+from .sampler import resource_sampler
 
 class MonitoringMiddleware(BaseHTTPMiddleware):
     """监控中间件"""
@@ -52,20 +53,17 @@ class ResourceMonitoringMiddleware(BaseHTTPMiddleware):
     async def dispatch(self, request: Request, call_next):
         if monitoring_settings.ENABLE_RESOURCE_MONITORING:
             try:
-                # 收集系统指标
-                metrics_collector.collect_system_metrics()
-                
-                # 检查资源使用情况
-                metrics = metrics_collector.get_metrics_summary()
+                # 读取后台采样器的最新快照，请求路径上不做采样
+                snapshot = resource_sampler.snapshot
                 
                 # 检查是否超过阈值
-                if metrics.get("cpu", {}).get("percent", 0) > monitoring_settings.RESOURCE_THRESHOLD["cpu_percent"]:
+                if snapshot.cpu_percent > monitoring_settings.RESOURCE_THRESHOLD["cpu_percent"]:
                     app_logger.warning("CPU使用率超过阈值")
                 
-                if metrics.get("memory", {}).get("percent", 0) > monitoring_settings.RESOURCE_THRESHOLD["memory_percent"]:
+                if snapshot.memory_percent > monitoring_settings.RESOURCE_THRESHOLD["memory_percent"]:
                     app_logger.warning("内存使用率超过阈值")
                 
-                if metrics.get("disk", {}).get("percent", 0) > monitoring_settings.RESOURCE_THRESHOLD["disk_percent"]:
+                if snapshot.disk_percent > monitoring_settings.RESOURCE_THRESHOLD["disk_percent"]:
                     app_logger.warning("磁盘使用率超过阈值")
                 
             except Exception as e:
@@ -0,0 +1,68 @@
+from typing import Tuple
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+
+# 独立的注册表，只导出生成流水线相关指标
+registry = CollectorRegistry()
+
+# 覆盖毫秒级解码到分钟级生成
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+UPLOAD_SECONDS = Histogram(
+    "drawing_upload_seconds", "草图上传写盘耗时",
+    buckets=LATENCY_BUCKETS, registry=registry
+)
+SKETCH_DECODE_SECONDS = Histogram(
+    "drawing_sketch_decode_seconds", "草图解码/写盘耗时",
+    ["source"], buckets=LATENCY_BUCKETS, registry=registry
+)
+WORKFLOW_BUILD_SECONDS = Histogram(
+    "drawing_workflow_build_seconds", "工作流生成耗时",
+    buckets=LATENCY_BUCKETS, registry=registry
+)
+COMFYUI_SUBMIT_SECONDS = Histogram(
+    "drawing_comfyui_submit_seconds", "提交prompt到ComfyUI的耗时",
+    buckets=LATENCY_BUCKETS, registry=registry
+)
+COMFYUI_QUEUE_WAIT_SECONDS = Histogram(
+    "drawing_comfyui_queue_wait_seconds", "prompt在ComfyUI队列中等待执行的时间",
+    buckets=LATENCY_BUCKETS, registry=registry
+)
+COMFYUI_EXECUTION_SECONDS = Histogram(
+    "drawing_comfyui_execution_seconds", "ComfyUI执行prompt的时间",
+    buckets=LATENCY_BUCKETS, registry=registry
+)
+COMFYUI_RESULT_FETCH_SECONDS = Histogram(
+    "drawing_comfyui_result_fetch_seconds", "获取ComfyUI生成结果的耗时",
+    buckets=LATENCY_BUCKETS, registry=registry
+)
+STROKE_TO_IMAGE_SECONDS = Histogram(
+    "drawing_stroke_to_image_seconds", "从收到草图到推送结果的端到端延迟",
+    buckets=LATENCY_BUCKETS, registry=registry
+)
+
+ACTIVE_SESSIONS = Gauge("drawing_active_sessions", "活动会话数", registry=registry)
+OPEN_WEBSOCKETS = Gauge("drawing_open_websockets", "打开的WebSocket连接数", registry=registry)
+SESSION_MEMORY_BYTES = Gauge("drawing_session_memory_bytes", "会话记账的内存占用（草图与画布）", registry=registry)
+PROMPTS_IN_FLIGHT = Gauge("drawing_comfyui_prompts_in_flight", "已提交、尚未完成的ComfyUI prompt数", registry=registry)
+# 跳过率 = rate(..{result="skipped"}) / rate(..)
+SKETCH_CHANGE_CHECKS = Counter(
+    "drawing_sketch_change_checks", "草图变化检测结果：submitted 提交生成，skipped 变化过小沿用上次结果",
+    ["result"], registry=registry
+)
+SKETCH_FINGERPRINT_SECONDS = Histogram(
+    "drawing_sketch_fingerprint_seconds", "变化检测计算草图指纹的耗时",
+    buckets=LATENCY_BUCKETS, registry=registry
+)
+SKETCH_DEBOUNCE_SECONDS = Histogram(
+    "drawing_sketch_debounce_seconds", "草图从开始防抖到提交调度器的实际等待时间",
+    buckets=LATENCY_BUCKETS, registry=registry
+)
+SKETCH_DEBOUNCE_WINDOW = Gauge(
+    "drawing_sketch_debounce_window_seconds", "按当前队列负载计算的防抖窗口", registry=registry
+)
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """生成 Prometheus 文本格式的指标，返回 (内容, Content-Type)"""
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,140 @@
+import time
+import asyncio
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+import psutil
+
+from .config import monitoring_settings
+
+logger = logging.getLogger(__name__)
+
+
+class ResourceSnapshot:
+    """某一时刻的系统资源快照（不可变，读取无需加锁）"""
+
+    __slots__ = (
+        "timestamp",
+        "cpu_percent",
+        "cpu_count",
+        "memory_total",
+        "memory_available",
+        "memory_percent",
+        "disk_total",
+        "disk_used",
+        "disk_free",
+        "disk_percent",
+        "net_bytes_sent",
+        "net_bytes_recv",
+        "net_packets_sent",
+        "net_packets_recv",
+        "process_cpu_percent",
+        "process_memory_percent",
+        "process_rss",
+    )
+
+    def __init__(self, **values: Any):
+        for name in self.__slots__:
+            setattr(self, name, values.get(name, 0))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class ResourceSampler:
+    """后台系统资源采样器
+
+    按固定间隔在线程池中采集 CPU/内存/磁盘/网络指标并发布最新快照，
+    健康检查、清理任务和中间件直接读取 ``snapshot``，请求路径上不再调用
+    阻塞的 ``cpu_percent(interval=1)``。CPU 使用率为两次采样之间的平均值。
+    """
+
+    def __init__(self, interval: float = 5.0, disk_path: str = "/"):
+        self.interval = interval
+        self.disk_path = disk_path
+        self.snapshot = ResourceSnapshot()
+        self.samples = 0
+        self._process = psutil.Process()
+        self.process_start_time = self._process.create_time()
+        self._listeners: List[Callable[[ResourceSnapshot], None]] = []
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def add_listener(self, callback: Callable[[ResourceSnapshot], None]):
+        """注册采样回调（在事件循环中调用）"""
+        self._listeners.append(callback)
+
+    def sample(self) -> ResourceSnapshot:
+        """立即采集一次（非阻塞调用，可在线程中执行）"""
+        memory = psutil.virtual_memory()
+        disk = psutil.disk_usage(self.disk_path)
+        net_io = psutil.net_io_counters()
+        with self._process.oneshot():
+            process_cpu_percent = self._process.cpu_percent(interval=None)
+            process_memory_percent = self._process.memory_percent()
+            process_rss = self._process.memory_info().rss
+        snapshot = ResourceSnapshot(
+            timestamp=time.time(),
+            cpu_percent=psutil.cpu_percent(interval=None),
+            cpu_count=psutil.cpu_count(),
+            memory_total=memory.total,
+            memory_available=memory.available,
+            memory_percent=memory.percent,
+            disk_total=disk.total,
+            disk_used=disk.used,
+            disk_free=disk.free,
+            disk_percent=disk.percent,
+            net_bytes_sent=net_io.bytes_sent if net_io else 0,
+            net_bytes_recv=net_io.bytes_recv if net_io else 0,
+            net_packets_sent=net_io.packets_sent if net_io else 0,
+            net_packets_recv=net_io.packets_recv if net_io else 0,
+            process_cpu_percent=process_cpu_percent,
+            process_memory_percent=process_memory_percent,
+            process_rss=process_rss,
+        )
+        self.snapshot = snapshot
+        self.samples += 1
+        return snapshot
+
+    async def start(self):
+        """启动采样任务，返回前完成首次采样"""
+        if self.running:
+            return
+        await self._sample_once()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止采样任务"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self._sample_once()
+
+    async def _sample_once(self):
+        loop = asyncio.get_running_loop()
+        try:
+            snapshot = await loop.run_in_executor(None, self.sample)
+        except Exception as e:
+            logger.error(f"采集系统资源失败: {str(e)}")
+            return
+        for callback in self._listeners:
+            try:
+                callback(snapshot)
+            except Exception as e:
+                logger.error(f"资源采样回调出错: {str(e)}")
+
+
+# 创建全局资源采样器实例
+resource_sampler = ResourceSampler(interval=monitoring_settings.RESOURCE_SAMPLE_INTERVAL)
@@ -0,0 +1,126 @@
+import math
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# 默认汇总粒度：(桶宽秒数, 桶数)，1秒保留1小时，1分钟保留1天，1小时保留7天
+DEFAULT_TIERS: Tuple[Tuple[float, int], ...] = ((1, 3600), (60, 1440), (3600, 24 * 7))
+
+
+class RollupSeries:
+    """固定粒度的环形汇总缓冲区
+
+    每个桶保存该时间段内的 count/sum/min/max，数组预先分配，写入为 O(1)，
+    旧桶在环形覆盖时自动淘汰，内存占用与写入量无关。
+    """
+
+    def __init__(self, resolution: float, size: int):
+        self.resolution = resolution
+        self.size = size
+        self._bucket = np.full(size, -1, dtype=np.int64)
+        self._count = np.zeros(size, dtype=np.int64)
+        self._sum = np.zeros(size, dtype=np.float64)
+        self._min = np.full(size, np.inf, dtype=np.float64)
+        self._max = np.full(size, -np.inf, dtype=np.float64)
+
+    @property
+    def span(self) -> float:
+        """可覆盖的时间跨度（秒）"""
+        return self.resolution * self.size
+
+    def add(self, value: float, timestamp: float):
+        """写入一个数据点"""
+        bucket = int(timestamp // self.resolution)
+        slot = bucket % self.size
+        current = self._bucket[slot]
+        if current != bucket:
+            if current > bucket:
+                # 数据点早于缓冲区覆盖范围
+                return
+            self._bucket[slot] = bucket
+            self._count[slot] = 0
+            self._sum[slot] = 0.0
+            self._min[slot] = np.inf
+            self._max[slot] = -np.inf
+        self._count[slot] += 1
+        self._sum[slot] += value
+        if value < self._min[slot]:
+            self._min[slot] = value
+        if value > self._max[slot]:
+            self._max[slot] = value
+
+    def _window_mask(self, window: float, now: float) -> np.ndarray:
+        end = int(now // self.resolution)
+        start = end - max(1, math.ceil(window / self.resolution)) + 1
+        return (self._bucket >= start) & (self._bucket <= end)
+
+    def aggregate(self, window: float, now: float) -> Dict[str, Any]:
+        """汇总最近 ``window`` 秒（按桶对齐）的数据"""
+        mask = self._window_mask(window, now)
+        count = int(self._count[mask].sum())
+        if not count:
+            return {"count": 0, "sum": 0.0, "avg": 0.0, "min": 0.0, "max": 0.0}
+        total = float(self._sum[mask].sum())
+        return {
+            "count": count,
+            "sum": total,
+            "avg": total / count,
+            "min": float(self._min[mask].min()),
+            "max": float(self._max[mask].max()),
+        }
+
+    def history(self, window: float, now: float) -> List[Dict[str, Any]]:
+        """按时间顺序返回窗口内的非空桶"""
+        mask = self._window_mask(window, now) & (self._count > 0)
+        slots = np.flatnonzero(mask)
+        slots = slots[np.argsort(self._bucket[slots])]
+        return [
+            {
+                "timestamp": float(self._bucket[slot] * self.resolution),
+                "count": int(self._count[slot]),
+                "avg": float(self._sum[slot] / self._count[slot]),
+                "min": float(self._min[slot]),
+                "max": float(self._max[slot]),
+            }
+            for slot in slots
+        ]
+
+
+class TimeSeries:
+    """多粒度汇总的时间序列
+
+    每个数据点同时写入各粒度的环形缓冲区；查询时选择能覆盖窗口的最细粒度，
+    查询代价只与桶数有关，与写入的数据点数量无关。
+    """
+
+    def __init__(self, tiers: Sequence[Tuple[float, int]] = DEFAULT_TIERS):
+        self.tiers = [RollupSeries(resolution, size) for resolution, size in sorted(tiers)]
+        self.total = 0
+        self.last_value: Optional[float] = None
+        self.last_timestamp: Optional[float] = None
+
+    def add(self, value: float, timestamp: Optional[float] = None):
+        """写入一个数据点"""
+        if timestamp is None:
+            timestamp = time.time()
+        for tier in self.tiers:
+            tier.add(value, timestamp)
+        self.total += 1
+        self.last_value = value
+        self.last_timestamp = timestamp
+
+    def tier_for(self, window: float) -> RollupSeries:
+        """能覆盖窗口的最细粒度，超出全部范围时使用最粗粒度"""
+        for tier in self.tiers:
+            if tier.span >= window:
+                return tier
+        return self.tiers[-1]
+
+    def aggregate(self, window: float, now: Optional[float] = None) -> Dict[str, Any]:
+        """汇总最近 ``window`` 秒的数据"""
+        return self.tier_for(window).aggregate(window, time.time() if now is None else now)
+
+    def history(self, window: float, now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """最近 ``window`` 秒的分桶数据"""
+        return self.tier_for(window).history(window, time.time() if now is None else now)
@@ -0,0 +1,240 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+from .config import monitoring_settings
+
+logger = logging.getLogger(__name__)
+
+# 当前协程所属的 trace / span
+current_trace: ContextVar[Optional["Trace"]] = ContextVar("current_trace", default=None)
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+# OTLP 状态码：0=UNSET, 1=OK, 2=ERROR（被新草图取代的 trace 记为 UNSET）
+OTLP_STATUS_CODES = {"ok": 1, "error": 2}
+
+# 未启用追踪或不在 trace 中时复用同一个空上下文，避免额外分配
+_NULL_SPAN = nullcontext()
+
+
+class Span:
+    """trace 中的一个阶段"""
+
+    __slots__ = ("name", "span_id", "parent_id", "start", "end", "attributes")
+
+    def __init__(self, name: str, start: float, parent_id: Optional[str] = None, **attributes: Any):
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.start = start
+        self.end: Optional[float] = None
+        self.attributes = attributes
+
+    def to_dict(self, origin: float) -> Dict[str, Any]:
+        end = self.end if self.end is not None else time.time()
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "offset_ms": round((self.start - origin) * 1000, 3),
+            "duration_ms": round((end - self.start) * 1000, 3),
+            "attributes": self.attributes,
+        }
+
+
+class Trace:
+    """一张草图从收到到推送结果的完整过程"""
+
+    __slots__ = ("trace_id", "session_id", "start", "end", "status", "attributes", "spans", "marks")
+
+    def __init__(self, session_id: str, **attributes: Any):
+        self.trace_id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.start = time.time()
+        self.end: Optional[float] = None
+        self.status = "in_progress"
+        self.attributes = attributes
+        self.spans: List[Span] = []
+        # 命名时间点，用于之后补记跨越多个调用的阶段
+        self.marks: Dict[str, float] = {}
+
+    def mark(self, name: str):
+        """记录一个时间点"""
+        self.marks[name] = time.time()
+
+    def record(self, name: str, start: float, end: Optional[float] = None, **attributes: Any) -> Span:
+        """记录一个已知起止时间的阶段（例如排队等待）"""
+        parent = _current_span.get()
+        span = Span(name, start, parent.span_id if parent is not None else None, **attributes)
+        span.end = time.time() if end is None else end
+        self.spans.append(span)
+        return span
+
+    def to_dict(self) -> Dict[str, Any]:
+        end = self.end if self.end is not None else time.time()
+        return {
+            "trace_id": self.trace_id,
+            "session_id": self.session_id,
+            "status": self.status,
+            "start": self.start,
+            "duration_ms": round((end - self.start) * 1000, 3),
+            "attributes": self.attributes,
+            "spans": [span.to_dict(self.start) for span in self.spans],
+        }
+
+
+class Tracer:
+    """进程内轻量追踪
+
+    已完成的 trace 保存在长度固定的环形缓冲区中，可选追加导出为 OTLP JSON 行文件。
+    未启用时 ``start_trace`` 返回 None，``span`` 返回共享的空上下文，开销可忽略。
+    """
+
+    def __init__(self, enabled: bool = True, max_traces: int = 200, export_path: Optional[str] = None,
+                 service_name: str = "drawing-backend"):
+        self.enabled = enabled
+        self.export_path = export_path
+        self.service_name = service_name
+        self._traces: Deque[Trace] = deque(maxlen=max_traces)
+        self._export_lock = threading.Lock()
+
+    def start_trace(self, session_id: str, **attributes: Any) -> Optional[Trace]:
+        """开始新的 trace"""
+        if not self.enabled:
+            return None
+        return Trace(session_id, **attributes)
+
+    @contextmanager
+    def activate(self, trace: Optional[Trace]) -> Iterator[Optional[Trace]]:
+        """将 trace 设为当前上下文的 trace"""
+        token = current_trace.set(trace)
+        try:
+            yield trace
+        finally:
+            current_trace.reset(token)
+
+    def span(self, name: str, **attributes: Any):
+        """记录当前 trace 中的一个阶段，不在 trace 中时不做任何事"""
+        trace = current_trace.get()
+        if trace is None:
+            return _NULL_SPAN
+        return self._span(trace, name, attributes)
+
+    @contextmanager
+    def _span(self, trace: Trace, name: str, attributes: Dict[str, Any]) -> Iterator[Span]:
+        parent = _current_span.get()
+        span = Span(name, time.time(), parent.span_id if parent is not None else None, **attributes)
+        trace.spans.append(span)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.attributes["error"] = type(e).__name__
+            raise
+        finally:
+            span.end = time.time()
+            _current_span.reset(token)
+
+    def finish(self, trace: Optional[Trace], status: str = "ok"):
+        """结束 trace 并放入环形缓冲区"""
+        if trace is None or trace.end is not None:
+            return
+        trace.end = time.time()
+        trace.status = status
+        self._traces.append(trace)
+        if self.export_path:
+            try:
+                asyncio.get_running_loop().run_in_executor(None, self._export, trace)
+            except RuntimeError:
+                self._export(trace)
+
+    def recent(self, limit: int = 50, session_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """最近完成的 trace，新的在前"""
+        result = []
+        for trace in reversed(self._traces):
+            if session_id is not None and trace.session_id != session_id:
+                continue
+            result.append(trace.to_dict())
+            if len(result) >= limit:
+                break
+        return result
+
+    def _export(self, trace: Trace):
+        """以 OTLP/JSON 格式追加写入一行"""
+        try:
+            line = json.dumps(to_otlp(trace, self.service_name), ensure_ascii=False)
+            with self._export_lock:
+                with open(self.export_path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+        except Exception as e:
+            logger.error(f"导出 trace 失败: {str(e)}")
+
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    result = []
+    for key, value in attributes.items():
+        if isinstance(value, bool):
+            result.append({"key": key, "value": {"boolValue": value}})
+        elif isinstance(value, int):
+            result.append({"key": key, "value": {"intValue": str(value)}})
+        elif isinstance(value, float):
+            result.append({"key": key, "value": {"doubleValue": value}})
+        else:
+            result.append({"key": key, "value": {"stringValue": str(value)}})
+    return result
+
+
+def to_otlp(trace: Trace, service_name: str = "drawing-backend") -> Dict[str, Any]:
+    """转换为 OTLP/JSON 的 ResourceSpans 结构，根 span 代表整个 trace"""
+    root_id = trace.trace_id[:16]
+    end = trace.end if trace.end is not None else time.time()
+    spans = [{
+        "traceId": trace.trace_id,
+        "spanId": root_id,
+        "name": "sketch",
+        "startTimeUnixNano": str(int(trace.start * 1e9)),
+        "endTimeUnixNano": str(int(end * 1e9)),
+        "attributes": _otlp_attributes({"session_id": trace.session_id, "status": trace.status, **trace.attributes}),
+        "status": {"code": OTLP_STATUS_CODES.get(trace.status, 0)},
+    }]
+    for span in trace.spans:
+        spans.append({
+            "traceId": trace.trace_id,
+            "spanId": span.span_id,
+            "parentSpanId": span.parent_id or root_id,
+            "name": span.name,
+            "startTimeUnixNano": str(int(span.start * 1e9)),
+            "endTimeUnixNano": str(int((span.end or end) * 1e9)),
+            "attributes": _otlp_attributes(span.attributes),
+        })
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": _otlp_attributes({"service.name": service_name})},
+            "scopeSpans": [{"scope": {"name": "monitoring.tracing"}, "spans": spans}],
+        }]
+    }
+
+
+class TraceContextFilter(logging.Filter):
+    """为日志记录附加当前 trace_id"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        trace = current_trace.get()
+        record.trace_id = trace.trace_id if trace is not None else "-"
+        return True
+
+
+# 创建全局追踪器实例
+tracer = Tracer(
+    enabled=monitoring_settings.TRACING_ENABLED,
+    max_traces=monitoring_settings.TRACE_BUFFER_SIZE,
+    export_path=monitoring_settings.TRACE_EXPORT_FILE or None,
+)
@@ -0,0 +1,19 @@
+from .scheduler import JobScheduler, SchedulerFullError, SchedulerDrainingError
+from .result_cache import ResultCache, hash_file, make_result_key
+from .preprocess import fit_size, normalize_sketch
+from .fingerprint import SketchFingerprint, sketch_fingerprint
+from .debounce import AdaptiveDebounce
+
+__all__ = [
+    'JobScheduler',
+    'SchedulerFullError',
+    'SchedulerDrainingError',
+    'ResultCache',
+    'hash_file',
+    'make_result_key',
+    'fit_size',
+    'normalize_sketch',
+    'SketchFingerprint',
+    'sketch_fingerprint',
+    'AdaptiveDebounce'
+]
@@ -0,0 +1,47 @@
+from typing import Any, Dict, Optional
+
+
+class AdaptiveDebounce:
+    """根据生成队列负载自适应调整草图防抖窗口
+
+    空闲（有空闲槽位且无排队任务）时使用 ``min_window``，尽快出图；所有槽位都忙时，
+    新任务本来就要等待约 ``(排队数 + 1) / 并发数`` 个生成时间，此时按
+    ``load_factor`` 比例延长等待，让快速连续的笔画合并为一次提交，最长不超过 ``max_window``。
+    生成时间取最近若干次ComfyUI任务耗时的指数移动平均。
+    """
+
+    def __init__(self, min_window: float = 0.15, max_window: float = 2.0,
+                 load_factor: float = 0.5, smoothing: float = 0.2):
+        self.min_window = min_window
+        self.max_window = max(min_window, max_window)
+        self.load_factor = load_factor
+        self.smoothing = smoothing
+        self.latency: Optional[float] = None
+        self.last_window = min_window
+
+    def record_latency(self, seconds: float):
+        """记录一次生成耗时"""
+        if self.latency is None:
+            self.latency = seconds
+        else:
+            self.latency += self.smoothing * (seconds - self.latency)
+
+    def expected_wait(self, queue_depth: int, in_flight: int, max_in_flight: int) -> float:
+        """新任务现在提交时预计在调度队列中等待的时间"""
+        if self.latency is None or (in_flight < max_in_flight and queue_depth == 0):
+            return 0.0
+        return self.latency * (queue_depth + 1) / max(1, max_in_flight)
+
+    def window(self, queue_depth: int, in_flight: int, max_in_flight: int) -> float:
+        """当前负载下的防抖窗口（秒）"""
+        wait = self.expected_wait(queue_depth, in_flight, max_in_flight)
+        self.last_window = min(self.max_window, self.min_window + self.load_factor * wait)
+        return self.last_window
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "min_window": self.min_window,
+            "max_window": self.max_window,
+            "last_window": round(self.last_window, 6),
+            "latency_avg": round(self.latency, 6) if self.latency is not None else None,
+        }
@@ -0,0 +1,48 @@
+from typing import Tuple
+
+from PIL import Image, ImageChops
+
+# 指纹网格边长：64x64 灰度，每个会话约4KB
+FINGERPRINT_SIZE = 64
+# 透明草图合成到的背景灰度
+FINGERPRINT_BACKGROUND = 255
+
+
+class SketchFingerprint:
+    """草图的低分辨率灰度指纹，用于判断两次草图之间的变化是否值得重新生成
+
+    每个格子是原图对应区域的平均灰度，抗锯齿、光标点等细小差异在平均后基本消失，
+    新增的笔画则会使沿途的格子明显变化。
+    """
+
+    __slots__ = ("size", "pixels")
+
+    def __init__(self, size: Tuple[int, int], pixels: bytes):
+        self.size = size  # 原图尺寸，尺寸不同视为完全不同
+        self.pixels = pixels
+
+    def difference(self, other: "SketchFingerprint", pixel_delta: int = 8) -> float:
+        """灰度差超过 ``pixel_delta`` 的格子占比（0~1）"""
+        if self.size != other.size or len(self.pixels) != len(other.pixels):
+            return 1.0
+        grid = (FINGERPRINT_SIZE, len(self.pixels) // FINGERPRINT_SIZE)
+        diff = ImageChops.difference(Image.frombytes("L", grid, self.pixels), Image.frombytes("L", grid, other.pixels))
+        changed = diff.point(lambda value: 255 if value > pixel_delta else 0).histogram()[255]
+        return changed / len(self.pixels)
+
+
+def sketch_fingerprint(path: str) -> SketchFingerprint:
+    """计算草图文件的指纹（阻塞调用，需在线程池中执行）"""
+    with Image.open(path) as image:
+        size = image.size
+        # JPEG 可在解码时直接按 1/2~1/8 缩小
+        image.draft("L", (FINGERPRINT_SIZE * 4, FINGERPRINT_SIZE * 4))
+        if image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info):
+            image = image.convert("LA")
+            background = Image.new("L", image.size, FINGERPRINT_BACKGROUND)
+            background.paste(image.getchannel("L"), mask=image.getchannel("A"))
+            image = background
+        elif image.mode != "L":
+            image = image.convert("L")
+        grid = image.resize((FINGERPRINT_SIZE, FINGERPRINT_SIZE), Image.BOX, reducing_gap=2.0)
+        return SketchFingerprint(size, grid.tobytes())
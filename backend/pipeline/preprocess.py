@@ -0,0 +1,47 @@
+import logging
+from typing import Tuple
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# 透明草图合成到的背景色
+SKETCH_BACKGROUND = (255, 255, 255)
+# 逐级缩小的倍数阈值，大图先用 draft/reduce 降采样再做 LANCZOS，速度快且质量基本不变
+RESIZE_REDUCING_GAP = 3.0
+
+
+def fit_size(width: int, height: int, max_width: int, max_height: int,
+             multiple: int = 8, upscale: bool = False) -> Tuple[int, int]:
+    """按比例缩放到不超过 ``max_width`` x ``max_height``，边长向下取 ``multiple`` 的整数倍
+
+    ``upscale`` 为False时不放大，较小的图像只对齐到 ``multiple``。边长至少为一个 ``multiple``。
+    """
+    scale = min(max_width / width, max_height / height)
+    if not upscale:
+        scale = min(scale, 1.0)
+    target_width = max(multiple, int(width * scale) // multiple * multiple)
+    target_height = max(multiple, int(height * scale) // multiple * multiple)
+    return target_width, target_height
+
+
+def normalize_sketch(src_path: str, dst_path: str, max_width: int, max_height: int,
+                     multiple: int = 8, mode: str = "RGB", upscale: bool = False) -> Tuple[int, int]:
+    """将草图转换为工作流需要的尺寸和像素格式，保存为不含元数据的PNG
+
+    透明像素合成到白色背景上；返回输出图像的尺寸。阻塞调用，需在线程池中执行。
+    """
+    with Image.open(src_path) as image:
+        size = fit_size(image.width, image.height, max_width, max_height, multiple, upscale)
+        if image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info):
+            image = image.convert("RGBA")
+            background = Image.new("RGBA", image.size, SKETCH_BACKGROUND + (255,))
+            image = Image.alpha_composite(background, image)
+        if size != image.size:
+            image = image.resize(size, Image.LANCZOS, reducing_gap=RESIZE_REDUCING_GAP)
+        if image.mode != mode:
+            image = image.convert(mode)
+        # 低压缩级别：文件只在本机和ComfyUI之间传输一次，编码速度更重要
+        image.save(dst_path, format="PNG", compress_level=1)
+    logger.debug(f"草图已规范化: {src_path} -> {dst_path} {size[0]}x{size[1]} {mode}")
+    return size
@@ -0,0 +1,178 @@
+import os
+import shutil
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple, Any
+
+logger = logging.getLogger(__name__)
+
+RESULT_SUFFIX = ".png"
+
+
+def hash_file(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """计算文件内容的sha256"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def make_result_key(sketch_digest: str, style_name: str, workflow_digest: str, **params) -> str:
+    """由草图内容、风格和解析后的工作流（含种子等参数）生成缓存键"""
+    parts = [sketch_digest, style_name, workflow_digest]
+    parts.extend(f"{name}={params[name]}" for name in sorted(params) if params[name] is not None)
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+class ResultCacheStats:
+    """结果缓存统计"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stores = 0
+
+
+class ResultCache:
+    """基于内容寻址的生成结果缓存
+
+    结果文件以缓存键命名保存在 ``cache_dir`` 中，内存中维护 LRU 索引，
+    按条目数和总字节数淘汰最久未使用的结果。重启后从目录重建索引。
+    """
+
+    def __init__(self, cache_dir: str, max_entries: int = 1000, max_bytes: int = 1024 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.stats = ResultCacheStats()
+        self._index: "OrderedDict[str, Tuple[str, int]]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def load(self):
+        """从缓存目录重建索引，按访问时间恢复LRU顺序"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and entry.name.endswith(RESULT_SUFFIX):
+                stat = entry.stat()
+                entries.append((stat.st_atime, entry.name[:-len(RESULT_SUFFIX)], entry.path, stat.st_size))
+        with self._lock:
+            self._index.clear()
+            self._total_bytes = 0
+            for _, key, path, size in sorted(entries):
+                self._index[key] = (path, size)
+                self._total_bytes += size
+            self._evict()
+        logger.info(f"结果缓存已加载: {len(self._index)} 条, {self._total_bytes} 字节")
+
+    def owns(self, path: str) -> bool:
+        """判断文件是否属于缓存（会话清理时不应删除）"""
+        return os.path.dirname(os.path.abspath(path)) == os.path.abspath(self.cache_dir)
+
+    def get(self, key: str) -> Optional[str]:
+        """查找缓存结果，命中时返回结果文件路径"""
+        with self._lock:
+            return self._lookup(key)
+
+    def checkout(self, key: str, dest_path: str) -> Optional[str]:
+        """命中时将结果链接（跨文件系统时复制）到 ``dest_path`` 并返回该路径
+
+        调用方持有的是独立的文件名，之后缓存淘汰该条目也不影响已返回的结果。
+        """
+        with self._lock:
+            path = self._lookup(key)
+            if path is None:
+                return None
+            tmp_path = f"{dest_path}.tmp"
+            try:
+                try:
+                    os.link(path, tmp_path)
+                except OSError:
+                    shutil.copyfile(path, tmp_path)
+                os.replace(tmp_path, dest_path)
+            except OSError as e:
+                logger.error(f"取出缓存结果失败: {path}, {str(e)}")
+                return None
+        return dest_path
+
+    def put(self, key: str, result_path: str) -> Optional[str]:
+        """保存生成结果的副本，返回缓存文件路径"""
+        cache_path = os.path.join(self.cache_dir, f"{key}{RESULT_SUFFIX}")
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{cache_path}.tmp"
+            try:
+                os.link(result_path, tmp_path)
+            except OSError:
+                shutil.copyfile(result_path, tmp_path)
+            os.replace(tmp_path, cache_path)
+            size = os.path.getsize(cache_path)
+        except OSError as e:
+            logger.error(f"写入结果缓存失败: {result_path}, {str(e)}")
+            return None
+
+        with self._lock:
+            if key in self._index:
+                self._total_bytes -= self._index[key][1]
+            self._index[key] = (cache_path, size)
+            self._index.move_to_end(key)
+            self._total_bytes += size
+            self.stats.stores += 1
+            self._evict()
+        return cache_path
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计"""
+        lookups = self.stats.hits + self.stats.misses
+        return {
+            "entries": len(self._index),
+            "bytes": self._total_bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.stats.hits,
+            "misses": self.stats.misses,
+            "hit_rate": round(self.stats.hits / lookups, 4) if lookups else 0,
+            "evictions": self.stats.evictions,
+            "stores": self.stats.stores,
+        }
+
+    def _evict(self):
+        """淘汰最久未使用的结果直到满足容量限制"""
+        while self._index and (len(self._index) > self.max_entries or self._total_bytes > self.max_bytes):
+            key = next(iter(self._index))
+            path, _ = self._index[key]
+            self._drop(key)
+            self.stats.evictions += 1
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.error(f"删除缓存结果失败: {path}, {str(e)}")
+
+    def _lookup(self, key: str) -> Optional[str]:
+        entry = self._index.get(key)
+        if entry is not None and not os.path.exists(entry[0]):
+            # 文件被外部删除
+            self._drop(key)
+            entry = None
+        if entry is None:
+            self.stats.misses += 1
+            return None
+        self._index.move_to_end(key)
+        self.stats.hits += 1
+        return entry[0]
+
+    def _drop(self, key: str):
+        path, size = self._index.pop(key)
+        self._total_bytes -= size
@@ -0,0 +1,190 @@
+import asyncio
+import time
+import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class SchedulerFullError(Exception):
+    """调度队列已满"""
+
+
+class SchedulerDrainingError(SchedulerFullError):
+    """调度器正在停止，不再接受新任务"""
+
+
+class SchedulerStats:
+    """调度器统计"""
+
+    def __init__(self):
+        self.submitted = 0
+        self.rejected = 0
+        self.started = 0
+        self.completed = 0
+        self.failed = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.last_wait_seconds = 0.0
+
+    def record_wait(self, waited: float):
+        self.started += 1
+        self.last_wait_seconds = waited
+        self.wait_seconds_total += waited
+        self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+
+class QueuedJob:
+    """队列中的任务"""
+
+    __slots__ = ("factory", "enqueued_at")
+
+    def __init__(self, factory: Callable[[], Awaitable[Any]], enqueued_at: float):
+        self.factory = factory
+        self.enqueued_at = enqueued_at
+
+
+class JobScheduler:
+    """全局GPU任务调度器
+
+    每个会话（key）在队列中最多占一个位置、同一时间最多运行一个任务；
+    任务结束后重新提交的会话排到队尾，从而在会话之间轮转，避免单个用户占满 ComfyUI 队列。
+
+    多进程部署时可传入 ``limiter``（提供 ``async acquire() -> token`` 与
+    ``async release(token)``），任务开始前先取得全局许可，使所有 worker 合计的
+    在途任务数不超过上限。
+    """
+
+    def __init__(self, max_in_flight: int = 2, max_queue: int = 100, limiter: Any = None):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.limiter = limiter
+        self.stats = SchedulerStats()
+        self.draining = False
+        self._queue: "OrderedDict[str, QueuedJob]" = OrderedDict()
+        self._running: Dict[str, asyncio.Task] = {}
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._running)
+
+    def submit(self, key: str, factory: Callable[[], Awaitable[Any]]) -> int:
+        """提交任务，返回排队位置（0 表示已开始执行）
+
+        同一 key 已在排队时不会重复入队，任务执行时读取会话的最新状态。
+        """
+        if self.draining:
+            self.stats.rejected += 1
+            raise SchedulerDrainingError("调度器正在停止")
+        if key in self._queue:
+            return self.position(key)
+        if len(self._queue) >= self.max_queue:
+            self.stats.rejected += 1
+            raise SchedulerFullError(f"调度队列已满: {self.max_queue}")
+
+        self.stats.submitted += 1
+        self._queue[key] = QueuedJob(factory, time.monotonic())
+        self._dispatch()
+        return self.position(key)
+
+    def position(self, key: str) -> int:
+        """获取排队位置，从1开始；未排队返回0"""
+        for index, queued_key in enumerate(self._queue):
+            if queued_key == key:
+                return index + 1
+        return 0
+
+    def is_running(self, key: str) -> bool:
+        return key in self._running
+
+    def cancel(self, key: str) -> bool:
+        """移除排队中的任务"""
+        return self._queue.pop(key, None) is not None
+
+    async def drain(self, timeout: float) -> bool:
+        """停止接受新任务并丢弃排队任务，等待运行中的任务完成
+
+        超时后取消剩余任务，全部按时完成时返回True。
+        """
+        self.draining = True
+        dropped = len(self._queue)
+        self._queue.clear()
+        tasks = list(self._running.values())
+        if dropped or tasks:
+            logger.info(f"调度器停止中：丢弃 {dropped} 个排队任务，等待 {len(tasks)} 个运行中的任务")
+        if not tasks:
+            return True
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        if pending:
+            logger.warning(f"等待任务完成超时，取消 {len(pending)} 个任务")
+            await self.stop()
+        return not pending
+
+    async def stop(self):
+        """清空队列并取消运行中的任务"""
+        self._queue.clear()
+        tasks = list(self._running.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取调度统计"""
+        started = self.stats.started
+        return {
+            "queue_depth": self.queue_depth,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "submitted": self.stats.submitted,
+            "rejected": self.stats.rejected,
+            "completed": self.stats.completed,
+            "failed": self.stats.failed,
+            "wait_seconds_avg": round(self.stats.wait_seconds_total / started, 6) if started else 0,
+            "wait_seconds_max": round(self.stats.wait_seconds_max, 6),
+            "last_wait_seconds": round(self.stats.last_wait_seconds, 6),
+        }
+
+    def _next_key(self) -> Optional[str]:
+        """按入队顺序找到第一个没有任务在运行的会话"""
+        for key in self._queue:
+            if key not in self._running:
+                return key
+        return None
+
+    def _dispatch(self):
+        """在并发上限内启动排队任务"""
+        while len(self._running) < self.max_in_flight:
+            key = self._next_key()
+            if key is None:
+                return
+            job = self._queue.pop(key)
+            self._running[key] = asyncio.create_task(self._run(key, job))
+
+    async def _run(self, key: str, job: QueuedJob):
+        token = None
+        try:
+            if self.limiter is not None:
+                token = await self.limiter.acquire()
+            self.stats.record_wait(time.monotonic() - job.enqueued_at)
+            await job.factory()
+            self.stats.completed += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.stats.failed += 1
+            logger.error(f"调度任务执行失败: {key}, {str(e)}")
+        finally:
+            if token is not None:
+                try:
+                    await self.limiter.release(token)
+                except Exception as e:
+                    logger.error(f"释放全局任务许可失败: {key}, {str(e)}")
+            self._running.pop(key, None)
+            if not self.draining:
+                self._dispatch()
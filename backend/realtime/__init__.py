@@ -0,0 +1,35 @@
+from .frames import (
+    Frame,
+    FrameError,
+    FRAME_SKETCH_UPDATE,
+    FRAME_RESULT_IMAGE,
+    FRAME_CANVAS_KEYFRAME,
+    FRAME_CANVAS_PATCH,
+    encode_frame,
+    decode_frame,
+    encode_patch,
+    decode_patch,
+    detect_image_format
+)
+from .canvas import SketchCanvas, CanvasError
+from .imageinfo import ImageInfo, ImageHeaderError, read_image_info, validate_image_header
+
+__all__ = [
+    'Frame',
+    'FrameError',
+    'FRAME_SKETCH_UPDATE',
+    'FRAME_RESULT_IMAGE',
+    'FRAME_CANVAS_KEYFRAME',
+    'FRAME_CANVAS_PATCH',
+    'encode_frame',
+    'decode_frame',
+    'encode_patch',
+    'decode_patch',
+    'detect_image_format',
+    'SketchCanvas',
+    'CanvasError',
+    'ImageInfo',
+    'ImageHeaderError',
+    'read_image_info',
+    'validate_image_header'
+]
@@ -0,0 +1,103 @@
+import io
+import threading
+from typing import Tuple
+
+from PIL import Image
+
+# 草图保存时优先速度，草图内容简单，压缩率差异很小
+PNG_COMPRESS_LEVEL = 1
+
+
+class CanvasError(ValueError):
+    """画布更新错误"""
+
+
+def _open_image(data: bytes) -> Image.Image:
+    """解码图像字节"""
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.load()
+    except Exception as e:
+        raise CanvasError(f"无法解码图像: {str(e)}")
+    return image
+
+
+def _canvas_mode(image: Image.Image) -> str:
+    """画布像素格式：有透明通道时保留为RGBA，否则为RGB"""
+    if "A" in image.getbands() or "transparency" in image.info:
+        return "RGBA"
+    return "RGB"
+
+
+class SketchCanvas:
+    """服务端维护的会话画布
+
+    客户端先发送一帧完整画布（关键帧），之后只发送发生变化的矩形区域，
+    服务端将其合成到内存中的画布上，仅在开始生成时才编码为PNG写盘。
+    解码与写盘在线程池中执行，内部加锁保证合成与保存互斥。
+    """
+
+    def __init__(self, data: bytes, max_size: int = 4096):
+        self.max_size = max_size
+        # 每次修改递增，用于判断是否需要重新写盘
+        self.version = 0
+        self.saved_version = -1
+        self._lock = threading.Lock()
+        self._image = self._load_keyframe(data)
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        return self._image.size
+
+    @property
+    def nbytes(self) -> int:
+        """像素缓冲区占用的字节数"""
+        width, height = self._image.size
+        return width * height * len(self._image.getbands())
+
+    @property
+    def dirty(self) -> bool:
+        """自上次保存后是否有修改"""
+        return self.version != self.saved_version
+
+    def reset(self, data: bytes):
+        """用关键帧替换整个画布"""
+        image = self._load_keyframe(data)
+        with self._lock:
+            self._image = image
+            self.version += 1
+
+    def apply_patch(self, x: int, y: int, data: bytes) -> Tuple[int, int, int, int]:
+        """将脏矩形覆盖到画布的 (x, y) 处，返回更新区域 (x, y, width, height)"""
+        patch = _open_image(data)
+        width, height = patch.size
+        with self._lock:
+            canvas_width, canvas_height = self._image.size
+            if x + width > canvas_width or y + height > canvas_height:
+                raise CanvasError(
+                    f"更新区域超出画布: ({x}, {y}, {width}, {height}) > {canvas_width}x{canvas_height}"
+                )
+            if patch.mode != self._image.mode:
+                patch = patch.convert(self._image.mode)
+            # 脏矩形携带该区域的完整像素，直接覆盖（擦除也能正确同步）
+            self._image.paste(patch, (x, y))
+            self.version += 1
+        return x, y, width, height
+
+    def save(self, path: str) -> int:
+        """将画布写为PNG，返回保存的版本号"""
+        with self._lock:
+            image = self._image.copy()
+            version = self.version
+        image.save(path, format="PNG", compress_level=PNG_COMPRESS_LEVEL)
+        with self._lock:
+            self.saved_version = max(self.saved_version, version)
+        return version
+
+    def _load_keyframe(self, data: bytes) -> Image.Image:
+        image = _open_image(data)
+        width, height = image.size
+        if width > self.max_size or height > self.max_size:
+            raise CanvasError(f"画布尺寸超出限制: {width}x{height}")
+        mode = _canvas_mode(image)
+        return image if image.mode == mode else image.convert(mode)
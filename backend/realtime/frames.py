@@ -0,0 +1,77 @@
+import struct
+from typing import Optional, Tuple
+
+# 二进制帧格式（网络字节序，8字节头部）:
+#   version(uint8) | type(uint8) | flags(uint16) | seq(uint32) | payload
+FRAME_VERSION = 1
+FRAME_HEADER = struct.Struct(">BBHI")
+FRAME_HEADER_SIZE = FRAME_HEADER.size
+
+# 消息类型
+FRAME_SKETCH_UPDATE = 1  # 客户端 -> 服务端：完整画布 PNG/WebP
+FRAME_RESULT_IMAGE = 2  # 服务端 -> 客户端：生成结果图像
+FRAME_CANVAS_KEYFRAME = 3  # 客户端 -> 服务端：完整画布，建立服务端画布
+FRAME_CANVAS_PATCH = 4  # 客户端 -> 服务端：脏矩形增量更新
+
+# 增量更新载荷：x(uint16) | y(uint16) | 该矩形区域的 PNG/WebP
+PATCH_HEADER = struct.Struct(">HH")
+
+IMAGE_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"\xff\xd8\xff", "jpeg"),
+)
+
+
+class FrameError(ValueError):
+    """二进制帧格式错误"""
+
+
+class Frame:
+    """解析后的二进制帧"""
+
+    __slots__ = ("type", "seq", "flags", "payload")
+
+    def __init__(self, frame_type: int, seq: int, payload: bytes, flags: int = 0):
+        self.type = frame_type
+        self.seq = seq
+        self.flags = flags
+        self.payload = payload
+
+
+def encode_frame(frame_type: int, seq: int, payload: bytes, flags: int = 0) -> bytes:
+    """编码二进制帧"""
+    return FRAME_HEADER.pack(FRAME_VERSION, frame_type, flags, seq & 0xFFFFFFFF) + payload
+
+
+def decode_frame(data: bytes) -> Frame:
+    """解码二进制帧，载荷使用 memoryview 避免复制"""
+    if len(data) < FRAME_HEADER_SIZE:
+        raise FrameError("帧长度不足")
+    version, frame_type, flags, seq = FRAME_HEADER.unpack_from(data)
+    if version != FRAME_VERSION:
+        raise FrameError(f"不支持的帧版本: {version}")
+    return Frame(frame_type, seq, memoryview(data)[FRAME_HEADER_SIZE:], flags)
+
+
+def encode_patch(x: int, y: int, image: bytes) -> bytes:
+    """编码脏矩形载荷"""
+    return PATCH_HEADER.pack(x, y) + image
+
+
+def decode_patch(payload: bytes) -> Tuple[int, int, memoryview]:
+    """解码脏矩形载荷，返回 (x, y, 图像字节)"""
+    if len(payload) < PATCH_HEADER.size:
+        raise FrameError("增量更新长度不足")
+    x, y = PATCH_HEADER.unpack_from(payload)
+    return x, y, memoryview(payload)[PATCH_HEADER.size:]
+
+
+def detect_image_format(data: bytes) -> Optional[str]:
+    """根据文件头识别图像格式"""
+    head = bytes(data[:12])
+    for signature, image_format in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return image_format
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    return None
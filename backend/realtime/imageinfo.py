@@ -0,0 +1,116 @@
+import struct
+from typing import Optional
+
+from .frames import detect_image_format
+
+# 解析文件头时最多查看的字节数
+HEADER_SCAN_BYTES = 256 * 1024
+
+# 各格式对应的 MIME 类型
+IMAGE_MIME_TYPES = {
+    "png": "image/png",
+    "jpeg": "image/jpeg",
+    "webp": "image/webp",
+}
+
+# 带图像尺寸的 JPEG SOF 标记（不含 DHT/JPG/DAC）
+_JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+# 没有长度字段的 JPEG 标记
+_JPEG_STANDALONE_MARKERS = frozenset(range(0xD0, 0xD8)) | {0x01}
+
+
+class ImageHeaderError(ValueError):
+    """图像文件头无效或尺寸超出限制"""
+
+
+class ImageInfo:
+    """从文件头解析出的图像信息"""
+
+    __slots__ = ("format", "width", "height")
+
+    def __init__(self, image_format: str, width: int, height: int):
+        self.format = image_format
+        self.width = width
+        self.height = height
+
+    @property
+    def mime_type(self) -> str:
+        return IMAGE_MIME_TYPES[self.format]
+
+
+def _png_size(data: bytes):
+    # 签名之后第一个块必须是 IHDR：长度(4) | "IHDR" | 宽(4) | 高(4)
+    if len(data) < 24 or data[12:16] != b"IHDR":
+        return None
+    return struct.unpack(">II", data[16:24])
+
+
+def _jpeg_size(data: bytes):
+    offset = 2
+    while offset + 4 <= len(data):
+        if data[offset] != 0xFF:
+            return None
+        marker = data[offset + 1]
+        if marker == 0xFF:
+            # 填充字节
+            offset += 1
+            continue
+        if marker in _JPEG_STANDALONE_MARKERS:
+            offset += 2
+            continue
+        if marker in _JPEG_SOF_MARKERS:
+            if offset + 9 > len(data):
+                return None
+            height, width = struct.unpack(">HH", data[offset + 5:offset + 9])
+            return width, height
+        if marker == 0xDA:
+            # 扫描数据开始前没有出现 SOF
+            return None
+        length = struct.unpack(">H", data[offset + 2:offset + 4])[0]
+        if length < 2:
+            return None
+        offset += 2 + length
+    return None
+
+
+def _webp_size(data: bytes):
+    chunk = data[12:16]
+    if chunk == b"VP8 " and len(data) >= 30 and data[23:26] == b"\x9d\x01\x2a":
+        width, height = struct.unpack("<HH", data[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b"VP8L" and len(data) >= 25 and data[20] == 0x2F:
+        bits = int.from_bytes(data[21:25], "little")
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b"VP8X" and len(data) >= 30:
+        return int.from_bytes(data[24:27], "little") + 1, int.from_bytes(data[27:30], "little") + 1
+    return None
+
+
+_SIZE_READERS = {"png": _png_size, "jpeg": _jpeg_size, "webp": _webp_size}
+
+
+def read_image_info(data: bytes) -> Optional[ImageInfo]:
+    """只解析文件头得到格式和尺寸，不解码像素；无法识别时返回None
+
+    JPEG 的尺寸位于 SOF 段，需要 ``data`` 包含其之前的所有段（通常在前几十KB内）。
+    """
+    head = bytes(data[:HEADER_SCAN_BYTES])
+    image_format = detect_image_format(head)
+    if image_format is None:
+        return None
+    size = _SIZE_READERS[image_format](head)
+    if size is None:
+        return None
+    return ImageInfo(image_format, *size)
+
+
+def validate_image_header(data: bytes, max_size: int = 0) -> ImageInfo:
+    """校验图像文件头，格式不支持、文件头损坏或边长超过 ``max_size`` 时抛出 ImageHeaderError"""
+    if detect_image_format(data) is None:
+        raise ImageHeaderError("不支持的图像格式")
+    info = read_image_info(data)
+    if info is None or not info.width or not info.height:
+        raise ImageHeaderError("图像文件头无效")
+    if max_size and (info.width > max_size or info.height > max_size):
+        raise ImageHeaderError(f"图像尺寸超出限制: {info.width}x{info.height}")
+    return info
@@ -1,11 +1,13 @@
 from fastapi import Request, HTTPException
+from fastapi.responses import JSONResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from typing import Optional, List
-import time
+import math
 import jwt
 from datetime import datetime, timedelta
 import os
 from functools import wraps
+from sessions import MemorySessionStore, RateLimiter
 
 # 安全配置
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key")
@@ -16,31 +18,27 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 RATE_LIMIT_WINDOW = 60  # 1分钟
 RATE_LIMIT_MAX_REQUESTS = 100  # 最大请求数
 
-# 请求计数器
-request_counts = {}
-
 class RateLimitMiddleware:
-    """请求速率限制中间件"""
+    """请求速率限制中间件
+
+    按客户端IP滑动窗口计数，每个IP占用固定内存，空闲IP自动淘汰；
+    传入基于共享会话存储的限制器时多个 worker 合计计数。
+    """
+    
+    def __init__(self, limiter: Optional[RateLimiter] = None):
+        self.limiter = limiter or RateLimiter(
+            MemorySessionStore(), "http", RATE_LIMIT_MAX_REQUESTS, RATE_LIMIT_WINDOW
+        )
     
     async def __call__(self, request: Request, call_next):
-        client_ip = request.client.host
-        current_time = time.time()
-        
-        # 清理过期的请求记录
-        if client_ip in request_counts:
-            request_counts[client_ip] = [
-                t for t in request_counts[client_ip]
-                if current_time - t < RATE_LIMIT_WINDOW
-            ]
-        
-        # 检查请求次数
-        if client_ip in request_counts and len(request_counts[client_ip]) >= RATE_LIMIT_MAX_REQUESTS:
-            raise HTTPException(status_code=429, detail="请求过于频繁，请稍后再试")
-        
-        # 记录请求
-        if client_ip not in request_counts:
-            request_counts[client_ip] = []
-        request_counts[client_ip].append(current_time)
+        client_ip = request.client.host if request.client else "unknown"
+        retry_after = await self.limiter.acquire(client_ip)
+        if retry_after:
+            return JSONResponse(
+                status_code=429,
+                content={"detail": "请求过于频繁，请稍后再试"},
+                headers={"Retry-After": str(math.ceil(retry_after))}
+            )
         
         return await call_next(request)
 
@@ -84,11 +82,9 @@ def create_access_token(data: dict) -> str:
 
 def verify_file_type(file_content: bytes, allowed_types: List[str]) -> bool:
     """验证文件类型"""
-    import magic
+    from .validators import sniff_mime_type
     
-    mime = magic.Magic(mime=True)
-    file_type = mime.from_buffer(file_content)
-    return file_type in allowed_types
+    return sniff_mime_type(file_content) in allowed_types
 
 def verify_file_size(file_size: int, max_size: int) -> bool:
     """验证文件大小"""
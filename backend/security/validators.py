@@ -1,9 +1,28 @@
 from typing import List, Optional
 import re
+import threading
 import magic
 from fastapi import HTTPException
+from realtime import read_image_info
 from .config import security_settings
 
+# libmagic 句柄加载数据库开销较大且不是线程安全的，每个线程复用一个
+_magic_local = threading.local()
+
+def get_magic() -> "magic.Magic":
+    """当前线程的 MIME 识别句柄"""
+    handle = getattr(_magic_local, "handle", None)
+    if handle is None:
+        handle = _magic_local.handle = magic.Magic(mime=True)
+    return handle
+
+def sniff_mime_type(file_content: bytes) -> str:
+    """识别文件的 MIME 类型：PNG/JPEG/WebP 直接解析文件头，其他格式交给 libmagic"""
+    info = read_image_info(file_content)
+    if info is not None:
+        return info.mime_type
+    return get_magic().from_buffer(file_content)
+
 class SecurityValidator:
     """安全验证器类"""
     
@@ -16,9 +35,7 @@ class SecurityValidator:
     def validate_file_type(file_content: bytes) -> bool:
         """验证文件类型"""
         try:
-            mime = magic.Magic(mime=True)
-            file_type = mime.from_buffer(file_content)
-            return file_type in security_settings.ALLOWED_FILE_TYPES
+            return sniff_mime_type(file_content) in security_settings.ALLOWED_FILE_TYPES
         except Exception as e:
             raise HTTPException(status_code=400, detail=f"文件类型验证失败: {str(e)}")
     
@@ -0,0 +1,41 @@
+"""生产环境启动入口
+
+以多个 worker 进程运行应用（不启用热重载）。worker 之间通过共享会话存储同步会话、
+广播任务完成事件并共同遵守全局任务并发上限；使用内存会话存储时只能运行单个 worker。
+客户端IP由应用按 FORWARDED_ALLOW_IPS 解析 X-Forwarded-For 得到，因此关闭 uvicorn 自身的代理头改写。
+收到 SIGTERM 后停止接受新连接，关闭现有 WebSocket（客户端重连到其他实例），
+并在 SHUTDOWN_DRAIN_TIMEOUT 内等待运行中的生成任务完成。
+"""
+import logging
+
+import uvicorn
+
+from app import config
+
+logger = logging.getLogger(__name__)
+
+
+def resolve_workers(requested: int, session_store: str) -> int:
+    """确定实际启动的 worker 数"""
+    workers = max(1, requested)
+    if workers > 1 and session_store == "memory":
+        logger.warning("内存会话存储无法在进程间共享，仅启动 1 个 worker；多 worker 请设置 SESSION_STORE=redis")
+        return 1
+    return workers
+
+
+def main():
+    workers = resolve_workers(config.WORKERS, config.SESSION_STORE)
+    logger.info(f"启动服务: {config.HOST}:{config.PORT}, worker 数: {workers}")
+    uvicorn.run(
+        "app:app",
+        host=config.HOST,
+        port=config.PORT,
+        workers=workers,
+        proxy_headers=False,
+        timeout_graceful_shutdown=int(config.SHUTDOWN_DRAIN_TIMEOUT),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+from .store import (
+    SessionRecord,
+    SessionStore,
+    MemorySessionStore,
+    RedisSessionStore,
+    create_session_store
+)
+from .limiter import SlotLimiter, RateLimiter
+from .ratelimit import SlidingWindowCounter
+from .timers import TimerWheel
+from .memory import MEMORY_SKETCH, MEMORY_CANVAS, MemoryBudget, MemoryBudgetExceeded
+
+__all__ = [
+    'SessionRecord',
+    'SessionStore',
+    'MemorySessionStore',
+    'RedisSessionStore',
+    'create_session_store',
+    'SlotLimiter',
+    'RateLimiter',
+    'SlidingWindowCounter',
+    'TimerWheel',
+    'MEMORY_SKETCH',
+    'MEMORY_CANVAS',
+    'MemoryBudget',
+    'MemoryBudgetExceeded'
+]
@@ -0,0 +1,98 @@
+import uuid
+import asyncio
+import logging
+from typing import Any, Dict, Optional, Set
+
+from .store import SessionStore
+
+logger = logging.getLogger(__name__)
+
+
+class SlotLimiter:
+    """基于会话存储的跨进程并发限制
+
+    所有 worker 在同一个存储中竞争 ``limit`` 个位置，持有期间后台定期续约；
+    进程异常退出时其位置在租约到期后自动释放。未取得位置时按退避间隔重试。
+    """
+
+    def __init__(self, store: SessionStore, name: str, limit: int, lease: float = 30.0,
+                 poll_interval: float = 0.2):
+        self.store = store
+        self.name = name
+        self.limit = limit
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self._held: Set[str] = set()
+        self._renew_task: Optional[asyncio.Task] = None
+
+    @property
+    def held(self) -> int:
+        return len(self._held)
+
+    async def acquire(self) -> str:
+        """等待并占用一个位置，返回用于释放的令牌"""
+        token = uuid.uuid4().hex
+        delay = 0.01
+        while not await self.store.acquire_slot(self.name, token, self.limit, self.lease):
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.poll_interval)
+        self._held.add(token)
+        if self._renew_task is None or self._renew_task.done():
+            self._renew_task = asyncio.create_task(self._renew())
+        return token
+
+    async def release(self, token: str):
+        self._held.discard(token)
+        await self.store.release_slot(self.name, token)
+
+    async def _renew(self):
+        while self._held:
+            await asyncio.sleep(self.lease / 3)
+            try:
+                await self.store.renew_slots(self.name, self._held, self.lease)
+            except Exception as e:
+                logger.error(f"续约全局任务许可失败: {self.name}, {str(e)}")
+
+
+class RateLimiter:
+    """基于会话存储的速率限制
+
+    每个 key 在任意 ``window`` 秒内最多 ``limit`` 次（滑动窗口计数近似）。
+    使用共享存储时所有 worker 合计计数；存储不可用时放行，避免限流本身造成故障。
+    ``limit`` 不大于0时不限制。
+    """
+
+    def __init__(self, store: SessionStore, name: str, limit: float, window: float = 60.0):
+        self.store = store
+        self.name = name
+        self.limit = limit
+        self.window = window
+        self.allowed = 0
+        self.rejected = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.limit > 0
+
+    async def acquire(self, key: str, cost: float = 1) -> float:
+        """记录一次请求，允许时返回0，否则返回建议的重试等待秒数"""
+        if not self.enabled:
+            return 0.0
+        try:
+            retry_after = await self.store.hit_rate(self.name, key, self.limit, self.window, cost)
+        except Exception as e:
+            logger.error(f"速率限制检查失败，本次放行: {self.name}, {str(e)}")
+            retry_after = 0.0
+        if retry_after:
+            self.rejected += 1
+        else:
+            self.allowed += 1
+        return retry_after
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "limit": self.limit,
+            "window": self.window,
+            "allowed": self.allowed,
+            "rejected": self.rejected,
+        }
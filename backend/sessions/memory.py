@@ -0,0 +1,91 @@
+from typing import Dict, Optional
+
+# 会话占用内存的类别
+MEMORY_SKETCH = "sketch"  # 等待处理的草图数据
+MEMORY_CANVAS = "canvas"  # 服务端画布像素缓冲区
+
+
+class MemoryBudgetExceeded(Exception):
+    """会话内存超出单会话上限或全局预算"""
+
+
+class MemoryBudget:
+    """会话内存记账
+
+    按会话、按类别记录估算的内存占用（同一类别只保留最新的大小），并维护合计值。
+    ``max_bytes`` 为全局预算，``max_session_bytes`` 为单个会话上限，0 表示不限制。
+    是否淘汰其他会话为新数据腾出空间由调用方决定，这里只负责记账和判断。
+    """
+
+    def __init__(self, max_bytes: int = 0, max_session_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self.max_session_bytes = max_session_bytes
+        self.total = 0
+        self.rejected = 0
+        self._usage: Dict[str, Dict[str, int]] = {}
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._usage
+
+    def usage(self, session_id: str, kind: Optional[str] = None) -> int:
+        """会话（或其中某一类别）当前记录的字节数"""
+        charges = self._usage.get(session_id)
+        if not charges:
+            return 0
+        if kind is not None:
+            return charges.get(kind, 0)
+        return sum(charges.values())
+
+    def shortfall(self, session_id: str, kind: str, nbytes: int) -> int:
+        """将该类别记为 ``nbytes`` 时超出全局预算的字节数，不超出为0"""
+        if not self.max_bytes:
+            return 0
+        return max(0, self.total - self.usage(session_id, kind) + nbytes - self.max_bytes)
+
+    def check(self, session_id: str, kind: str, nbytes: int):
+        """检查单会话上限，超出时抛出 MemoryBudgetExceeded"""
+        if not self.max_session_bytes:
+            return
+        session_bytes = self.usage(session_id) - self.usage(session_id, kind) + nbytes
+        if session_bytes > self.max_session_bytes:
+            self.rejected += 1
+            raise MemoryBudgetExceeded(
+                f"会话内存超出上限: {session_bytes} > {self.max_session_bytes} 字节"
+            )
+
+    def charge(self, session_id: str, kind: str, nbytes: int):
+        """将会话该类别的占用记为 ``nbytes``，超出单会话上限或全局预算时抛出异常且不记账"""
+        self.check(session_id, kind, nbytes)
+        if self.shortfall(session_id, kind, nbytes):
+            self.rejected += 1
+            raise MemoryBudgetExceeded(f"会话内存总量超出预算: {self.max_bytes} 字节")
+        self.set(session_id, kind, nbytes)
+
+    def set(self, session_id: str, kind: str, nbytes: int):
+        """无条件记录占用（例如释放部分内存时）"""
+        charges = self._usage.setdefault(session_id, {})
+        self.total += nbytes - charges.get(kind, 0)
+        if nbytes:
+            charges[kind] = nbytes
+        else:
+            charges.pop(kind, None)
+            if not charges:
+                del self._usage[session_id]
+
+    def release(self, session_id: str) -> int:
+        """移除会话的全部记录，返回释放的字节数"""
+        charges = self._usage.pop(session_id, None)
+        if not charges:
+            return 0
+        freed = sum(charges.values())
+        self.total -= freed
+        return freed
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            "total_bytes": self.total,
+            "max_bytes": self.max_bytes,
+            "max_session_bytes": self.max_session_bytes,
+            "sessions": len(self._usage),
+            "rejected": self.rejected,
+        }
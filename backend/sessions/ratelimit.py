@@ -0,0 +1,69 @@
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable, List, Optional
+
+
+def window_retry_after(previous: float, current: float, elapsed: float, window: float,
+                       limit: float, cost: float = 1) -> float:
+    """滑动窗口计数的判定
+
+    当前窗口计数 ``current`` 加上按剩余比例折算的上一窗口计数 ``previous`` 作为最近
+    ``window`` 秒内的请求数估计，再加 ``cost`` 不超过 ``limit`` 时返回0（允许），
+    否则返回估计的重试等待秒数。
+    """
+    remaining = window - elapsed
+    over = previous * remaining / window + current + cost - limit
+    if over <= 0:
+        return 0.0
+    if previous > 0:
+        # 上一窗口的计数随时间线性衰减
+        wait = over * window / previous
+        if wait <= remaining:
+            return wait
+    return remaining
+
+
+class SlidingWindowCounter:
+    """进程内滑动窗口计数
+
+    每个 key 只保存当前窗口序号和当前/上一窗口两个计数，内存与请求数无关。
+    key 按最近访问顺序排列，超过两个窗口未访问的 key 不再影响判定，访问时顺带从头部淘汰；
+    ``max_keys`` 限制 key 总数，超出时淘汰最久未访问的 key。
+    """
+
+    def __init__(self, window: float, max_keys: int = 100000, clock: Callable[[], float] = time.monotonic):
+        self.window = window
+        self.max_keys = max_keys
+        self.clock = clock
+        # key -> [窗口序号, 当前窗口计数, 上一窗口计数]
+        self._entries: "OrderedDict[Hashable, List[float]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def hit(self, key: Hashable, limit: float, cost: float = 1, now: Optional[float] = None) -> float:
+        """记录一次请求，允许时返回0，超出限制时不计数并返回重试等待秒数"""
+        now = self.clock() if now is None else now
+        index = int(now // self.window)
+        self._evict(index)
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = [index, 0, 0]
+        else:
+            self._entries.move_to_end(key)
+            if entry[0] != index:
+                # 进入新窗口：相邻窗口的计数成为上一窗口，更早的清零
+                entry[2] = entry[1] if entry[0] == index - 1 else 0
+                entry[0], entry[1] = index, 0
+        retry_after = window_retry_after(entry[2], entry[1], now - index * self.window, self.window, limit, cost)
+        if not retry_after:
+            entry[1] += cost
+        return retry_after
+
+    def _evict(self, index: int):
+        entries = self._entries
+        while entries:
+            key, entry = next(iter(entries.items()))
+            if entry[0] >= index - 1 and len(entries) < self.max_keys:
+                break
+            del entries[key]
@@ -0,0 +1,409 @@
+import json
+import math
+import time
+import asyncio
+import logging
+import dataclasses
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+from .ratelimit import SlidingWindowCounter, window_retry_after
+
+try:
+    import redis.asyncio as aioredis
+    from redis.exceptions import WatchError
+except ImportError:  # 未安装 redis 时只能使用内存存储
+    aioredis = None
+    WatchError = None
+
+logger = logging.getLogger(__name__)
+
+# 会话事件回调，事件为可 JSON 序列化的 dict，至少包含 type / session_id / worker
+EventListener = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+@dataclass
+class SessionRecord:
+    """会话中需要在多个 worker 之间共享的部分
+
+    WebSocket、画布、处理状态等只存在于持有连接的 worker 本地，不写入存储。
+    """
+    session_id: str
+    style_name: str = "realistic"
+    sketch_path: Optional[str] = None
+    result_path: Optional[str] = None
+    comfyui_backend: Optional[str] = None
+    owner: Optional[str] = None  # 持有该会话 WebSocket 的 worker
+    last_update: float = 0.0
+
+    def to_mapping(self) -> Dict[str, str]:
+        return encode_fields(dataclasses.asdict(self))
+
+    @classmethod
+    def from_mapping(cls, data: Dict[str, str]) -> "SessionRecord":
+        values: Dict[str, Any] = {}
+        for field in dataclasses.fields(cls):
+            if field.name not in data:
+                continue
+            value = data[field.name]
+            if field.name == "last_update":
+                values[field.name] = float(value or 0)
+            else:
+                values[field.name] = value or None
+        return cls(**values)
+
+
+def encode_fields(fields: Dict[str, Any]) -> Dict[str, str]:
+    """Redis 哈希只保存字符串，None 记为空串"""
+    return {name: "" if value is None else str(value) for name, value in fields.items()}
+
+
+class SessionStore:
+    """会话存储接口
+
+    ``create`` 在全局会话数上限内登记新会话；``update`` 只写入给定字段，避免不同 worker
+    用过时的副本互相覆盖；``claim``/``release`` 记录 WebSocket 所在的 worker；
+    ``publish`` 将事件广播给所有 worker（包括自己）。
+    """
+
+    async def start(self, listener: Optional[EventListener] = None):
+        """开始接收事件"""
+        raise NotImplementedError
+
+    async def close(self):
+        raise NotImplementedError
+
+    async def create(self, record: SessionRecord, max_sessions: int = 0) -> bool:
+        """登记新会话，超出上限时返回False；会话已存在时视为成功"""
+        raise NotImplementedError
+
+    async def get(self, session_id: str) -> Optional[SessionRecord]:
+        raise NotImplementedError
+
+    async def update(self, session_id: str, **fields: Any) -> bool:
+        """更新部分字段并刷新 last_update，会话不存在时返回False"""
+        raise NotImplementedError
+
+    async def delete(self, session_id: str):
+        raise NotImplementedError
+
+    async def count(self) -> int:
+        raise NotImplementedError
+
+    async def claim(self, session_id: str, worker_id: str) -> Optional[str]:
+        """将会话的 WebSocket 归属到该 worker，返回之前的持有者"""
+        raise NotImplementedError
+
+    async def release(self, session_id: str, worker_id: str) -> bool:
+        """该 worker 仍持有会话时释放归属"""
+        raise NotImplementedError
+
+    async def publish(self, event: Dict[str, Any]):
+        raise NotImplementedError
+
+    async def acquire_slot(self, name: str, holder: str, limit: int, lease: float) -> bool:
+        """在名为 ``name`` 的全局并发槽中占用一个位置，租约到期未续约的位置自动释放"""
+        raise NotImplementedError
+
+    async def renew_slots(self, name: str, holders: Iterable[str], lease: float):
+        """为仍在使用的位置续约"""
+        raise NotImplementedError
+
+    async def release_slot(self, name: str, holder: str):
+        raise NotImplementedError
+
+    async def hit_rate(self, name: str, key: str, limit: float, window: float, cost: float = 1) -> float:
+        """在名为 ``name`` 的速率限制中为 ``key`` 记录一次请求
+
+        按滑动窗口计数判定，允许时返回0，超出限制时不计数并返回建议的重试等待秒数。
+        """
+        raise NotImplementedError
+
+
+class MemorySessionStore(SessionStore):
+    """进程内会话存储（单 worker 部署）"""
+
+    def __init__(self):
+        self._records: Dict[str, SessionRecord] = {}
+        self._listener: Optional[EventListener] = None
+        self._slots: Dict[str, Dict[str, float]] = {}
+        self._rates: Dict[str, SlidingWindowCounter] = {}
+
+    async def start(self, listener: Optional[EventListener] = None):
+        self._listener = listener
+
+    async def close(self):
+        self._listener = None
+
+    async def create(self, record: SessionRecord, max_sessions: int = 0) -> bool:
+        if record.session_id in self._records:
+            return True
+        if max_sessions and len(self._records) >= max_sessions:
+            return False
+        self._records[record.session_id] = dataclasses.replace(record, last_update=record.last_update or time.time())
+        return True
+
+    async def get(self, session_id: str) -> Optional[SessionRecord]:
+        record = self._records.get(session_id)
+        return dataclasses.replace(record) if record is not None else None
+
+    async def update(self, session_id: str, **fields: Any) -> bool:
+        record = self._records.get(session_id)
+        if record is None:
+            return False
+        fields.setdefault("last_update", time.time())
+        for name, value in fields.items():
+            setattr(record, name, value)
+        return True
+
+    async def delete(self, session_id: str):
+        self._records.pop(session_id, None)
+
+    async def count(self) -> int:
+        return len(self._records)
+
+    async def claim(self, session_id: str, worker_id: str) -> Optional[str]:
+        record = self._records.get(session_id)
+        if record is None:
+            return None
+        previous, record.owner = record.owner, worker_id
+        return previous
+
+    async def release(self, session_id: str, worker_id: str) -> bool:
+        record = self._records.get(session_id)
+        if record is None or record.owner != worker_id:
+            return False
+        record.owner = None
+        return True
+
+    async def publish(self, event: Dict[str, Any]):
+        if self._listener is not None:
+            await self._listener(event)
+
+    async def acquire_slot(self, name: str, holder: str, limit: int, lease: float) -> bool:
+        now = time.time()
+        slots = self._slots.setdefault(name, {})
+        for expired in [h for h, expires in slots.items() if expires <= now]:
+            del slots[expired]
+        if holder not in slots and len(slots) >= limit:
+            return False
+        slots[holder] = now + lease
+        return True
+
+    async def renew_slots(self, name: str, holders: Iterable[str], lease: float):
+        slots = self._slots.get(name, {})
+        expires = time.time() + lease
+        for holder in holders:
+            if holder in slots:
+                slots[holder] = expires
+
+    async def release_slot(self, name: str, holder: str):
+        self._slots.get(name, {}).pop(holder, None)
+
+    async def hit_rate(self, name: str, key: str, limit: float, window: float, cost: float = 1) -> float:
+        counter = self._rates.get(name)
+        if counter is None or counter.window != window:
+            counter = self._rates[name] = SlidingWindowCounter(window)
+        return counter.hit(key, limit, cost)
+
+
+class RedisSessionStore(SessionStore):
+    """基于 Redis 协议的共享会话存储（多 worker 部署）
+
+    每个会话保存为一个哈希并设置过期时间，有序集合按最后更新时间索引所有会话，
+    用于统计全局会话数和淘汰过期会话；事件通过 pub/sub 频道广播。
+    """
+
+    def __init__(self, url: str = "redis://localhost:6379/0", prefix: str = "drawing",
+                 session_ttl: float = 1800, client: Any = None):
+        self._owns_client = client is None
+        if client is None:
+            if aioredis is None:
+                raise RuntimeError("使用 Redis 会话存储需要安装 redis 包")
+            client = aioredis.from_url(url, decode_responses=True)
+        self.client = client
+        self.prefix = prefix
+        self.session_ttl = session_ttl
+        self.index_key = f"{prefix}:sessions"
+        self.channel = f"{prefix}:events"
+        self._pubsub = None
+        self._listen_task: Optional[asyncio.Task] = None
+
+    def _key(self, session_id: str) -> str:
+        return f"{self.prefix}:session:{session_id}"
+
+    def _ttl(self) -> int:
+        return max(1, int(self.session_ttl))
+
+    async def start(self, listener: Optional[EventListener] = None):
+        if listener is None or self._listen_task is not None:
+            return
+        self._pubsub = self.client.pubsub()
+        await self._pubsub.subscribe(self.channel)
+        self._listen_task = asyncio.create_task(self._listen(listener))
+
+    async def close(self):
+        if self._listen_task is not None:
+            self._listen_task.cancel()
+            try:
+                await self._listen_task
+            except asyncio.CancelledError:
+                pass
+            self._listen_task = None
+        if self._pubsub is not None:
+            await self._pubsub.unsubscribe(self.channel)
+            await self._pubsub.aclose()
+            self._pubsub = None
+        if self._owns_client:
+            await self.client.aclose()
+
+    async def _listen(self, listener: EventListener):
+        while True:
+            try:
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if message is None:
+                    continue
+                await listener(json.loads(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"处理会话事件出错: {str(e)}")
+                await asyncio.sleep(0.1)
+
+    async def _prune(self):
+        """从索引中移除已过期的会话"""
+        await self.client.zremrangebyscore(self.index_key, "-inf", time.time() - self.session_ttl)
+
+    async def create(self, record: SessionRecord, max_sessions: int = 0) -> bool:
+        record = dataclasses.replace(record, last_update=record.last_update or time.time())
+        await self._prune()
+        added = await self.client.zadd(self.index_key, {record.session_id: record.last_update}, nx=True)
+        if not added:
+            return True
+        # 先占位再检查总数，并发创建时最多误拒，不会超出上限
+        if max_sessions and await self.client.zcard(self.index_key) > max_sessions:
+            await self.client.zrem(self.index_key, record.session_id)
+            return False
+        key = self._key(record.session_id)
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.hset(key, mapping=record.to_mapping())
+            pipe.expire(key, self._ttl())
+            await pipe.execute()
+        return True
+
+    async def get(self, session_id: str) -> Optional[SessionRecord]:
+        data = await self.client.hgetall(self._key(session_id))
+        return SessionRecord.from_mapping(data) if data else None
+
+    async def update(self, session_id: str, **fields: Any) -> bool:
+        key = self._key(session_id)
+        if not await self.client.exists(key):
+            return False
+        fields.setdefault("last_update", time.time())
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.hset(key, mapping=encode_fields(fields))
+            pipe.expire(key, self._ttl())
+            pipe.zadd(self.index_key, {session_id: fields["last_update"]})
+            await pipe.execute()
+        return True
+
+    async def delete(self, session_id: str):
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.delete(self._key(session_id))
+            pipe.zrem(self.index_key, session_id)
+            await pipe.execute()
+
+    async def count(self) -> int:
+        await self._prune()
+        return await self.client.zcard(self.index_key)
+
+    async def claim(self, session_id: str, worker_id: str) -> Optional[str]:
+        key = self._key(session_id)
+        if not await self.client.exists(key):
+            return None
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.hget(key, "owner")
+            pipe.hset(key, "owner", worker_id)
+            previous, _ = await pipe.execute()
+        return previous or None
+
+    async def release(self, session_id: str, worker_id: str) -> bool:
+        key = self._key(session_id)
+        async with self.client.pipeline(transaction=True) as pipe:
+            try:
+                await pipe.watch(key)
+                if await pipe.hget(key, "owner") != worker_id:
+                    await pipe.unwatch()
+                    return False
+                pipe.multi()
+                pipe.hset(key, "owner", "")
+                await pipe.execute()
+            except WatchError:
+                # 期间被其他 worker 接管
+                return False
+        return True
+
+    async def publish(self, event: Dict[str, Any]):
+        await self.client.publish(self.channel, json.dumps(event, ensure_ascii=False))
+
+    def _slot_key(self, name: str) -> str:
+        return f"{self.prefix}:slots:{name}"
+
+    async def acquire_slot(self, name: str, holder: str, limit: int, lease: float) -> bool:
+        # 有序集合中成员为持有者，分数为租约到期时间
+        key = self._slot_key(name)
+        async with self.client.pipeline(transaction=True) as pipe:
+            try:
+                await pipe.watch(key)
+                now = time.time()
+                expires = await pipe.zscore(key, holder)
+                # WATCH 之后本连接的写入也会使事务失效，过期位置在事务内回收
+                if (expires is None or expires <= now) and await pipe.zcount(key, f"({now}", "+inf") >= limit:
+                    await pipe.unwatch()
+                    return False
+                pipe.multi()
+                pipe.zremrangebyscore(key, "-inf", now)
+                pipe.zadd(key, {holder: now + lease})
+                await pipe.execute()
+            except WatchError:
+                # 其他 worker 同时修改了槽位，由调用方稍后重试
+                return False
+        return True
+
+    async def renew_slots(self, name: str, holders: Iterable[str], lease: float):
+        holders = list(holders)
+        if holders:
+            # xx: 只续约仍存在的位置，已过期被回收的不再恢复
+            await self.client.zadd(self._slot_key(name), {h: time.time() + lease for h in holders}, xx=True)
+
+    async def release_slot(self, name: str, holder: str):
+        await self.client.zrem(self._slot_key(name), holder)
+
+    async def hit_rate(self, name: str, key: str, limit: float, window: float, cost: float = 1) -> float:
+        # 每个 key 每个窗口一个计数器，保留两个窗口后自动过期，空闲的 key 不占用内存
+        now = time.time()
+        index = int(now // window)
+        base = f"{self.prefix}:rate:{name}:{key}"
+        current_key = f"{base}:{index}"
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.incrbyfloat(current_key, cost)
+            pipe.expire(current_key, max(1, math.ceil(window * 2)))
+            pipe.get(f"{base}:{index - 1}")
+            current, _, previous = await pipe.execute()
+        retry_after = window_retry_after(
+            float(previous or 0), float(current) - cost, now - index * window, window, limit, cost
+        )
+        if retry_after:
+            # 先计数再判定，被拒绝的请求不占用额度
+            await self.client.incrbyfloat(current_key, -cost)
+        return retry_after
+
+
+def create_session_store(backend: str = "memory", url: str = "", prefix: str = "drawing",
+                         session_ttl: float = 1800) -> SessionStore:
+    """按配置创建会话存储"""
+    if backend == "redis":
+        return RedisSessionStore(url or "redis://localhost:6379/0", prefix=prefix, session_ttl=session_ttl)
+    if backend != "memory":
+        raise ValueError(f"未知的会话存储类型: {backend}")
+    return MemorySessionStore()
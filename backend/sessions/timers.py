@@ -0,0 +1,158 @@
+import math
+import time
+import asyncio
+import logging
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _Timer:
+    """时间轮中的一个定时器"""
+
+    __slots__ = ("key", "deadline", "expires", "callback", "level", "slot")
+
+    def __init__(self, key: Hashable, deadline: float, expires: int, callback: Callable[[], Any]):
+        self.key = key
+        self.deadline = deadline
+        # 到期的 tick 序号
+        self.expires = expires
+        self.callback = callback
+        self.level = 0
+        self.slot = 0
+
+
+class TimerWheel:
+    """分层时间轮
+
+    每层 ``slots`` 个槽，第 L 层每槽覆盖 ``slots ** L`` 个 tick；定时器按剩余时间放入
+    能容纳它的最低层，上层的槽在轮到时逐级下放，到第 0 层后在到期 tick 触发。
+    设置、重设和取消均为 O(1)，每个 tick 只处理到期和下放的定时器，与定时器总数无关。
+    超出最高层范围的定时器先放在最高层，下放时重新计算位置。
+
+    每个 key 同时最多一个定时器，重复设置会替换原定时器。回调在事件循环中同步调用，
+    需要异步处理时由回调自行创建任务。
+    """
+
+    def __init__(self, tick: float = 1.0, slots: int = 64, levels: int = 4,
+                 clock: Callable[[], float] = time.monotonic):
+        self.tick = tick
+        self.slots = slots
+        self.levels = levels
+        self.clock = clock
+        self.fired = 0
+        # 已处理到的 tick
+        self._current = int(clock() // tick)
+        self._wheels: List[List[Dict[Hashable, _Timer]]] = [
+            [{} for _ in range(slots)] for _ in range(levels)
+        ]
+        self._timers: Dict[Hashable, _Timer] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._timers)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._timers
+
+    @property
+    def running(self) -> bool:
+        """驱动时间轮的后台任务是否在运行"""
+        return self._task is not None and not self._task.done()
+
+    def deadline(self, key: Hashable) -> Optional[float]:
+        timer = self._timers.get(key)
+        return timer.deadline if timer is not None else None
+
+    def schedule(self, key: Hashable, deadline: float, callback: Callable[[], Any]):
+        """在 ``deadline``（``clock`` 时间）之后的第一个 tick 触发回调"""
+        self.cancel(key)
+        timer = _Timer(key, deadline, math.ceil(deadline / self.tick), callback)
+        self._timers[key] = timer
+        self._place(timer, self._current)
+
+    def schedule_in(self, key: Hashable, delay: float, callback: Callable[[], Any]):
+        """在 ``delay`` 秒后触发回调"""
+        self.schedule(key, self.clock() + delay, callback)
+
+    def cancel(self, key: Hashable) -> bool:
+        timer = self._timers.pop(key, None)
+        if timer is None:
+            return False
+        del self._wheels[timer.level][timer.slot][key]
+        return True
+
+    def _place(self, timer: _Timer, current: int):
+        # 已过期的定时器在下一个 tick 触发
+        expires = max(timer.expires, current + 1)
+        delta = expires - current
+        level = 0
+        while level < self.levels - 1 and delta >= self.slots ** (level + 1):
+            level += 1
+        span = self.slots ** (level + 1)
+        if delta >= span:
+            # 超出最高层范围，先放在最远的槽，下放时重新计算
+            expires = current + span - 1
+        timer.level = level
+        timer.slot = (expires // self.slots ** level) % self.slots
+        self._wheels[level][timer.slot][timer.key] = timer
+
+    def _step(self) -> List[_Timer]:
+        """前进一个 tick，返回到期的定时器"""
+        tick = self._current + 1
+        for level in range(self.levels - 1, 0, -1):
+            width = self.slots ** level
+            if tick % width:
+                continue
+            slot = self._wheels[level][(tick // width) % self.slots]
+            if slot:
+                timers = list(slot.values())
+                slot.clear()
+                for timer in timers:
+                    if timer.expires <= tick:
+                        # 本 tick 到期，放入随后处理的第 0 层槽
+                        timer.level, timer.slot = 0, tick % self.slots
+                        self._wheels[0][timer.slot][timer.key] = timer
+                    else:
+                        self._place(timer, tick)
+        slot = self._wheels[0][tick % self.slots]
+        expired = list(slot.values())
+        slot.clear()
+        for timer in expired:
+            del self._timers[timer.key]
+        self._current = tick
+        return expired
+
+    def advance(self, now: Optional[float] = None) -> int:
+        """处理截至 ``now`` 的所有 tick，返回触发的定时器数"""
+        target = int((self.clock() if now is None else now) // self.tick)
+        fired = 0
+        while self._current < target:
+            for timer in self._step():
+                fired += 1
+                try:
+                    timer.callback()
+                except Exception as e:
+                    logger.error(f"定时器回调出错: {timer.key}, {str(e)}")
+        self.fired += fired
+        return fired
+
+    async def start(self):
+        """启动驱动时间轮的后台任务"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(max(0.0, (self._current + 1) * self.tick - self.clock()))
+            self.advance()
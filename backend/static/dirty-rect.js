@@ -0,0 +1,27 @@
+// 增量更新的脏矩形计算（页面和单元测试共用）
+
+// 从上一点到当前点的整段笔画所覆盖的矩形，按画笔半径外扩并裁剪到画布范围
+function segmentRect(x0, y0, x1, y1, size, width, height) {
+    const r = Math.ceil(size / 2) + 1;
+    return {
+        left: Math.max(0, Math.floor(Math.min(x0, x1) - r)),
+        top: Math.max(0, Math.floor(Math.min(y0, y1) - r)),
+        right: Math.min(width, Math.ceil(Math.max(x0, x1) + r)),
+        bottom: Math.min(height, Math.ceil(Math.max(y0, y1) + r)),
+    };
+}
+
+// 合并两个矩形，a 为 null 时返回 b
+function unionRect(a, b) {
+    if (!a) return b;
+    return {
+        left: Math.min(a.left, b.left),
+        top: Math.min(a.top, b.top),
+        right: Math.max(a.right, b.right),
+        bottom: Math.max(a.bottom, b.bottom),
+    };
+}
+
+if (typeof module !== 'undefined') {
+    module.exports = { segmentRect, unionRect };
+}
@@ -1,7 +1,12 @@
 import pytest
+import pytest_asyncio
 import os
 import shutil
+import asyncio
+import uuid
+import time
 from pathlib import Path
+from aiohttp import web
 
 @pytest.fixture(scope="session")
 def test_upload_dir(tmp_path_factory):
@@ -62,4 +67,200 @@ def test_environment():
     """设置测试环境"""
     os.environ["ENVIRONMENT"] = "test"
     yield os.environ["ENVIRONMENT"]
-    del os.environ["ENVIRONMENT"] 
\ No newline at end of file
+    del os.environ["ENVIRONMENT"] 
+
+class FakeComfyUI:
+    """本地模拟的ComfyUI服务，用于测试提交、事件流和历史记录接口"""
+
+    def __init__(self, execution_time: float = 0.2, steps: int = 4):
+        self.execution_time = execution_time
+        self.steps = steps
+        # 设置后模拟共享输出目录，将生成结果写入该目录
+        self.output_dir = None
+        self.history = {}
+        # 生成结果，通过 /api/view 下载
+        self.outputs = {}
+        # 通过 /api/upload/image 上传的输入图像
+        self.uploads = {}
+        self.http_requests = 0
+        self.prompts = []
+        self.sockets = {}
+        self.url = None
+        self._runner = None
+        self._tasks = []
+
+    async def start(self):
+        # 与ComfyUI一致，允许上传较大的输入图像
+        app = web.Application(client_max_size=100 * 1024 * 1024)
+        app.router.add_post("/api/prompt", self._handle_prompt)
+        app.router.add_get("/api/queue", self._handle_queue)
+        app.router.add_get("/api/history", self._handle_history)
+        app.router.add_get("/api/history/{prompt_id}", self._handle_history)
+        app.router.add_get("/api/view", self._handle_view)
+        app.router.add_post("/api/upload/image", self._handle_upload)
+        app.router.add_get("/ws", self._handle_ws)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}"
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        for ws in list(self.sockets.values()):
+            await ws.close()
+        await self._runner.cleanup()
+
+    async def drop_sockets(self):
+        """模拟事件流断开"""
+        for ws in list(self.sockets.values()):
+            await ws.close()
+        self.sockets.clear()
+
+    async def _handle_prompt(self, request):
+        self.http_requests += 1
+        body = await request.json()
+        prompt_id = uuid.uuid4().hex
+        self.prompts.append(body)
+        self._tasks.append(asyncio.create_task(self._execute(prompt_id, body.get("client_id"))))
+        return web.json_response({"prompt_id": prompt_id, "number": len(self.prompts)})
+
+    async def _handle_history(self, request):
+        self.http_requests += 1
+        prompt_id = request.match_info.get("prompt_id")
+        if prompt_id is None:
+            return web.json_response(self.history)
+        if prompt_id in self.history:
+            return web.json_response({prompt_id: self.history[prompt_id]})
+        return web.json_response({})
+
+    async def _handle_queue(self, request):
+        self.http_requests += 1
+        running = [[0, prompt_id] for prompt_id, item in self.history.items() if not item["status"]["completed"]]
+        return web.json_response({"queue_running": running, "queue_pending": []})
+
+    async def _handle_view(self, request):
+        self.http_requests += 1
+        data = self.outputs.get(request.query.get("filename"))
+        if data is None or request.query.get("type") != "output":
+            return web.Response(status=404)
+        return web.Response(body=data, content_type="image/png")
+
+    async def _handle_upload(self, request):
+        self.http_requests += 1
+        form = await request.post()
+        image = form["image"]
+        self.uploads[image.filename] = image.file.read()
+        return web.json_response({"name": image.filename, "subfolder": "", "type": form.get("type", "input")})
+
+    async def _handle_ws(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.sockets[request.query.get("clientId")] = ws
+        async for _ in ws:
+            pass
+        return ws
+
+    async def _emit(self, client_id, event_type, data):
+        ws = self.sockets.get(client_id)
+        if ws is not None and not ws.closed:
+            await ws.send_json({"type": event_type, "data": data})
+
+    async def _execute(self, prompt_id, client_id):
+        started = {"prompt_id": prompt_id, "timestamp": int(time.time() * 1000)}
+        self.history[prompt_id] = {"status": {"status_str": None, "completed": False, "messages": [["execution_start", started]]}}
+        await self._emit(client_id, "execution_start", {"prompt_id": prompt_id})
+        for step in range(1, self.steps + 1):
+            await asyncio.sleep(self.execution_time / self.steps)
+            await self._emit(client_id, "progress", {
+                "prompt_id": prompt_id, "node": "3", "value": step, "max": self.steps
+            })
+        self.outputs[f"{prompt_id}.png"] = b"generated " + prompt_id.encode()
+        if self.output_dir is not None:
+            with open(os.path.join(self.output_dir, f"{prompt_id}.png"), "wb") as f:
+                f.write(self.outputs[f"{prompt_id}.png"])
+        self.history[prompt_id] = {
+            "status": {"status_str": "success", "completed": True, "messages": [
+                ["execution_start", started],
+                ["execution_success", {"prompt_id": prompt_id, "timestamp": int(time.time() * 1000)}],
+            ]},
+            "outputs": {"11": {"images": [{"filename": f"{prompt_id}.png", "subfolder": "", "type": "output"}]}},
+        }
+        await self._emit(client_id, "executing", {"prompt_id": prompt_id, "node": None})
+        await self._emit(client_id, "execution_success", {"prompt_id": prompt_id})
+
+
+@pytest_asyncio.fixture
+async def fake_comfyui():
+    """启动本地模拟ComfyUI服务"""
+    server = FakeComfyUI()
+    await server.start()
+    yield server
+    await server.stop()
+
+
+class SketchPipeline:
+    """隔离的草图处理环境，记录每次提交到ComfyUI的草图"""
+
+    def __init__(self, state, block: bool = False):
+        self.state = state
+        self.calls = []
+        # block 为 True 时每次提交都等待 release 被设置，用于模拟处理中的任务
+        self.block = block
+        self.release = asyncio.Event()
+        # 提交返回的结果路径，None 表示生成失败
+        self.result = None
+
+    async def send_to_comfyui(self, sketch_path, style_config, session_id):
+        self.calls.append(sketch_path)
+        if self.block:
+            await self.release.wait()
+            self.release.clear()
+        return self.result
+
+
+@pytest.fixture
+def sketch_pipeline(request, monkeypatch, tmp_path):
+    """替换应用状态、任务调度、防抖和ComfyUI提交函数，上传目录指向临时目录
+
+    可通过 indirect 参数设置 {"debounce": (最小窗口, 最大窗口), "block": bool}，默认关闭防抖、提交立即返回。
+    """
+    import app as app_module
+    from pipeline import JobScheduler, AdaptiveDebounce
+    
+    options = getattr(request, "param", {})
+    min_window, max_window = options.get("debounce", (0, 0))
+    pipeline = SketchPipeline(app_module.AppState(), block=options.get("block", False))
+    monkeypatch.setattr(app_module, "state", pipeline.state)
+    monkeypatch.setattr(app_module, "job_scheduler", JobScheduler())
+    monkeypatch.setattr(app_module, "sketch_debounce", AdaptiveDebounce(min_window=min_window, max_window=max_window))
+    monkeypatch.setattr(app_module, "send_to_comfyui", pipeline.send_to_comfyui)
+    monkeypatch.setattr(app_module.config, "UPLOAD_DIR", str(tmp_path))
+    return pipeline
+
+
+@pytest.fixture
+def ws_client(sketch_pipeline, tmp_path):
+    """带有一个会话的测试客户端，生成过程返回固定结果"""
+    from fastapi.testclient import TestClient
+    import app as app_module
+    
+    session = app_module.Session(session_id="s1", style_config=app_module.StyleConfig())
+    sketch_pipeline.state.active_sessions["s1"] = session
+    result_path = tmp_path / "result.png"
+    result_path.write_bytes(b"\x89PNG\r\n\x1a\n" + b"result")
+    sketch_pipeline.result = str(result_path)
+    return TestClient(app_module.app), session, sketch_pipeline.calls
+
+
+@pytest.fixture
+def fake_comfyui_pool(fake_comfyui, monkeypatch):
+    """将应用的ComfyUI节点池指向模拟服务（事件流由测试自行启动）"""
+    import app as app_module
+    from comfyui import ComfyUIBackendPool
+    
+    pool = ComfyUIBackendPool([fake_comfyui.url], health_interval=0)
+    monkeypatch.setattr(app_module, "comfyui_pool", pool)
+    return pool
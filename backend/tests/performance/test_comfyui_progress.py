@@ -0,0 +1,77 @@
+import pytest
+import time
+import asyncio
+import aiohttp
+import app as app_module
+from comfyui import ComfyUIBackend
+
+async def run_job(backend) -> float:
+    """提交一个任务并等待完成，返回从执行结束到感知完成的延迟"""
+    async with aiohttp.ClientSession() as http:
+        prompt_id = await app_module.send_workflow_to_comfyui(http, backend, {"prompt": {}})
+        assert prompt_id
+        success = await app_module.wait_for_comfyui_processing(http, backend, prompt_id, "perf-session")
+        detected_at = time.monotonic()
+        assert success
+    return detected_at
+
+@pytest.fixture
+def comfyui_config(fake_comfyui, monkeypatch):
+    """将应用指向模拟ComfyUI服务"""
+    monkeypatch.setattr(app_module.config, "COMFYUI_POLL_INTERVAL", 0.5)
+    return fake_comfyui
+
+@pytest.mark.asyncio
+async def test_event_stream_vs_polling(comfyui_config, monkeypatch):
+    """测试事件流相比轮询降低完成延迟和HTTP请求数"""
+    fake_comfyui = comfyui_config
+    
+    # 轮询基线
+    monkeypatch.setattr(app_module.config, "COMFYUI_WS_ENABLED", False)
+    backend = ComfyUIBackend(fake_comfyui.url)
+    start = time.monotonic()
+    await run_job(backend)
+    polling_latency = time.monotonic() - start
+    polling_requests = fake_comfyui.http_requests
+    
+    # 事件流
+    listener = backend.events
+    monkeypatch.setattr(app_module.config, "COMFYUI_WS_ENABLED", True)
+    await listener.start()
+    try:
+        assert await listener.wait_connected(timeout=2)
+        fake_comfyui.http_requests = 0
+        start = time.monotonic()
+        await run_job(backend)
+        push_latency = time.monotonic() - start
+        push_requests = fake_comfyui.http_requests
+    finally:
+        await listener.stop()
+    
+    # 事件流只需提交一次请求
+    assert push_requests == 1
+    assert polling_requests > push_requests
+    # 执行时间为0.2秒，轮询至少要等一个0.5秒间隔
+    assert push_latency < 0.4
+    assert push_latency < polling_latency
+
+@pytest.mark.asyncio
+async def test_falls_back_to_polling_on_disconnect(comfyui_config, monkeypatch):
+    """测试事件流中断时回退到轮询"""
+    fake_comfyui = comfyui_config
+    fake_comfyui.execution_time = 0.6
+    backend = ComfyUIBackend(fake_comfyui.url, reconnect_delay=5)
+    listener = backend.events
+    monkeypatch.setattr(app_module.config, "COMFYUI_WS_ENABLED", True)
+    await listener.start()
+    try:
+        assert await listener.wait_connected(timeout=2)
+        async with aiohttp.ClientSession() as http:
+            prompt_id = await app_module.send_workflow_to_comfyui(http, backend, {"prompt": {}})
+            wait = app_module.wait_for_comfyui_processing(http, backend, prompt_id, "perf-session")
+            task = asyncio.create_task(wait)
+            await asyncio.sleep(0.1)
+            await fake_comfyui.drop_sockets()
+            assert await asyncio.wait_for(task, timeout=3)
+    finally:
+        await listener.stop()
@@ -0,0 +1,100 @@
+import pytest
+import pytest_asyncio
+import asyncio
+import base64
+import io
+import os
+import time
+from starlette.datastructures import UploadFile
+import app as app_module
+from app import AppState, Session, WebSocketMessage
+from pipeline import JobScheduler
+
+CONCURRENCY = 8
+PAYLOAD_SIZE = 8 * 1024 * 1024  # 8MB 画布
+
+class LoopLagMonitor:
+    """周期性调度一个协程，记录事件循环的调度延迟"""
+    
+    def __init__(self, interval: float = 0.002):
+        self.interval = interval
+        self.lags = []
+        self._task = None
+    
+    @property
+    def max_lag(self) -> float:
+        return max(self.lags, default=0.0)
+    
+    def percentile(self, p: float) -> float:
+        """延迟的百分位数"""
+        if not self.lags:
+            return 0.0
+        ordered = sorted(self.lags)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+    
+    async def _run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.lags.append(time.perf_counter() - start - self.interval)
+    
+    async def __aenter__(self):
+        self._task = asyncio.create_task(self._run())
+        await asyncio.sleep(self.interval * 2)
+        return self
+    
+    async def __aexit__(self, *exc):
+        self._task.cancel()
+
+@pytest_asyncio.fixture
+async def app_state(monkeypatch, tmp_path):
+    """隔离的应用状态，不实际提交生成任务"""
+    state = AppState()
+    monkeypatch.setattr(app_module, "state", state)
+    monkeypatch.setattr(app_module, "job_scheduler", JobScheduler(max_in_flight=0))
+    monkeypatch.setattr(app_module.config, "UPLOAD_DIR", str(tmp_path))
+    # 预热线程池，排除线程创建的开销
+    await asyncio.gather(*(app_module.run_blocking(time.sleep, 0.01) for _ in range(app_module.config.MAX_WORKERS)))
+    return state
+
+@pytest.fixture(scope="module")
+def large_sketch():
+    """大尺寸草图的data URL"""
+    return "data:image/png;base64," + base64.b64encode(os.urandom(PAYLOAD_SIZE)).decode()
+
+@pytest.mark.asyncio
+async def test_sketch_updates_keep_loop_responsive(app_state, large_sketch, tmp_path):
+    """测试并发大草图更新时事件循环延迟保持平稳"""
+    sessions = [Session(session_id=f"s{i}") for i in range(CONCURRENCY)]
+    message = WebSocketMessage(type="sketch_update", sketch_data=large_sketch)
+    
+    # 基线：在事件循环中同步解码写盘（改造前的行为）
+    async with LoopLagMonitor() as blocking:
+        for i in range(CONCURRENCY):
+            app_module.base64_to_image(app_module.strip_data_url(large_sketch), str(tmp_path / f"sync{i}.png"))
+            await asyncio.sleep(0)
+    
+    async with LoopLagMonitor() as non_blocking:
+        await asyncio.gather(*(app_module.handle_sketch_update(s, message) for s in sessions))
+    
+    assert all(os.path.getsize(s.sketch_path) == PAYLOAD_SIZE for s in sessions)
+    print(f"\n同步写盘延迟: p90={blocking.percentile(0.9) * 1000:.1f}ms max={blocking.max_lag * 1000:.1f}ms; "
+          f"线程池延迟: p90={non_blocking.percentile(0.9) * 1000:.1f}ms max={non_blocking.max_lag * 1000:.1f}ms")
+    # 同步写盘时每个草图都会阻塞事件循环一整次解码写盘；线程池下绝大多数调度延迟很小
+    assert non_blocking.percentile(0.9) < 0.05
+    assert non_blocking.percentile(0.9) < blocking.max_lag / 2
+
+@pytest.mark.asyncio
+async def test_upload_streaming_keeps_loop_responsive(app_state, tmp_path):
+    """测试并发大文件上传分块写盘时事件循环延迟保持平稳"""
+    uploads = [UploadFile(file=io.BytesIO(os.urandom(PAYLOAD_SIZE)), filename=f"{i}.png") for i in range(CONCURRENCY)]
+    
+    async with LoopLagMonitor() as monitor:
+        sizes = await asyncio.gather(*(
+            app_module.save_upload_file(upload, str(tmp_path / f"upload{i}.png"))
+            for i, upload in enumerate(uploads)
+        ))
+    
+    assert sizes == [PAYLOAD_SIZE] * CONCURRENCY
+    print(f"\n并发上传延迟: p90={monitor.percentile(0.9) * 1000:.1f}ms max={monitor.max_lag * 1000:.1f}ms")
+    assert monitor.percentile(0.9) < 0.05
@@ -0,0 +1,169 @@
+import pytest
+import asyncio
+import base64
+import io
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+import aiohttp
+from PIL import Image
+
+uvicorn = pytest.importorskip("uvicorn")
+fakeredis = pytest.importorskip("fakeredis")
+
+BACKEND_DIR = Path(__file__).resolve().parents[2]
+SESSIONS = 24
+FRAMES_PER_SESSION = 8
+SKETCH_SIZE = 1024 * 1024  # 每帧约1MB，解码/哈希/写盘为主要CPU开销
+CPU_COUNT = os.cpu_count() or 1
+MAX_WORKERS = min(4, CPU_COUNT - 1)  # 留一个核给压测客户端和模拟服务
+
+def png_bytes(size=(16, 16), color="white") -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+def noise_png(nbytes: int) -> bytes:
+    """随机像素的PNG（几乎不可压缩），编码后约 ``nbytes`` 字节"""
+    side = int((nbytes / 3) ** 0.5)
+    buffer = io.BytesIO()
+    Image.frombytes("RGB", (side, side), os.urandom(side * side * 3)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+class RedisServer:
+    """在线程中运行的模拟 Redis 服务"""
+    
+    def __enter__(self):
+        self.port = free_port()
+        self.server = fakeredis.TcpFakeServer(("127.0.0.1", self.port), server_type="redis")
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return f"redis://127.0.0.1:{self.port}/0"
+    
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+async def start_server(workers: int, workdir: Path, comfyui_url: str, redis_url: str):
+    """以 serve.py 启动指定数量的 worker，返回 (进程, 地址)"""
+    for name in ("static", "workflow"):
+        if not (workdir / name).exists():
+            (workdir / name).symlink_to(BACKEND_DIR / name)
+    port = free_port()
+    env = {
+        **os.environ,
+        "PYTHONPATH": str(BACKEND_DIR),
+        "ENVIRONMENT": "production",
+        "PORT": str(port),
+        "HOST": "127.0.0.1",
+        "WORKERS": str(workers),
+        "SESSION_STORE": "redis",
+        "REDIS_URL": redis_url,
+        "SESSION_STORE_PREFIX": uuid.uuid4().hex,
+        "COMFYUI_SERVER": comfyui_url,
+        "COMFYUI_OUTPUT_MODE": "remote",
+        "MAX_PROMPTS_IN_FLIGHT": str(SESSIONS),
+        "MAX_ACTIVE_SESSIONS": str(SESSIONS * 2),
+        "RESULT_CACHE_ENABLED": "false",
+        "TRACING_ENABLED": "false",
+        # 每帧都是相同的草图，关闭变化检测以测量完整的生成路径
+        "SKETCH_CHANGE_THRESHOLD": "0",
+        # 每帧等待结果后才发送下一帧，防抖只会增加延迟
+        "SKETCH_DEBOUNCE_MIN": "0",
+        "SKETCH_DEBOUNCE_MAX": "0",
+        # 压测请求都来自同一个IP
+        "RATE_LIMIT_HTTP": "0",
+        "RATE_LIMIT_SKETCH_UPDATES": "0",
+        "RATE_LIMIT_JOBS": "0",
+    }
+    process = subprocess.Popen(
+        [sys.executable, str(BACKEND_DIR / "serve.py")],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    url = f"http://127.0.0.1:{port}"
+    async with aiohttp.ClientSession() as http:
+        for _ in range(300):
+            try:
+                async with http.get(f"{url}/api/health") as response:
+                    if response.status == 200:
+                        return process, url
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("服务启动超时")
+
+async def wait_completed(ws):
+    """等待一次生成结果"""
+    while True:
+        message = await ws.receive_json(timeout=60)
+        if message.get("status") == "completed":
+            return
+        assert message.get("status") not in ("error", "rejected"), message
+
+async def run_session(http, url: str, sketch_message: str, ready: asyncio.Event, connected: list):
+    """创建会话并连续提交草图，每帧等待结果后再发送下一帧"""
+    form = aiohttp.FormData()
+    form.add_field("file", png_bytes(), filename="sketch.png", content_type="image/png")
+    async with http.post(f"{url}/api/sketch", data=form) as response:
+        session_id = (await response.json())["session_id"]
+    async with http.ws_connect(f"{url}/api/ws/{session_id}", max_msg_size=0) as ws:
+        # 连接时会先处理上传的草图
+        await wait_completed(ws)
+        connected.append(session_id)
+        await ready.wait()
+        for _ in range(FRAMES_PER_SESSION):
+            await ws.send_str(sketch_message)
+            await wait_completed(ws)
+
+async def measure_throughput(workers: int, workdir: Path, comfyui_url: str, redis_url: str) -> float:
+    """返回指定 worker 数下每秒完成的草图帧数"""
+    process, url = await start_server(workers, workdir, comfyui_url, redis_url)
+    sketch_message = json.dumps({
+        "type": "sketch_update",
+        "sketch_data": "data:image/png;base64," + base64.b64encode(noise_png(SKETCH_SIZE)).decode(),
+    })
+    ready = asyncio.Event()
+    connected = []
+    try:
+        async with aiohttp.ClientSession() as http:
+            tasks = [asyncio.create_task(run_session(http, url, sketch_message, ready, connected)) for _ in range(SESSIONS)]
+            while len(connected) < SESSIONS:
+                done = [task for task in tasks if task.done()]
+                for task in done:
+                    task.result()
+                await asyncio.sleep(0.05)
+            start = time.perf_counter()
+            ready.set()
+            await asyncio.gather(*tasks)
+            elapsed = time.perf_counter() - start
+    finally:
+        process.terminate()
+        process.wait(timeout=60)
+    return SESSIONS * FRAMES_PER_SESSION / elapsed
+
+@pytest.mark.skipif(MAX_WORKERS < 2, reason="需要至少3个CPU核才能体现多进程扩展")
+@pytest.mark.asyncio
+async def test_throughput_scales_with_workers(fake_comfyui, tmp_path):
+    """测试并发WebSocket会话的处理吞吐随 worker 进程数近似线性增长"""
+    fake_comfyui.execution_time = 0
+    fake_comfyui.steps = 1
+    results = {}
+    with RedisServer() as redis_url:
+        for workers in (1, MAX_WORKERS):
+            results[workers] = await measure_throughput(workers, tmp_path, fake_comfyui.url, redis_url)
+    
+    speedup = results[MAX_WORKERS] / results[1]
+    print(f"\n吞吐量: " + ", ".join(f"{w} worker={r:.1f} 帧/秒" for w, r in results.items())
+          + f"; 加速比 {speedup:.2f}x")
+    assert speedup >= MAX_WORKERS * 0.6
@@ -0,0 +1,107 @@
+import gc
+import pytest
+import random
+import statistics
+import time
+from sessions import TimerWheel
+
+SESSIONS = 10_000
+HEARTBEAT_INTERVAL = 10  # 客户端心跳间隔（秒）
+HEARTBEAT_TIMEOUT = 30
+SESSION_TIMEOUT = 1800
+SIMULATED_SECONDS = 600
+
+class FakeClock:
+    def __init__(self, now: float = 0.0):
+        self.now = now
+    
+    def __call__(self) -> float:
+        return self.now
+
+def simulate(sessions: int):
+    """模拟会话心跳与空闲过期，返回每个 tick 推进时间轮的CPU耗时"""
+    clock = FakeClock()
+    wheel = TimerWheel(tick=1.0, clock=clock)
+    rng = random.Random(1)
+    last_heartbeat = {}
+    
+    def check_heartbeat(session_id):
+        # 与应用一致：期间收到过心跳则按最新心跳重新计时
+        remaining = last_heartbeat[session_id] + HEARTBEAT_TIMEOUT - clock.now
+        if remaining > 0:
+            wheel.schedule_in(("heartbeat", session_id), remaining, lambda: check_heartbeat(session_id))
+    
+    for session_id in range(sessions):
+        last_heartbeat[session_id] = clock.now
+        wheel.schedule_in(("heartbeat", session_id), HEARTBEAT_TIMEOUT, lambda s=session_id: check_heartbeat(s))
+        wheel.schedule_in(("idle", session_id), rng.uniform(SIMULATED_SECONDS, SESSION_TIMEOUT), lambda: None)
+    
+    # 心跳在各会话间均匀错开
+    offsets = {session_id: rng.randrange(HEARTBEAT_INTERVAL) for session_id in range(sessions)}
+    by_offset = {}
+    for session_id, offset in offsets.items():
+        by_offset.setdefault(offset, []).append(session_id)
+    
+    # 与 timeit 一致，排除其他测试遗留对象引起的垃圾回收停顿
+    costs = []
+    gc.disable()
+    try:
+        for second in range(1, SIMULATED_SECONDS + 1):
+            clock.now = float(second)
+            for session_id in by_offset.get(second % HEARTBEAT_INTERVAL, ()):
+                last_heartbeat[session_id] = clock.now
+            start = time.process_time()
+            wheel.advance()
+            costs.append(time.process_time() - start)
+    finally:
+        gc.enable()
+    return costs, wheel
+
+def full_scan_cost(sessions: int) -> float:
+    """改造前每次清理遍历全部会话的CPU耗时"""
+    last_update = {session_id: 0.0 for session_id in range(sessions)}
+    start = time.process_time()
+    [session_id for session_id, updated in last_update.items() if 300.0 - updated > SESSION_TIMEOUT]
+    return time.process_time() - start
+
+def test_timer_wheel_flat_cpu_with_10k_sessions():
+    """测试1万会话的心跳/过期定时器每秒CPU开销平稳，且只与到期数量有关"""
+    costs, wheel = simulate(SESSIONS)
+    small_costs, _ = simulate(SESSIONS // 10)
+    
+    # 稳定阶段（首轮心跳超时之后）
+    steady = costs[HEARTBEAT_TIMEOUT:]
+    mean = statistics.mean(steady)
+    p99 = sorted(steady)[int(len(steady) * 0.99)]
+    small_mean = statistics.mean(small_costs[HEARTBEAT_TIMEOUT:])
+    print(f"\n{SESSIONS} 会话: 每秒 mean={mean * 1000:.3f}ms p99={p99 * 1000:.3f}ms; "
+          f"{SESSIONS // 10} 会话: mean={small_mean * 1000:.3f}ms; "
+          f"全量扫描一次 {full_scan_cost(SESSIONS) * 1000:.3f}ms; 定时器数 {len(wheel)}")
+    
+    # 没有会话过期，心跳定时器全部持续续期
+    assert len(wheel) == SESSIONS * 2
+    # 每秒只处理约 1/30 的心跳定时器，没有周期性的全量扫描尖峰
+    assert mean < 0.01
+    assert p99 < max(mean * 10, 0.005)
+
+def test_cost_independent_of_pending_timers():
+    """测试推进时间轮的开销与未到期定时器数量无关"""
+    def advance_cost(pending: int) -> float:
+        clock = FakeClock()
+        wheel = TimerWheel(tick=1.0, clock=clock)
+        for i in range(pending):
+            wheel.schedule(("idle", i), 10_000.0 + i % 1000, lambda: None)
+        gc.disable()
+        try:
+            start = time.process_time()
+            for second in range(1, 3601):
+                clock.now = float(second)
+                wheel.advance()
+            return time.process_time() - start
+        finally:
+            gc.enable()
+    
+    empty, loaded = advance_cost(0), advance_cost(SESSIONS * 10)
+    print(f"\n推进1小时: 无定时器 {empty * 1000:.1f}ms, {SESSIONS * 10} 个未到期定时器 {loaded * 1000:.1f}ms")
+    # 远期定时器只在逐层下放时被处理少数几次
+    assert loaded < empty + 0.5
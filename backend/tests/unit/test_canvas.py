@@ -0,0 +1,53 @@
+import io
+import pytest
+from PIL import Image
+from realtime import SketchCanvas, CanvasError
+
+def png_bytes(size, color, mode="RGB"):
+    buffer = io.BytesIO()
+    Image.new(mode, size, color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+def test_patch_is_composited():
+    """测试脏矩形合成到画布"""
+    canvas = SketchCanvas(png_bytes((64, 64), "white"))
+    assert canvas.apply_patch(10, 20, png_bytes((8, 4), "black")) == (10, 20, 8, 4)
+    
+    image = canvas._image
+    assert image.getpixel((10, 20)) == (0, 0, 0)
+    assert image.getpixel((17, 23)) == (0, 0, 0)
+    assert image.getpixel((18, 20)) == (255, 255, 255)
+    assert image.getpixel((9, 20)) == (255, 255, 255)
+
+def test_patch_converted_to_canvas_mode():
+    """测试不同像素格式的脏矩形"""
+    canvas = SketchCanvas(png_bytes((16, 16), (255, 255, 255, 0), "RGBA"))
+    canvas.apply_patch(0, 0, png_bytes((2, 2), 0, "L"))
+    assert canvas._image.mode == "RGBA"
+    assert canvas._image.getpixel((1, 1)) == (0, 0, 0, 255)
+
+def test_invalid_updates():
+    """测试越界、无法解码和超尺寸的更新"""
+    canvas = SketchCanvas(png_bytes((32, 32), "white"))
+    with pytest.raises(CanvasError):
+        canvas.apply_patch(30, 0, png_bytes((4, 4), "black"))
+    with pytest.raises(CanvasError):
+        canvas.apply_patch(0, 0, b"not an image")
+    with pytest.raises(CanvasError):
+        SketchCanvas(png_bytes((64, 8), "white"), max_size=32)
+
+def test_save_tracks_dirty_state(tmp_path):
+    """测试只在有修改时需要写盘"""
+    canvas = SketchCanvas(png_bytes((32, 32), "white"))
+    assert canvas.dirty
+    
+    path = tmp_path / "sketch.png"
+    canvas.save(str(path))
+    assert not canvas.dirty
+    assert Image.open(path).size == (32, 32)
+    
+    canvas.apply_patch(0, 0, png_bytes((4, 4), "black"))
+    assert canvas.dirty
+    canvas.reset(png_bytes((16, 16), "white"))
+    assert canvas.size == (16, 16)
+    assert canvas.dirty
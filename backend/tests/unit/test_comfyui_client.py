@@ -0,0 +1,48 @@
+import pytest
+import asyncio
+from comfyui import ComfyUIClient
+
+@pytest.mark.asyncio
+async def test_client_requires_start():
+    """测试未启动时访问会话报错"""
+    client = ComfyUIClient("http://127.0.0.1:1")
+    with pytest.raises(RuntimeError):
+        client.session
+
+@pytest.mark.asyncio
+async def test_connections_are_reused(fake_comfyui):
+    """测试顺序请求复用keep-alive连接"""
+    client = ComfyUIClient(fake_comfyui.url)
+    await client.start()
+    try:
+        for _ in range(5):
+            async with client.session.get(f"{fake_comfyui.url}/api/history") as response:
+                await response.json()
+        stats = client.get_stats()
+        assert stats["requests_total"] == 5
+        assert stats["requests_in_flight"] == 0
+        assert stats["connections_created"] == 1
+        assert stats["connections_reused"] == 4
+    finally:
+        await client.close()
+    assert not client.started
+
+@pytest.mark.asyncio
+async def test_pool_wait_is_recorded(fake_comfyui):
+    """测试连接池饱和时记录排队等待"""
+    client = ComfyUIClient(fake_comfyui.url, pool_size=1, pool_per_host=1)
+    await client.start()
+    
+    async def fetch():
+        async with client.session.get(f"{fake_comfyui.url}/api/history") as response:
+            await response.json()
+    
+    try:
+        await asyncio.gather(*(fetch() for _ in range(4)))
+        stats = client.get_stats()
+        assert stats["pool_waits"] >= 1
+        assert stats["pool_waiting"] == 0
+        assert stats["pool_wait_seconds"] >= 0
+        assert stats["connections_created"] == 1
+    finally:
+        await client.close()
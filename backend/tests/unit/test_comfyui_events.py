@@ -0,0 +1,80 @@
+import pytest
+import asyncio
+import aiohttp
+from comfyui import ComfyUIEventListener, LISTENER_DISCONNECTED, is_success_event, is_failure_event
+from comfyui.events import build_ws_url
+
+def test_build_ws_url():
+    """测试WebSocket地址构建"""
+    assert build_ws_url("http://127.0.0.1:8188", "abc") == "ws://127.0.0.1:8188/ws?clientId=abc"
+    assert build_ws_url("https://comfy.example.com/", "abc") == "wss://comfy.example.com/ws?clientId=abc"
+
+def test_terminal_events():
+    """测试终止事件判断"""
+    assert is_success_event({"type": "execution_success", "data": {}})
+    assert is_success_event({"type": "executing", "data": {"node": None}})
+    assert not is_success_event({"type": "executing", "data": {"node": "3"}})
+    assert is_failure_event({"type": "execution_error", "data": {}})
+    assert is_failure_event({"type": "execution_interrupted", "data": {}})
+
+@pytest.mark.asyncio
+async def test_events_buffered_before_subscribe():
+    """测试订阅前到达的事件会被补发"""
+    listener = ComfyUIEventListener("http://127.0.0.1:1")
+    listener._connected = True
+    listener._dispatch({"type": "execution_start", "data": {"prompt_id": "p1"}})
+    listener._dispatch({"type": "status", "data": {"status": {}}})
+    
+    queue = listener.subscribe("p1")
+    listener._dispatch({"type": "execution_success", "data": {"prompt_id": "p1"}})
+    
+    assert (await queue.get())["type"] == "execution_start"
+    assert (await queue.get())["type"] == "execution_success"
+    assert queue.empty()
+
+@pytest.mark.asyncio
+async def test_pending_buffer_is_bounded():
+    """测试未订阅事件的缓冲区有上限"""
+    listener = ComfyUIEventListener("http://127.0.0.1:1", buffer_size=2)
+    for prompt_id in ("p1", "p2", "p3"):
+        listener._dispatch({"type": "executing", "data": {"prompt_id": prompt_id, "node": "1"}})
+    assert list(listener._pending) == ["p2", "p3"]
+
+@pytest.mark.asyncio
+async def test_listener_receives_events(fake_comfyui):
+    """测试通过事件流接收prompt进度和完成事件"""
+    listener = ComfyUIEventListener(fake_comfyui.url)
+    await listener.start()
+    try:
+        assert await listener.wait_connected(timeout=2)
+        async with aiohttp.ClientSession() as http:
+            async with http.post(f"{fake_comfyui.url}/api/prompt",
+                                 json={"prompt": {}, "client_id": listener.client_id}) as response:
+                prompt_id = (await response.json())["prompt_id"]
+        
+        queue = listener.subscribe(prompt_id)
+        types = []
+        while True:
+            event = await asyncio.wait_for(queue.get(), timeout=2)
+            types.append(event["type"])
+            if is_success_event(event):
+                break
+        assert "progress" in types
+    finally:
+        await listener.stop()
+
+@pytest.mark.asyncio
+async def test_disconnect_notifies_subscribers(fake_comfyui):
+    """测试事件流断开时通知等待者"""
+    listener = ComfyUIEventListener(fake_comfyui.url, reconnect_delay=0.05)
+    await listener.start()
+    try:
+        assert await listener.wait_connected(timeout=2)
+        queue = listener.subscribe("p1")
+        await fake_comfyui.drop_sockets()
+        event = await asyncio.wait_for(queue.get(), timeout=2)
+        assert event["type"] == LISTENER_DISCONNECTED
+        # 断开后自动重连
+        assert await listener.wait_connected(timeout=2)
+    finally:
+        await listener.stop()
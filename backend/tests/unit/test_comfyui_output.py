@@ -0,0 +1,67 @@
+import pytest
+import app as app_module
+from comfyui import ComfyUIBackend, ComfyUIClient
+
+@pytest.fixture
+def output_dir(monkeypatch, tmp_path):
+    """应用输出目录指向临时目录"""
+    monkeypatch.setattr(app_module.config, "OUTPUT_DIR", str(tmp_path))
+    return tmp_path
+
+async def run_prompt(fake, client):
+    """提交一个prompt并等待模拟服务执行完成"""
+    fake.execution_time = 0.01
+    backend = ComfyUIBackend(fake.url)
+    prompt_id = await app_module.send_workflow_to_comfyui(client.session, backend, {"prompt": {}})
+    await fake._tasks[-1]
+    return backend, prompt_id
+
+@pytest.mark.asyncio
+async def test_output_streamed_from_remote_backend(fake_comfyui, output_dir, monkeypatch):
+    """测试ComfyUI不共享输出目录时通过 /view 下载结果"""
+    monkeypatch.setattr(app_module.config, "DOWNLOAD_CHUNK_SIZE", 4)
+    client = ComfyUIClient(fake_comfyui.url)
+    await client.start()
+    try:
+        backend, prompt_id = await run_prompt(fake_comfyui, client)
+        result = await app_module.get_comfyui_result(client.session, backend, prompt_id)
+    finally:
+        await client.close()
+    
+    assert result == str(output_dir / f"{prompt_id}_{prompt_id}.png")
+    with open(result, "rb") as f:
+        assert f.read() == b"generated " + prompt_id.encode()
+    assert not list(output_dir.glob("*.part"))
+
+@pytest.mark.asyncio
+async def test_shared_output_used_without_download(fake_comfyui, output_dir):
+    """测试共享输出目录中已有结果时直接使用，不发起下载"""
+    fake_comfyui.output_dir = str(output_dir)
+    client = ComfyUIClient(fake_comfyui.url)
+    await client.start()
+    try:
+        backend, prompt_id = await run_prompt(fake_comfyui, client)
+        requests = fake_comfyui.http_requests
+        result = await app_module.get_comfyui_result(client.session, backend, prompt_id)
+    finally:
+        await client.close()
+    
+    assert result == str(output_dir / f"{prompt_id}.png")
+    # 只查询了历史记录
+    assert fake_comfyui.http_requests == requests + 1
+
+@pytest.mark.asyncio
+async def test_missing_output(fake_comfyui, output_dir, monkeypatch):
+    """测试节点上不存在输出文件时返回None，local 模式不下载"""
+    client = ComfyUIClient(fake_comfyui.url)
+    await client.start()
+    try:
+        backend, prompt_id = await run_prompt(fake_comfyui, client)
+        image_output = {"filename": "missing.png", "subfolder": "", "type": "output"}
+        assert await app_module.fetch_comfyui_output(client.session, backend, prompt_id, image_output) is None
+        
+        monkeypatch.setattr(app_module.config, "COMFYUI_OUTPUT_MODE", "local")
+        assert await app_module.get_comfyui_result(client.session, backend, prompt_id) is None
+    finally:
+        await client.close()
+    assert not list(output_dir.iterdir())
@@ -0,0 +1,165 @@
+import pytest
+import asyncio
+import aiohttp
+from aiohttp import web
+from PIL import Image
+import app as app_module
+from app import AppState, Session, StyleConfig
+from comfyui import ComfyUIBackendPool, ComfyUIClient
+
+def test_routes_to_least_loaded_backend():
+    """测试路由到负载最低的节点，负载相同时轮流分配"""
+    pool = ComfyUIBackendPool(["http://a", "http://b", "http://c"], sticky_slack=0)
+    a, b, c = pool.backends
+    a.queue_depth, b.queue_depth, c.queue_depth = 3, 0, 0
+    
+    assert {pool.select().url, pool.select().url} == {"http://b", "http://c"}
+    with pool.track(b):
+        assert pool.select() is c
+        # 本地在途数高于过时的队列深度时以在途数为准
+        with pool.track(b), pool.track(b), pool.track(b):
+            assert b.load == 4
+            assert pool.select(exclude=[c]) is a
+
+def test_sticky_routing():
+    """测试会话粘性：负载差距在容忍范围内时沿用上次节点"""
+    pool = ComfyUIBackendPool(["http://a", "http://b"], sticky_slack=1)
+    a, b = pool.backends
+    a.queue_depth, b.queue_depth = 1, 0
+    assert pool.select("http://a") is a
+    a.queue_depth = 2
+    assert pool.select("http://a") is b
+
+def test_failing_backend_is_ejected():
+    """测试连续失败的节点被剔除，全部剔除时仍可选择"""
+    pool = ComfyUIBackendPool(["http://a", "http://b"], failure_threshold=2)
+    a, b = pool.backends
+    pool.mark_failure(a)
+    assert a.healthy
+    pool.mark_failure(a)
+    assert not a.healthy
+    assert pool.select("http://a") is b
+    assert pool.select(exclude=[b]) is a
+
+class QueueServer:
+    """只实现 /api/queue 和 /api/prompt 的ComfyUI节点"""
+    
+    def __init__(self, depth, fail=False):
+        self.depth = depth
+        self.fail = fail
+        self.prompts = 0
+    
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/api/queue", self.queue)
+        app.router.add_post("/api/prompt", self.prompt)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        self.url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+    
+    async def queue(self, request):
+        if self.fail:
+            return web.Response(status=500)
+        return web.json_response({"queue_running": [[0]] * min(self.depth, 1), "queue_pending": [[0]] * max(self.depth - 1, 0)})
+    
+    async def prompt(self, request):
+        if self.fail:
+            return web.Response(status=500, text="down")
+        self.prompts += 1
+        return web.json_response({"prompt_id": f"p{self.prompts}"})
+
+@pytest.mark.asyncio
+async def test_health_check_and_failover():
+    """测试健康检查读取队列深度，提交失败时切换到其他节点"""
+    busy, idle = QueueServer(depth=3), QueueServer(depth=0, fail=True)
+    await busy.start()
+    await idle.start()
+    pool = ComfyUIBackendPool([busy.url, idle.url], health_interval=0, failure_threshold=1)
+    try:
+        async with aiohttp.ClientSession() as http:
+            await pool.start(http, events=False)
+            assert pool.backends[0].queue_depth == 3
+            assert not pool.backends[1].healthy
+            
+            # 节点恢复后重新参与路由
+            idle.fail = False
+            await pool.check_health()
+            assert pool.backends[1].healthy
+            
+            # 最空闲的节点提交失败时改投其他节点
+            idle.fail = True
+            original_pool = app_module.comfyui_pool
+            app_module.comfyui_pool = pool
+            try:
+                backend, prompt_id = await app_module.submit_to_backend(http, {"prompt": {}})
+            finally:
+                app_module.comfyui_pool = original_pool
+            assert backend.url == busy.url
+            assert prompt_id == "p1"
+            assert not pool.backends[1].healthy
+    finally:
+        await pool.stop()
+        await busy.runner.cleanup()
+        await idle.runner.cleanup()
+
+@pytest.mark.asyncio
+async def test_result_fetched_from_executing_backend(fake_comfyui, fake_comfyui_pool, monkeypatch, tmp_path):
+    """测试会话记录执行节点，结果从该节点获取"""
+    fake_comfyui.output_dir = str(tmp_path)
+    fake_comfyui.execution_time = 0.01
+    client = ComfyUIClient(fake_comfyui.url)
+    await client.start()
+    state = AppState()
+    state.active_sessions["s1"] = Session(session_id="s1")
+    monkeypatch.setattr(app_module, "comfyui_client", client)
+    monkeypatch.setattr(app_module, "state", state)
+    monkeypatch.setattr(app_module.config, "RESULT_CACHE_ENABLED", False)
+    monkeypatch.setattr(app_module.config, "COMFYUI_WS_ENABLED", False)
+    monkeypatch.setattr(app_module.config, "COMFYUI_POLL_INTERVAL", 0.01)
+    monkeypatch.setattr(app_module.config, "OUTPUT_DIR", str(tmp_path))
+    sketch = tmp_path / "sketch.png"
+    Image.new("L", (64, 64), 255).save(sketch)
+    try:
+        result = await app_module.send_to_comfyui(str(sketch), StyleConfig(), "s1")
+    finally:
+        await client.close()
+    
+    assert result and result.startswith(str(tmp_path))
+    assert state.active_sessions["s1"].comfyui_backend == fake_comfyui.url
+    assert fake_comfyui_pool.backends[0].in_flight == 0
+    assert fake_comfyui_pool.backends[0].submitted == 1
+
+@pytest.mark.asyncio
+async def test_sketch_uploaded_once_by_content(fake_comfyui, fake_comfyui_pool, monkeypatch, tmp_path):
+    """测试草图按内容哈希上传到节点，相同内容只上传一次，工作流引用上传名称"""
+    fake_comfyui.execution_time = 0.01
+    client = ComfyUIClient(fake_comfyui.url)
+    await client.start()
+    state = AppState()
+    state.active_sessions["s1"] = Session(session_id="s1")
+    monkeypatch.setattr(app_module, "comfyui_client", client)
+    monkeypatch.setattr(app_module, "state", state)
+    monkeypatch.setattr(app_module.config, "RESULT_CACHE_ENABLED", False)
+    monkeypatch.setattr(app_module.config, "COMFYUI_WS_ENABLED", False)
+    monkeypatch.setattr(app_module.config, "COMFYUI_POLL_INTERVAL", 0.01)
+    monkeypatch.setattr(app_module.config, "OUTPUT_DIR", str(tmp_path))
+    sketches = []
+    for name in ("a.png", "b.png"):
+        sketch = tmp_path / name
+        Image.new("L", (64, 64), 255).save(sketch)
+        sketches.append(sketch)
+    try:
+        for sketch in sketches:
+            assert await app_module.send_to_comfyui(str(sketch), StyleConfig(), "s1")
+    finally:
+        await client.close()
+    
+    # 相同内容只上传一次（上传的是规范化后的草图）
+    assert len(fake_comfyui.uploads) == 1
+    image_name = next(iter(fake_comfyui.uploads))
+    assert image_name.startswith("sketch_") and image_name.endswith(".png")
+    for body in fake_comfyui.prompts:
+        images = [node["inputs"]["image"] for node in body["prompt"].values() if node.get("class_type") == "LoadImage"]
+        assert images == [image_name]
@@ -0,0 +1,46 @@
+import json
+import shutil
+import subprocess
+from pathlib import Path
+import pytest
+
+DIRTY_RECT_JS = Path(__file__).resolve().parents[2] / "static" / "dirty-rect.js"
+
+pytestmark = pytest.mark.skipif(shutil.which("node") is None, reason="需要 node 运行前端脚本")
+
+def run_stroke(points, size, flush_after, width=400, height=300):
+    """按页面 draw() 的方式逐点标记脏矩形，在 ``flush_after`` 个点后取出一次增量，返回各次增量的矩形"""
+    script = f"""
+const {{ segmentRect, unionRect }} = require({json.dumps(str(DIRTY_RECT_JS))});
+const points = {json.dumps(points)};
+const patches = [];
+let dirty = null, last = null;
+points.forEach(([x, y], i) => {{
+    const [x0, y0] = last || [x, y];
+    dirty = unionRect(dirty, segmentRect(x0, y0, x, y, {size}, {width}, {height}));
+    last = [x, y];
+    if ({json.dumps(flush_after)}.includes(i + 1)) {{ patches.push(dirty); dirty = null; }}
+}});
+if (dirty) patches.push(dirty);
+console.log(JSON.stringify(patches));
+"""
+    return json.loads(subprocess.run(["node", "-e", script], capture_output=True, check=True, text=True).stdout)
+
+def covers(rect, x, y):
+    return rect["left"] <= x < rect["right"] and rect["top"] <= y < rect["bottom"]
+
+def test_mid_stroke_patch_includes_segment_start():
+    """测试笔画中途发送增量后，下一段线段从上一点开始的部分也包含在下一次增量中"""
+    points = [(10, 10), (100, 20), (200, 150), (300, 40)]
+    first, second = run_stroke(points, size=6, flush_after=[2])
+    assert covers(first, 10, 10) and covers(first, 99, 19)
+    # 第三个点的线段从 (100, 20) 开始，旧实现只标记 (200, 150) 附近
+    for t in (0.0, 0.25, 0.5, 0.75):
+        x, y = 100 + (200 - 100) * t, 20 + (150 - 20) * t
+        assert covers(second, x, y)
+    assert covers(second, 299, 40)
+
+def test_rect_clipped_to_canvas():
+    """测试脏矩形不超出画布"""
+    (rect,) = run_stroke([(1, 1), (399, 299)], size=20, flush_after=[])
+    assert rect == {"left": 0, "top": 0, "right": 400, "bottom": 300}
@@ -0,0 +1,124 @@
+import io
+import pytest
+import base64
+from PIL import Image
+import app as app_module
+from realtime import (
+    FrameError,
+    FRAME_SKETCH_UPDATE,
+    FRAME_RESULT_IMAGE,
+    FRAME_CANVAS_KEYFRAME,
+    FRAME_CANVAS_PATCH,
+    encode_frame,
+    decode_frame,
+    encode_patch,
+    detect_image_format
+)
+
+def png_bytes(size=(16, 16), color="white") -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+PNG_BYTES = png_bytes()
+RESULT_BYTES = b"\x89PNG\r\n\x1a\n" + b"result"
+
+def test_frame_roundtrip():
+    """测试帧编码解码"""
+    frame = decode_frame(encode_frame(FRAME_SKETCH_UPDATE, 42, PNG_BYTES))
+    assert frame.type == FRAME_SKETCH_UPDATE
+    assert frame.seq == 42
+    assert bytes(frame.payload) == PNG_BYTES
+
+def test_invalid_frames():
+    """测试非法帧"""
+    with pytest.raises(FrameError):
+        decode_frame(b"\x01\x01")
+    with pytest.raises(FrameError):
+        decode_frame(b"\x09" + encode_frame(FRAME_SKETCH_UPDATE, 1, b"")[1:])
+
+def test_detect_image_format():
+    """测试图像格式识别"""
+    assert detect_image_format(PNG_BYTES) == "png"
+    assert detect_image_format(b"RIFF\x00\x00\x00\x00WEBPVP8 ") == "webp"
+    assert detect_image_format(b"\xff\xd8\xff\xe0") == "jpeg"
+    assert detect_image_format(b"not an image") is None
+
+def test_binary_sketch_gets_binary_result(ws_client):
+    """测试二进制草图帧直接写盘，结果以二进制帧返回"""
+    client, session, submitted = ws_client
+    with client.websocket_connect("/api/ws/s1") as websocket:
+        websocket.send_bytes(encode_frame(FRAME_SKETCH_UPDATE, 7, PNG_BYTES))
+        message = websocket.receive()
+        while "bytes" not in message or message["bytes"] is None:
+            assert '"error"' not in (message.get("text") or "")
+            message = websocket.receive()
+        frame = decode_frame(message["bytes"])
+    
+    assert frame.type == FRAME_RESULT_IMAGE
+    assert frame.seq == 7
+    assert bytes(frame.payload) == RESULT_BYTES
+    assert submitted[0].endswith(".png")
+    assert open(submitted[0], "rb").read() == PNG_BYTES
+
+def test_json_sketch_still_supported(ws_client):
+    """测试JSON草图更新保持兼容"""
+    client, session, submitted = ws_client
+    sketch_data = "data:image/png;base64," + base64.b64encode(PNG_BYTES).decode()
+    with client.websocket_connect("/api/ws/s1") as websocket:
+        websocket.send_json({"type": "sketch_update", "sketch_data": sketch_data})
+        message = websocket.receive_json()
+        while message.get("status") != "completed":
+            message = websocket.receive_json()
+    
+    assert message["result_url"] == "/api/result/s1"
+    assert open(submitted[0], "rb").read() == PNG_BYTES
+
+def test_invalid_binary_frame_reports_error(ws_client):
+    """测试非图像载荷返回错误"""
+    client, session, submitted = ws_client
+    with client.websocket_connect("/api/ws/s1") as websocket:
+        websocket.send_bytes(encode_frame(FRAME_SKETCH_UPDATE, 1, b"garbage"))
+        message = websocket.receive_json()
+    
+    assert message["status"] == "error"
+    assert submitted == []
+
+def test_oversized_binary_sketch_rejected_before_decode(ws_client, monkeypatch):
+    """测试文件头中的尺寸超过上限时不写盘，直接返回错误"""
+    client, session, submitted = ws_client
+    monkeypatch.setattr(app_module.config, "CANVAS_MAX_SIZE", 8)
+    with client.websocket_connect("/api/ws/s1") as websocket:
+        websocket.send_bytes(encode_frame(FRAME_SKETCH_UPDATE, 1, PNG_BYTES))
+        message = websocket.receive_json()
+    
+    assert message["status"] == "error"
+    assert "尺寸" in message["message"]
+    assert submitted == []
+
+def test_canvas_patches_materialized_on_generation(ws_client):
+    """测试关键帧加脏矩形在生成时合成为完整草图"""
+    client, session, submitted = ws_client
+    buffer = io.BytesIO()
+    Image.new("RGB", (32, 32), "white").save(buffer, format="PNG")
+    keyframe = buffer.getvalue()
+    buffer = io.BytesIO()
+    Image.new("RGB", (4, 4), "black").save(buffer, format="PNG")
+    patch = encode_patch(8, 8, buffer.getvalue())
+    
+    with client.websocket_connect("/api/ws/s1") as websocket:
+        websocket.send_bytes(encode_frame(FRAME_CANVAS_PATCH, 1, patch))
+        assert websocket.receive_json()["status"] == "error"
+        
+        websocket.send_bytes(encode_frame(FRAME_CANVAS_KEYFRAME, 2, keyframe))
+        websocket.send_bytes(encode_frame(FRAME_CANVAS_PATCH, 3, patch))
+        # 增量更新可能在首次生成期间到达，等待携带最新序号的结果
+        seq = 0
+        while seq != 3:
+            message = websocket.receive()
+            if message.get("bytes") is not None:
+                seq = decode_frame(message["bytes"]).seq
+    
+    image = Image.open(submitted[-1])
+    assert image.getpixel((8, 8)) == (0, 0, 0)
+    assert image.getpixel((12, 12)) == (255, 255, 255)
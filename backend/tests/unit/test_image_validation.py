@@ -0,0 +1,91 @@
+import io
+import pytest
+from PIL import Image
+import app as app_module
+from realtime import ImageHeaderError, read_image_info, validate_image_header
+
+def encode(image_format, size=(123, 45), mode="RGB", **options) -> bytes:
+    buffer = io.BytesIO()
+    Image.new(mode, size, "white").save(buffer, format=image_format, **options)
+    return buffer.getvalue()
+
+@pytest.mark.parametrize("image_format,options,expected", [
+    ("PNG", {}, "png"),
+    ("JPEG", {}, "jpeg"),
+    ("JPEG", {"progressive": True}, "jpeg"),
+    ("WEBP", {}, "webp"),
+    ("WEBP", {"lossless": True}, "webp"),
+])
+def test_read_image_info(image_format, options, expected):
+    """测试只解析文件头得到格式和尺寸"""
+    info = read_image_info(encode(image_format, **options))
+    assert (info.format, info.width, info.height) == (expected, 123, 45)
+    assert info.mime_type == f"image/{expected}"
+
+def test_read_webp_extended_header():
+    """测试带透明通道/元数据的 VP8X 扩展格式"""
+    info = read_image_info(encode("WEBP", size=(300, 200), mode="RGBA", exif=b"Exif\x00\x00abc"))
+    assert (info.width, info.height) == (300, 200)
+
+def test_validate_rejects_oversized_and_malformed():
+    """测试超出边长上限、截断或损坏的文件头被拒绝"""
+    png = encode("PNG", size=(64, 32))
+    assert validate_image_header(png, max_size=64).width == 64
+    with pytest.raises(ImageHeaderError, match="尺寸"):
+        validate_image_header(png, max_size=63)
+    with pytest.raises(ImageHeaderError):
+        validate_image_header(png[:20])
+    with pytest.raises(ImageHeaderError):
+        validate_image_header(b"\x89PNG\r\n\x1a\n" + b"\x00" * 32)
+    with pytest.raises(ImageHeaderError):
+        validate_image_header(encode("JPEG")[:100])
+    with pytest.raises(ImageHeaderError):
+        validate_image_header(b"GIF89a" + b"\x00" * 32)
+
+@pytest.fixture
+def upload_client(monkeypatch, tmp_path):
+    """隔离上传目录和会话状态的测试客户端"""
+    from fastapi.testclient import TestClient
+    state = app_module.AppState()
+    monkeypatch.setattr(app_module, "state", state)
+    monkeypatch.setattr(app_module.config, "UPLOAD_DIR", str(tmp_path))
+    return TestClient(app_module.app), state, tmp_path
+
+def post_sketch(client, data: bytes, session_id: str = "s1"):
+    return client.post(
+        "/api/sketch",
+        files={"file": ("sketch.png", data, "image/png")},
+        data={"session_id": session_id},
+    )
+
+def test_upload_rejects_bad_header_before_session(upload_client):
+    """测试无效图像在创建会话和写盘之前拒绝"""
+    client, state, upload_dir = upload_client
+    response = post_sketch(client, b"\x89PNG\r\n\x1a\n" + b"\x00" * 32)
+    assert response.status_code == 400
+    assert state.get_session("s1") is None
+    assert list(upload_dir.iterdir()) == []
+
+def test_upload_too_large(upload_client, monkeypatch):
+    """测试超过上传上限时返回413，不留下会话和文件"""
+    client, state, upload_dir = upload_client
+    monkeypatch.setattr(app_module.config, "UPLOAD_MAX_BYTES", 1024)
+    # 声明的请求体已超过上限，不读取请求体
+    response = post_sketch(client, encode("PNG") + b"\x00" * (200 * 1024))
+    assert response.status_code == 413
+    # 请求体在上限余量之内，写盘过程中超出上限
+    response = post_sketch(client, encode("PNG") + b"\x00" * 4096)
+    assert response.status_code == 413
+    assert state.get_session("s1") is None
+    assert list(upload_dir.iterdir()) == []
+
+    response = post_sketch(client, encode("JPEG", size=(16, 16)))
+    assert response.status_code == 200
+    assert state.get_session("s1").sketch_path.endswith(".jpeg")
+
+def test_magic_handle_reused_per_thread():
+    """测试 libmagic 句柄按线程复用，常见图像格式不经过 libmagic"""
+    pytest.importorskip("jwt")
+    validators = pytest.importorskip("security.validators")
+    assert validators.get_magic() is validators.get_magic()
+    assert validators.sniff_mime_type(encode("WEBP")) == "image/webp"
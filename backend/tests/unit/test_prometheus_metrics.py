@@ -0,0 +1,71 @@
+import pytest
+import aiohttp
+from fastapi.testclient import TestClient
+import app as app_module
+from app import AppState, Session
+from monitoring import registry
+
+def sample(name, labels=None):
+    return registry.get_sample_value(name, labels or {}) or 0
+
+def test_history_execution_time():
+    """测试根据历史记录时间戳计算执行时间"""
+    messages = [
+        ["execution_start", {"prompt_id": "p", "timestamp": 1000}],
+        ["execution_cached", {"prompt_id": "p", "nodes": []}],
+        ["execution_success", {"prompt_id": "p", "timestamp": 3500}],
+    ]
+    assert app_module.history_execution_time(messages) == 2.5
+    assert app_module.history_execution_time(messages[:1]) is None
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("ws_enabled", [False, True])
+async def test_comfyui_timings_observed(fake_comfyui, fake_comfyui_pool, monkeypatch, ws_enabled):
+    """测试轮询和事件流两种方式都记录排队与执行时间"""
+    fake_comfyui.execution_time = 0.2
+    monkeypatch.setattr(app_module.config, "COMFYUI_POLL_INTERVAL", 0.05)
+    monkeypatch.setattr(app_module.config, "COMFYUI_WS_ENABLED", ws_enabled)
+    backend = fake_comfyui_pool.backends[0]
+    listener = backend.events
+    if ws_enabled:
+        await listener.start()
+        assert await listener.wait_connected(timeout=2)
+    
+    executions = sample("drawing_comfyui_execution_seconds_count")
+    execution_sum = sample("drawing_comfyui_execution_seconds_sum")
+    waits = sample("drawing_comfyui_queue_wait_seconds_count")
+    try:
+        async with aiohttp.ClientSession() as http:
+            prompt_id = await app_module.send_workflow_to_comfyui(http, backend, {"prompt": {}})
+            submitted_at = app_module.time.monotonic()
+            assert await app_module.wait_for_comfyui_processing(http, backend, prompt_id, "metrics-session", submitted_at)
+    finally:
+        await listener.stop()
+    
+    assert sample("drawing_comfyui_execution_seconds_count") == executions + 1
+    assert sample("drawing_comfyui_queue_wait_seconds_count") == waits + 1
+    assert sample("drawing_comfyui_execution_seconds_sum") - execution_sum >= 0.15
+
+def test_metrics_endpoint(monkeypatch):
+    """测试Prometheus端点导出指标和仪表"""
+    state = AppState()
+    state.active_sessions["a"] = Session(session_id="a")
+    state.active_sessions["b"] = Session(session_id="b")
+    monkeypatch.setattr(app_module, "state", state)
+    
+    response = TestClient(app_module.app).get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert "drawing_active_sessions 2.0" in body
+    for name in [
+        "drawing_upload_seconds",
+        "drawing_sketch_decode_seconds",
+        "drawing_workflow_build_seconds",
+        "drawing_comfyui_submit_seconds",
+        "drawing_comfyui_result_fetch_seconds",
+        "drawing_stroke_to_image_seconds",
+        "drawing_open_websockets",
+        "drawing_comfyui_prompts_in_flight",
+    ]:
+        assert name in body
@@ -0,0 +1,108 @@
+import pytest
+import app as app_module
+from app import AppState, Session
+from pipeline import JobScheduler
+from sessions import MemorySessionStore, RateLimiter, SlidingWindowCounter
+
+def test_sliding_window_weights_previous_window():
+    """测试上一窗口的计数按剩余比例计入当前窗口"""
+    counter = SlidingWindowCounter(window=10)
+    for _ in range(10):
+        assert counter.hit("a", limit=10, now=5.0) == 0
+    assert counter.hit("a", limit=10, now=9.0) == pytest.approx(1.0)
+    # 进入下一窗口 2.5 秒后，上一窗口仍折算为 7.5 次
+    for _ in range(2):
+        assert counter.hit("a", limit=10, now=12.5) == 0
+    assert counter.hit("a", limit=10, now=12.5) > 0
+    # 两个窗口之后上一窗口不再计入
+    for _ in range(10):
+        assert counter.hit("a", limit=10, now=30.0) == 0
+
+def test_sliding_window_evicts_idle_keys():
+    """测试空闲 key 被淘汰，key 总数不超过上限"""
+    counter = SlidingWindowCounter(window=10, max_keys=100)
+    for i in range(50):
+        counter.hit(f"old-{i}", limit=5, now=1.0)
+    counter.hit("new", limit=5, now=25.0)
+    assert len(counter) == 1
+    for i in range(500):
+        counter.hit(f"burst-{i}", limit=5, now=26.0)
+    assert len(counter) <= 100
+
+@pytest.mark.asyncio
+async def test_rate_limiter_disabled_and_fails_open():
+    """测试限制为0时不限制，存储出错时放行"""
+    class BrokenStore(MemorySessionStore):
+        async def hit_rate(self, *args, **kwargs):
+            raise ConnectionError("redis unavailable")
+
+    assert await RateLimiter(MemorySessionStore(), "http", 0).acquire("a") == 0
+    limiter = RateLimiter(BrokenStore(), "http", 1)
+    assert await limiter.acquire("a") == 0
+    assert await limiter.acquire("a") == 0
+    assert limiter.get_stats()["allowed"] == 2
+
+def test_http_requests_limited_per_client(monkeypatch):
+    """测试API请求超出限制时返回429，健康检查不受限制"""
+    from fastapi.testclient import TestClient
+    monkeypatch.setattr(app_module, "http_rate_limiter", RateLimiter(MemorySessionStore(), "http", 2))
+    client = TestClient(app_module.app)
+    assert client.get("/api/styles").status_code == 200
+    assert client.get("/api/styles").status_code == 200
+    response = client.get("/api/styles")
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) > 0
+    assert client.get("/api/health").status_code == 200
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send_json(self, data):
+        self.sent.append(data)
+
+@pytest.mark.asyncio
+async def test_jobs_limited_per_client_across_sessions(monkeypatch):
+    """测试同一客户端IP的多个会话共用生成任务额度"""
+    scheduler = JobScheduler()
+    monkeypatch.setattr(app_module, "state", AppState())
+    monkeypatch.setattr(app_module, "job_scheduler", scheduler)
+    monkeypatch.setattr(app_module, "job_rate_limiter", RateLimiter(MemorySessionStore(), "jobs", 2))
+    submitted = []
+    monkeypatch.setattr(scheduler, "submit", lambda key, job: submitted.append(key) or 0)
+    sessions = []
+    for session_id in ("a", "b", "c"):
+        session = Session(session_id=session_id, websocket=FakeWebSocket())
+        session.client_host = "10.0.0.1"
+        sessions.append(session)
+        await app_module.schedule_sketch_processing(session)
+    assert submitted == ["a", "b"]
+    assert sessions[2].websocket.sent[-1]["status"] == "rate_limited"
+
+    other = Session(session_id="d")
+    other.client_host = "10.0.0.2"
+    await app_module.schedule_sketch_processing(other)
+    assert submitted[-1] == "d"
+
+def test_http_limit_keyed_by_forwarded_client(monkeypatch):
+    """测试经受信任代理转发的请求按 X-Forwarded-For 中代理追加的客户端IP分别计数"""
+    from fastapi.testclient import TestClient
+    monkeypatch.setattr(app_module, "http_rate_limiter", RateLimiter(MemorySessionStore(), "http", 1))
+    monkeypatch.setattr(app_module, "trusted_proxies", app_module.parse_trusted_proxies("*"))
+    client = TestClient(app_module.app)
+    assert client.get("/api/styles", headers={"X-Forwarded-For": "10.0.0.1"}).status_code == 200
+    assert client.get("/api/styles", headers={"X-Forwarded-For": "10.0.0.2"}).status_code == 200
+    # 客户端自行填写的最左侧项不能绕过限流，nginx 追加的最后一项才是真实客户端
+    assert client.get("/api/styles", headers={"X-Forwarded-For": "1.2.3.4, 10.0.0.1"}).status_code == 429
+
+class FakeConnection:
+    def __init__(self, peer, forwarded=None):
+        self.client = type("Address", (), {"host": peer})()
+        self.headers = {"x-forwarded-for": forwarded} if forwarded else {}
+
+def test_client_address_skips_trusted_proxies(monkeypatch):
+    """测试只有受信任代理的 X-Forwarded-For 生效，并跳过链路中的受信任代理"""
+    monkeypatch.setattr(app_module, "trusted_proxies", app_module.parse_trusted_proxies("127.0.0.1, 172.16.0.0/12"))
+    assert app_module.client_address(FakeConnection("203.0.113.9", "10.0.0.1")) == "203.0.113.9"
+    assert app_module.client_address(FakeConnection("172.18.0.2", "1.2.3.4, 10.0.0.1, 172.18.0.3")) == "10.0.0.1"
+    assert app_module.client_address(FakeConnection("127.0.0.1")) == "127.0.0.1"
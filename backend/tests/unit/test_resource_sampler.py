@@ -0,0 +1,72 @@
+import time
+import asyncio
+import pytest
+import psutil
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from monitoring import ResourceSampler, ResourceMonitoringMiddleware, metrics_collector
+import app as app_module
+
+@pytest.mark.asyncio
+async def test_sampler_publishes_snapshots():
+    """测试后台采样发布快照并通知回调"""
+    sampler = ResourceSampler(interval=0.05)
+    received = []
+    sampler.add_listener(received.append)
+    
+    await sampler.start()
+    assert sampler.snapshot.timestamp > 0
+    assert sampler.snapshot.memory_total > 0
+    assert sampler.snapshot.cpu_count == psutil.cpu_count()
+    
+    await asyncio.sleep(0.2)
+    await sampler.stop()
+    assert not sampler.running
+    assert sampler.samples >= 3
+    assert received[-1] is sampler.snapshot
+
+def test_sample_does_not_block(monkeypatch):
+    """测试采样不使用阻塞的CPU采样间隔"""
+    real_cpu_percent = psutil.cpu_percent
+    
+    def cpu_percent(interval=None, **kwargs):
+        assert interval is None
+        return real_cpu_percent(interval=None, **kwargs)
+    
+    monkeypatch.setattr(psutil, "cpu_percent", cpu_percent)
+    sampler = ResourceSampler()
+    start = time.perf_counter()
+    sampler.sample()
+    assert time.perf_counter() - start < 0.5
+
+def test_request_path_reads_snapshot(monkeypatch):
+    """测试中间件和健康检查只读取快照"""
+    def blocked(*args, **kwargs):
+        raise AssertionError("请求路径上不应采样")
+    
+    sampler = ResourceSampler()
+    sampler.sample()
+    monkeypatch.setattr("monitoring.middleware.resource_sampler", sampler)
+    monkeypatch.setattr(app_module, "resource_sampler", sampler)
+    monkeypatch.setattr(psutil, "cpu_percent", blocked)
+    monkeypatch.setattr(psutil.Process, "cpu_percent", blocked)
+    
+    test_app = FastAPI()
+    test_app.add_middleware(ResourceMonitoringMiddleware)
+    
+    @test_app.get("/ping")
+    async def ping():
+        return {"ok": True}
+    
+    assert TestClient(test_app).get("/ping").status_code == 200
+    
+    response = TestClient(app_module.app).get("/api/health")
+    assert response.status_code == 200
+    assert response.json()["resources"]["timestamp"] == sampler.snapshot.timestamp
+
+def test_metrics_collector_records_snapshot():
+    """测试指标收集器记录采样结果"""
+    sampler = ResourceSampler()
+    snapshot = sampler.sample()
+    metrics_collector.record_system_metrics(snapshot)
+    assert metrics_collector.get_metrics_summary()["memory"]["percent"] == snapshot.memory_percent
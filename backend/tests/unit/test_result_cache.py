@@ -0,0 +1,141 @@
+import pytest
+import os
+import aiohttp
+from PIL import Image
+import app as app_module
+from app import AppState, StyleConfig
+from comfyui import ComfyUIClient
+from pipeline import ResultCache, hash_file, make_result_key
+
+def write_result(path, size):
+    """写入指定大小的结果文件"""
+    with open(path, "wb") as f:
+        f.write(os.urandom(size))
+    return str(path)
+
+def test_result_key_depends_on_all_inputs():
+    """测试缓存键包含草图、风格、工作流和参数"""
+    key = make_result_key("sketch", "realistic", "workflow")
+    assert key == make_result_key("sketch", "realistic", "workflow")
+    assert key != make_result_key("other", "realistic", "workflow")
+    assert key != make_result_key("sketch", "anime", "workflow")
+    assert key != make_result_key("sketch", "realistic", "changed")
+    assert key != make_result_key("sketch", "realistic", "workflow", seed=1)
+    assert key == make_result_key("sketch", "realistic", "workflow", seed=None)
+
+def test_hash_file(tmp_path):
+    """测试文件内容哈希"""
+    a = tmp_path / "a.png"
+    b = tmp_path / "b.png"
+    a.write_bytes(b"same")
+    b.write_bytes(b"same")
+    assert hash_file(str(a)) == hash_file(str(b))
+
+def test_put_and_get(tmp_path):
+    """测试保存后命中"""
+    cache = ResultCache(str(tmp_path / "cache"))
+    result = write_result(tmp_path / "result.png", 10)
+    
+    assert cache.get("k1") is None
+    cached_path = cache.put("k1", result)
+    assert cache.get("k1") == cached_path
+    assert cache.owns(cached_path)
+    assert not cache.owns(result)
+    
+    stats = cache.get_stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["bytes"] == 10
+
+def test_lru_eviction_by_entries(tmp_path):
+    """测试按条目数淘汰最久未使用的结果"""
+    cache = ResultCache(str(tmp_path / "cache"), max_entries=2)
+    result = write_result(tmp_path / "result.png", 10)
+    path1 = cache.put("k1", result)
+    cache.put("k2", result)
+    cache.get("k1")
+    cache.put("k3", result)
+    
+    assert cache.get("k2") is None
+    assert cache.get("k1") == path1
+    assert cache.get_stats()["evictions"] == 1
+    assert len(os.listdir(tmp_path / "cache")) == 2
+
+def test_eviction_by_bytes(tmp_path):
+    """测试按总字节数淘汰"""
+    cache = ResultCache(str(tmp_path / "cache"), max_bytes=25)
+    for i in range(3):
+        cache.put(f"k{i}", write_result(tmp_path / f"result{i}.png", 10))
+    assert len(cache) == 2
+    assert cache.total_bytes == 20
+    assert cache.get("k0") is None
+
+def test_missing_file_is_a_miss(tmp_path):
+    """测试缓存文件被外部删除时视为未命中"""
+    cache = ResultCache(str(tmp_path / "cache"))
+    cached_path = cache.put("k1", write_result(tmp_path / "result.png", 10))
+    os.remove(cached_path)
+    assert cache.get("k1") is None
+    assert len(cache) == 0
+
+def test_checkout_survives_eviction(tmp_path):
+    """测试会话取出的结果在缓存淘汰该条目后仍然存在"""
+    cache = ResultCache(str(tmp_path / "cache"), max_entries=1)
+    cache.put("k1", write_result(tmp_path / "result1.png", 10))
+    session_result = str(tmp_path / "s1_cached.png")
+    assert cache.checkout("k1", session_result) == session_result
+    assert not cache.owns(session_result)
+    
+    cache.put("k2", write_result(tmp_path / "result2.png", 10))
+    assert cache.get("k1") is None
+    assert os.path.getsize(session_result) == 10
+    assert cache.checkout("k1", str(tmp_path / "other.png")) is None
+
+def test_index_rebuilt_from_disk(tmp_path):
+    """测试重启后从目录重建索引"""
+    cache = ResultCache(str(tmp_path / "cache"))
+    cached_path = cache.put("k1", write_result(tmp_path / "result.png", 10))
+    
+    reloaded = ResultCache(str(tmp_path / "cache"))
+    reloaded.load()
+    assert reloaded.get("k1") == cached_path
+    assert reloaded.total_bytes == 10
+
+@pytest.mark.asyncio
+async def test_repeated_sketch_skips_comfyui(fake_comfyui, fake_comfyui_pool, monkeypatch, tmp_path):
+    """测试相同草图第二次提交直接返回缓存结果"""
+    output_dir = tmp_path / "output"
+    output_dir.mkdir()
+    fake_comfyui.output_dir = str(output_dir)
+    fake_comfyui.execution_time = 0.01
+    client = ComfyUIClient(fake_comfyui.url)
+    await client.start()
+    monkeypatch.setattr(app_module, "comfyui_client", client)
+    monkeypatch.setattr(app_module, "state", AppState())
+    monkeypatch.setattr(app_module, "result_cache", ResultCache(str(tmp_path / "cache")))
+    monkeypatch.setattr(app_module.config, "COMFYUI_WS_ENABLED", False)
+    monkeypatch.setattr(app_module.config, "COMFYUI_POLL_INTERVAL", 0.01)
+    monkeypatch.setattr(app_module.config, "OUTPUT_DIR", str(output_dir))
+    
+    sketch_a = tmp_path / "a.png"
+    sketch_b = tmp_path / "b.png"
+    Image.new("L", (64, 64), 255).save(sketch_a)
+    Image.new("L", (64, 64), 255).save(sketch_b)
+    style = StyleConfig(style_name="realistic")
+    try:
+        first = await app_module.send_to_comfyui(str(sketch_a), style, "s1")
+        second = await app_module.send_to_comfyui(str(sketch_b), style, "s2")
+    finally:
+        await client.close()
+    
+    assert first and second
+    assert len(fake_comfyui.prompts) == 1
+    assert open(first, "rb").read() == open(second, "rb").read()
+    assert app_module.result_cache.get_stats()["hits"] == 1
+    assert second == str(output_dir / "s2_cached.png")
+    
+    # 缓存淘汰该条目后，会话的结果仍可访问
+    app_module.result_cache.max_entries = 0
+    app_module.result_cache.put("other", first)
+    assert len(app_module.result_cache) == 0
+    assert os.path.exists(second)
@@ -0,0 +1,174 @@
+import pytest
+import asyncio
+from pipeline import JobScheduler, SchedulerFullError, SchedulerDrainingError
+from sessions import MemorySessionStore, SlotLimiter
+
+class Recorder:
+    """记录任务执行顺序，任务在释放前保持运行"""
+    
+    def __init__(self):
+        self.started = []
+        self.running = 0
+        self.max_running = 0
+        self.release = asyncio.Event()
+    
+    def job(self, key):
+        async def run():
+            self.started.append(key)
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+            await self.release.wait()
+            self.running -= 1
+        return run
+
+async def drain(scheduler, timeout=2.0):
+    """等待调度器中所有任务完成"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while scheduler.in_flight or scheduler.queue_depth:
+        assert loop.time() < deadline
+        await asyncio.sleep(0.01)
+
+@pytest.mark.asyncio
+async def test_limits_in_flight_jobs():
+    """测试并发任务数不超过上限"""
+    scheduler = JobScheduler(max_in_flight=2, max_queue=10)
+    recorder = Recorder()
+    positions = [scheduler.submit(f"s{i}", recorder.job(f"s{i}")) for i in range(5)]
+    
+    assert positions == [0, 0, 1, 2, 3]
+    assert scheduler.in_flight == 2
+    assert scheduler.queue_depth == 3
+    await asyncio.sleep(0.01)
+    assert recorder.running == 2
+    
+    recorder.release.set()
+    await drain(scheduler)
+    assert recorder.max_running == 2
+    assert recorder.started == ["s0", "s1", "s2", "s3", "s4"]
+    assert scheduler.get_stats()["completed"] == 5
+
+@pytest.mark.asyncio
+async def test_duplicate_submit_keeps_position():
+    """测试同一会话重复提交不会重复入队"""
+    scheduler = JobScheduler(max_in_flight=1, max_queue=10)
+    recorder = Recorder()
+    scheduler.submit("a", recorder.job("a"))
+    assert scheduler.submit("b", recorder.job("b")) == 1
+    assert scheduler.submit("b", recorder.job("b")) == 1
+    assert scheduler.queue_depth == 1
+    await scheduler.stop()
+
+@pytest.mark.asyncio
+async def test_round_robin_across_sessions():
+    """测试频繁提交的会话不会饿死其他会话"""
+    scheduler = JobScheduler(max_in_flight=1, max_queue=10)
+    order = []
+    
+    def busy_job():
+        async def run():
+            order.append("busy")
+            await asyncio.sleep(0)
+            if order.count("busy") < 3:
+                scheduler.submit("busy", busy_job())
+        return run
+    
+    def quiet_job(key):
+        async def run():
+            order.append(key)
+            await asyncio.sleep(0)
+        return run
+    
+    scheduler.submit("busy", busy_job())
+    scheduler.submit("q1", quiet_job("q1"))
+    scheduler.submit("q2", quiet_job("q2"))
+    await drain(scheduler)
+    assert order == ["busy", "q1", "q2", "busy", "busy"]
+
+@pytest.mark.asyncio
+async def test_same_session_never_runs_concurrently():
+    """测试同一会话同一时间只运行一个任务"""
+    scheduler = JobScheduler(max_in_flight=4, max_queue=10)
+    recorder = Recorder()
+    scheduler.submit("a", recorder.job("a"))
+    assert scheduler.submit("a", recorder.job("a")) == 1
+    assert scheduler.in_flight == 1
+    recorder.release.set()
+    await drain(scheduler)
+    assert recorder.started == ["a", "a"]
+    assert recorder.max_running == 1
+
+@pytest.mark.asyncio
+async def test_rejects_when_queue_full():
+    """测试队列满时拒绝新任务"""
+    scheduler = JobScheduler(max_in_flight=1, max_queue=1)
+    recorder = Recorder()
+    scheduler.submit("a", recorder.job("a"))
+    scheduler.submit("b", recorder.job("b"))
+    with pytest.raises(SchedulerFullError):
+        scheduler.submit("c", recorder.job("c"))
+    
+    stats = scheduler.get_stats()
+    assert stats["rejected"] == 1
+    assert stats["queue_depth"] == 1
+    assert stats["in_flight"] == 1
+    await scheduler.stop()
+
+@pytest.mark.asyncio
+async def test_failed_job_does_not_block_queue():
+    """测试任务异常后继续调度"""
+    scheduler = JobScheduler(max_in_flight=1, max_queue=10)
+    recorder = Recorder()
+    recorder.release.set()
+    
+    async def broken():
+        raise RuntimeError("boom")
+    
+    scheduler.submit("a", broken)
+    scheduler.submit("b", recorder.job("b"))
+    await drain(scheduler)
+    stats = scheduler.get_stats()
+    assert stats["failed"] == 1
+    assert stats["completed"] == 1
+    assert stats["wait_seconds_max"] >= 0
+
+@pytest.mark.asyncio
+async def test_drain_waits_for_running_jobs():
+    """测试停止时丢弃排队任务、等待运行中的任务完成并拒绝新任务"""
+    scheduler = JobScheduler(max_in_flight=1, max_queue=10)
+    recorder = Recorder()
+    scheduler.submit("s0", recorder.job("s0"))
+    scheduler.submit("s1", recorder.job("s1"))
+    await asyncio.sleep(0.01)
+    
+    asyncio.get_running_loop().call_later(0.05, recorder.release.set)
+    assert await scheduler.drain(timeout=2.0)
+    assert recorder.started == ["s0"]
+    assert recorder.running == 0
+    with pytest.raises(SchedulerDrainingError):
+        scheduler.submit("s2", recorder.job("s2"))
+    
+    # 超时的任务被取消
+    scheduler = JobScheduler(max_in_flight=1)
+    scheduler.submit("s0", Recorder().job("s0"))
+    await asyncio.sleep(0.01)
+    assert not await scheduler.drain(timeout=0.05)
+    assert scheduler.in_flight == 0
+
+@pytest.mark.asyncio
+async def test_shared_limiter_bounds_all_schedulers():
+    """测试多个调度器（模拟多个 worker）共享全局并发上限"""
+    store = MemorySessionStore()
+    schedulers = [JobScheduler(max_in_flight=2, limiter=SlotLimiter(store, "comfyui", 2)) for _ in range(3)]
+    recorder = Recorder()
+    for index, scheduler in enumerate(schedulers):
+        for i in range(2):
+            scheduler.submit(f"w{index}-s{i}", recorder.job(f"w{index}-s{i}"))
+    await asyncio.sleep(0.1)
+    assert recorder.running == 2
+    
+    recorder.release.set()
+    for scheduler in schedulers:
+        await drain(scheduler)
+    assert len(recorder.started) == 6
+    assert recorder.max_running == 2
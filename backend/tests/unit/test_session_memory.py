@@ -0,0 +1,100 @@
+import pytest
+import time
+import tracemalloc
+import app as app_module
+from app import AppState, Session, style_config_for
+from sessions import MEMORY_SKETCH, MEMORY_CANVAS, MemoryBudget, MemoryBudgetExceeded
+
+def test_budget_tracks_latest_size_per_kind():
+    """测试同一类别只记最新大小，释放后合计归零"""
+    budget = MemoryBudget(max_bytes=1000)
+    budget.charge("a", MEMORY_SKETCH, 300)
+    budget.charge("a", MEMORY_SKETCH, 200)
+    budget.charge("a", MEMORY_CANVAS, 100)
+    budget.charge("b", MEMORY_SKETCH, 50)
+    assert budget.usage("a") == 300
+    assert budget.total == 350
+    budget.set("a", MEMORY_CANVAS, 0)
+    assert budget.usage("a", MEMORY_CANVAS) == 0
+    assert budget.release("a") == 200
+    assert budget.total == 50
+    assert "a" not in budget
+
+def test_budget_rejects_over_limits():
+    """测试超出单会话上限或全局预算时拒绝且不记账"""
+    budget = MemoryBudget(max_bytes=1000, max_session_bytes=600)
+    with pytest.raises(MemoryBudgetExceeded):
+        budget.charge("a", MEMORY_CANVAS, 700)
+    budget.charge("a", MEMORY_CANVAS, 600)
+    assert budget.shortfall("b", MEMORY_SKETCH, 500) == 100
+    with pytest.raises(MemoryBudgetExceeded):
+        budget.charge("b", MEMORY_SKETCH, 500)
+    assert budget.total == 600
+    assert budget.get_stats()["rejected"] == 2
+
+class FakeWebSocket:
+    async def close(self, code=1000, reason=""):
+        pass
+
+@pytest.mark.asyncio
+async def test_reserve_memory_evicts_oldest_idle_session(monkeypatch):
+    """测试超出预算时淘汰最久未活动的空闲会话，已连接的会话保留"""
+    state = AppState()
+    state.memory = MemoryBudget(max_bytes=1000)
+    monkeypatch.setattr(app_module, "state", state)
+    now = time.time()
+    for index, session_id in enumerate(("connected", "old", "recent")):
+        session = await state.create_session(session_id)
+        session.last_update = now - 100 + index
+        await state.reserve_memory(session, MEMORY_CANVAS, 300)
+    state.active_sessions["connected"].websocket = FakeWebSocket()
+
+    newcomer = await state.create_session("new")
+    await state.reserve_memory(newcomer, MEMORY_CANVAS, 300)
+    assert state.get_session("old") is None
+    assert await state.store.get("old") is None
+    assert state.get_session("recent") is not None
+    assert state.memory.total == 900
+
+    # 只剩已连接的会话可淘汰时拒绝
+    with pytest.raises(MemoryBudgetExceeded):
+        await state.reserve_memory(newcomer, MEMORY_CANVAS, 800)
+    assert state.get_session("connected") is not None
+    assert state.memory.usage("new") == 300
+
+@pytest.mark.asyncio
+async def test_new_sketch_removes_previous_file(monkeypatch, tmp_path):
+    """测试未在处理中的旧草图文件在收到新草图时删除"""
+    state = AppState()
+    monkeypatch.setattr(app_module, "state", state)
+    monkeypatch.setattr(app_module, "schedule_sketch_processing", lambda session: _noop())
+    session = await state.create_session("s1")
+    previous = tmp_path / "old.png"
+    previous.write_bytes(b"old")
+    session.sketch_path = str(previous)
+    await app_module.submit_sketch(session, str(tmp_path / "new.png"))
+    assert not previous.exists()
+    assert session.sketch_path == str(tmp_path / "new.png")
+    state.remove_session("s1")
+    assert state.memory.total == 0
+
+async def _noop():
+    pass
+
+def test_session_is_compact():
+    """测试会话没有实例字典、风格配置共用，单个会话开销较小"""
+    session = Session(session_id="s1", style_config=style_config_for("anime"))
+    assert not hasattr(session, "__dict__")
+    assert session.style_config is style_config_for("anime")
+
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        sessions = [
+            Session(session_id=f"session-{i:05d}", style_config=style_config_for("realistic"))
+            for i in range(10000)
+        ]
+        per_session = (tracemalloc.get_traced_memory()[0] - before) / len(sessions)
+    finally:
+        tracemalloc.stop()
+    assert per_session < 400
@@ -0,0 +1,134 @@
+import pytest
+import pytest_asyncio
+import asyncio
+import app as app_module
+from app import AppState
+from sessions import SessionRecord, MemorySessionStore, RedisSessionStore
+
+fakeredis = pytest.importorskip("fakeredis")
+
+def redis_store(server, **kwargs):
+    """连接到同一个模拟 Redis 服务的存储，相当于不同 worker"""
+    client = fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+    return RedisSessionStore(client=client, **kwargs)
+
+@pytest_asyncio.fixture(params=["memory", "redis"])
+async def store(request):
+    """分别测试内存存储和 Redis 存储"""
+    if request.param == "memory":
+        store = MemorySessionStore()
+    else:
+        store = redis_store(fakeredis.FakeServer())
+    yield store
+    await store.close()
+
+@pytest.mark.asyncio
+async def test_create_update_and_limit(store):
+    """测试创建、部分更新和全局会话数上限"""
+    assert await store.create(SessionRecord("a", style_name="anime"), max_sessions=2)
+    assert await store.create(SessionRecord("b"), max_sessions=2)
+    assert not await store.create(SessionRecord("c"), max_sessions=2)
+    # 已存在的会话不受上限影响
+    assert await store.create(SessionRecord("a"), max_sessions=2)
+    assert await store.count() == 2
+    
+    assert await store.update("a", result_path="output/a.png")
+    assert not await store.update("missing", result_path="x")
+    record = await store.get("a")
+    assert record.style_name == "anime"
+    assert record.result_path == "output/a.png"
+    assert record.sketch_path is None
+    assert record.last_update > 0
+    
+    await store.delete("a")
+    assert await store.get("a") is None
+    assert await store.create(SessionRecord("c"), max_sessions=2)
+
+@pytest.mark.asyncio
+async def test_websocket_ownership(store):
+    """测试 WebSocket 归属只能由当前持有者释放"""
+    await store.create(SessionRecord("a"))
+    assert await store.claim("a", "w1") is None
+    assert await store.claim("a", "w2") == "w1"
+    assert not await store.release("a", "w1")
+    assert (await store.get("a")).owner == "w2"
+    assert await store.release("a", "w2")
+    assert (await store.get("a")).owner is None
+
+@pytest.mark.asyncio
+async def test_slots(store):
+    """测试全局并发槽：上限、续约、释放和租约过期"""
+    assert await store.acquire_slot("comfyui", "a", limit=2, lease=30)
+    assert await store.acquire_slot("comfyui", "b", limit=2, lease=30)
+    assert not await store.acquire_slot("comfyui", "c", limit=2, lease=30)
+    await store.release_slot("comfyui", "a")
+    assert await store.acquire_slot("comfyui", "c", limit=2, lease=30)
+    
+    # 未续约的位置过期后被回收
+    await store.acquire_slot("short", "a", limit=1, lease=0.05)
+    await store.renew_slots("short", ["a"], lease=0.05)
+    await asyncio.sleep(0.1)
+    assert await store.acquire_slot("short", "b", limit=1, lease=30)
+
+@pytest.mark.asyncio
+async def test_rate_limit(store):
+    """测试速率限制：超出后拒绝且不计数，各 key 独立"""
+    for _ in range(3):
+        assert await store.hit_rate("jobs", "a", limit=3, window=60) == 0
+    retry_after = await store.hit_rate("jobs", "a", limit=3, window=60)
+    assert 0 < retry_after <= 60
+    assert await store.hit_rate("jobs", "b", limit=3, window=60) == 0
+    assert await store.hit_rate("http", "a", limit=3, window=60) == 0
+
+@pytest.mark.asyncio
+async def test_rate_limit_shared_between_workers():
+    """测试 Redis 存储上的速率限制由所有 worker 合计"""
+    server = fakeredis.FakeServer()
+    worker1, worker2 = redis_store(server), redis_store(server)
+    assert await worker1.hit_rate("jobs", "1.2.3.4", limit=2, window=60) == 0
+    assert await worker2.hit_rate("jobs", "1.2.3.4", limit=2, window=60) == 0
+    assert await worker1.hit_rate("jobs", "1.2.3.4", limit=2, window=60) > 0
+    assert await worker2.hit_rate("jobs", "1.2.3.4", limit=2, window=60) > 0
+    await worker1.close()
+    await worker2.close()
+
+@pytest.mark.asyncio
+async def test_expired_sessions_not_counted():
+    """测试过期会话不计入上限"""
+    store = redis_store(fakeredis.FakeServer(), session_ttl=60)
+    await store.create(SessionRecord("old", last_update=1.0))
+    assert await store.count() == 0
+    assert await store.create(SessionRecord("new"), max_sessions=1)
+    await store.close()
+
+@pytest.mark.asyncio
+async def test_sessions_shared_between_workers(monkeypatch, tmp_path):
+    """测试一个 worker 创建的会话可被另一个 worker 载入，结果完成后通知其他 worker"""
+    server = fakeredis.FakeServer()
+    worker_a = AppState(redis_store(server), worker_id="a")
+    worker_b = AppState(redis_store(server), worker_id="b")
+    monkeypatch.setattr(app_module, "state", worker_a)
+    await worker_a.store.start(app_module.handle_session_event)
+    try:
+        session = await worker_a.create_session("s1")
+        await worker_a.store.update("s1", sketch_path="uploads/s1.png", style_name="anime")
+        
+        loaded = await worker_b.load_session("s1")
+        assert loaded.sketch_path == "uploads/s1.png"
+        assert loaded.style_config.style_name == "anime"
+        
+        # worker b 完成生成，worker a 上的副本收到通知
+        loaded.result_path = str(tmp_path / "result.png")
+        loaded.processing_sketch_path = loaded.sketch_path
+        monkeypatch.setattr(app_module, "state", worker_b)
+        await app_module.publish_result(loaded)
+        monkeypatch.setattr(app_module, "state", worker_a)
+        for _ in range(100):
+            if session.result_path:
+                break
+            await asyncio.sleep(0.01)
+        assert session.result_path == str(tmp_path / "result.png")
+        assert (await worker_a.store.get("s1")).result_path == session.result_path
+    finally:
+        await worker_a.store.close()
+        await worker_b.store.close()
@@ -0,0 +1,76 @@
+import pytest
+import asyncio
+import base64
+import os
+import app as app_module
+from app import Session, WebSocketMessage
+
+SKETCH_DATA = "data:image/png;base64," + base64.b64encode(b"fake png").decode()
+
+# 每次提交都阻塞到测试设置 release，模拟处理中的任务
+pytestmark = pytest.mark.parametrize("sketch_pipeline", [{"block": True}], indirect=True)
+
+async def wait_until(predicate, timeout=2.0):
+    """等待条件成立"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not predicate():
+        assert loop.time() < deadline
+        await asyncio.sleep(0.01)
+
+@pytest.mark.asyncio
+async def test_latest_sketch_wins(sketch_pipeline):
+    """测试处理期间的多次更新只补跑一次最新草图"""
+    calls, release = sketch_pipeline.calls, sketch_pipeline.release
+    session = Session(session_id="s1")
+    sketch_pipeline.state.active_sessions["s1"] = session
+    message = WebSocketMessage(type="sketch_update", sketch_data=SKETCH_DATA)
+    
+    await app_module.handle_sketch_update(session, message)
+    await wait_until(lambda: len(calls) == 1)
+    first_sketch = calls[0]
+    
+    for _ in range(10):
+        await asyncio.sleep(0.002)
+        await app_module.handle_sketch_update(session, message)
+    latest_sketch = session.sketch_path
+    assert session.needs_reprocess
+    
+    release.set()
+    await wait_until(lambda: len(calls) == 2)
+    assert calls == [first_sketch, latest_sketch]
+    
+    release.set()
+    await wait_until(lambda: not session.is_processing)
+    assert len(calls) == 2
+    assert not session.needs_reprocess
+    # 被覆盖的中间草图和已处理完的旧草图都已删除，只保留最新草图
+    assert os.listdir(app_module.config.UPLOAD_DIR) == [os.path.basename(latest_sketch)]
+
+@pytest.mark.asyncio
+async def test_stale_prompt_cancelled_once(sketch_pipeline, monkeypatch):
+    """测试开启取消后只取消一次正在处理的prompt"""
+    calls, release = sketch_pipeline.calls, sketch_pipeline.release
+    cancelled = []
+    
+    async def cancel_comfyui_prompt(prompt_id, backend_url=None):
+        cancelled.append(prompt_id)
+    
+    monkeypatch.setattr(app_module, "cancel_comfyui_prompt", cancel_comfyui_prompt)
+    monkeypatch.setattr(app_module.config, "COMFYUI_CANCEL_STALE", True)
+    session = Session(session_id="s1")
+    sketch_pipeline.state.active_sessions["s1"] = session
+    message = WebSocketMessage(type="sketch_update", sketch_data=SKETCH_DATA)
+    
+    await app_module.handle_sketch_update(session, message)
+    await wait_until(lambda: len(calls) == 1)
+    session.prompt_id = "prompt-1"
+    for _ in range(3):
+        await app_module.handle_sketch_update(session, message)
+    await asyncio.sleep(0)
+    assert cancelled == ["prompt-1"]
+    
+    release.set()
+    await wait_until(lambda: len(calls) == 2)
+    release.set()
+    await wait_until(lambda: not session.is_processing)
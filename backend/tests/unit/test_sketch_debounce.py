@@ -0,0 +1,84 @@
+import pytest
+import asyncio
+import base64
+import app as app_module
+from app import AppState, Session, WebSocketMessage
+from pipeline import AdaptiveDebounce
+from sessions import TimerWheel
+
+SKETCH_DATA = "data:image/png;base64," + base64.b64encode(b"fake png").decode()
+
+def test_idle_uses_min_window():
+    """测试有空闲槽位或尚无耗时数据时使用最小窗口"""
+    debounce = AdaptiveDebounce(min_window=0.1, max_window=2.0, load_factor=0.5)
+    assert debounce.window(queue_depth=5, in_flight=2, max_in_flight=2) == 0.1
+    debounce.record_latency(4.0)
+    assert debounce.window(queue_depth=0, in_flight=1, max_in_flight=2) == 0.1
+
+def test_window_grows_with_load_and_is_capped():
+    """测试槽位占满后窗口随排队数和生成耗时增长，且不超过最大窗口"""
+    debounce = AdaptiveDebounce(min_window=0.1, max_window=2.0, load_factor=0.5)
+    debounce.record_latency(1.0)
+    assert debounce.window(queue_depth=0, in_flight=2, max_in_flight=2) == pytest.approx(0.35)
+    assert debounce.window(queue_depth=3, in_flight=2, max_in_flight=2) == pytest.approx(1.1)
+    assert debounce.window(queue_depth=50, in_flight=2, max_in_flight=2) == 2.0
+    assert debounce.get_stats()["last_window"] == 2.0
+
+def test_latency_is_smoothed():
+    """测试生成耗时取指数移动平均"""
+    debounce = AdaptiveDebounce(smoothing=0.5)
+    debounce.record_latency(2.0)
+    debounce.record_latency(4.0)
+    assert debounce.latency == pytest.approx(3.0)
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("sketch_pipeline", [{"debounce": (0.1, 1.0)}], indirect=True)
+async def test_burst_submits_latest_sketch_once(sketch_pipeline):
+    """测试防抖窗口内的连续更新只提交一次最新草图"""
+    state, calls = sketch_pipeline.state, sketch_pipeline.calls
+    state.debounce_timers = TimerWheel(tick=0.01)
+    session = Session(session_id="s1")
+    state.active_sessions["s1"] = session
+    message = WebSocketMessage(type="sketch_update", sketch_data=SKETCH_DATA)
+
+    await state.debounce_timers.start()
+    try:
+        for _ in range(5):
+            await app_module.handle_sketch_update(session, message)
+            await asyncio.sleep(0.02)
+        assert calls == []
+        assert ("debounce", "s1") in state.debounce_timers
+        await asyncio.sleep(0.3)
+        assert calls == [session.sketch_path]
+        assert session.debounce_window == pytest.approx(0.1)
+    finally:
+        await state.debounce_timers.stop()
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("sketch_pipeline", [{"debounce": (10, 10)}], indirect=True)
+async def test_stopped_wheel_submits_immediately(sketch_pipeline):
+    """测试防抖时间轮未运行时草图立即提交，不会滞留在定时器中"""
+    state, calls = sketch_pipeline.state, sketch_pipeline.calls
+    session = Session(session_id="s1")
+    state.active_sessions["s1"] = session
+
+    assert not state.debounce_timers.running
+    await app_module.handle_sketch_update(session, WebSocketMessage(type="sketch_update", sketch_data=SKETCH_DATA))
+    for _ in range(100):
+        if calls:
+            break
+        await asyncio.sleep(0.01)
+    assert calls == [session.sketch_path]
+    assert len(state.debounce_timers) == 0
+
+def test_window_summary_is_bounded(monkeypatch):
+    """测试健康检查只汇总防抖窗口分布，不逐个列出会话"""
+    state = AppState()
+    monkeypatch.setattr(app_module, "state", state)
+    assert app_module.debounce_window_summary() == {"count": 0}
+    for index, window in enumerate((0.5, 0.1, 2.0)):
+        session = Session(session_id=f"s{index}", websocket=object())
+        session.debounce_window = window
+        state.active_sessions[session.session_id] = session
+    state.active_sessions["idle"] = Session(session_id="idle")
+    assert app_module.debounce_window_summary() == {"count": 3, "min": 0.1, "p50": 0.5, "max": 2.0}
@@ -0,0 +1,35 @@
+from PIL import Image, ImageDraw
+import app as app_module
+from pipeline import sketch_fingerprint
+
+def _sketch(path, strokes=(), size=(1024, 768), mode="RGBA"):
+    image = Image.new(mode, size, (0, 0, 0, 0) if mode == "RGBA" else "white")
+    draw = ImageDraw.Draw(image)
+    for box in strokes:
+        draw.line(box, fill="black", width=6)
+    image.save(path)
+    return str(path)
+
+def test_identical_sketches_have_no_difference(tmp_path):
+    """测试相同草图的指纹差异为0，透明背景与白色背景等价"""
+    a = sketch_fingerprint(_sketch(tmp_path / "a.png", [(0, 0, 500, 500)]))
+    b = sketch_fingerprint(_sketch(tmp_path / "b.png", [(0, 0, 500, 500)], mode="RGB"))
+    assert a.difference(b) == 0.0
+
+def test_small_dot_is_below_threshold(tmp_path):
+    """测试单个格子内的小点低于默认阈值，短笔画和长笔画都超过阈值"""
+    threshold = app_module.Config.SKETCH_CHANGE_THRESHOLD
+    base = sketch_fingerprint(_sketch(tmp_path / "a.png", [(0, 0, 500, 500)]))
+    # 1024x768 画布上每个格子 16x12 像素，该点只落在一个格子内
+    dot = sketch_fingerprint(_sketch(tmp_path / "b.png", [(0, 0, 500, 500), (808, 605, 809, 605)]))
+    short = sketch_fingerprint(_sketch(tmp_path / "c.png", [(0, 0, 500, 500), (100, 700, 150, 700)]))
+    stroke = sketch_fingerprint(_sketch(tmp_path / "d.png", [(0, 0, 500, 500), (0, 700, 1000, 100)]))
+    assert base.difference(dot) < threshold
+    assert base.difference(short) >= threshold
+    assert base.difference(stroke) > 0.01
+
+def test_size_change_is_full_difference(tmp_path):
+    """测试尺寸不同的草图视为完全不同"""
+    a = sketch_fingerprint(_sketch(tmp_path / "a.png"))
+    b = sketch_fingerprint(_sketch(tmp_path / "b.png", size=(800, 600)))
+    assert a.difference(b) == 1.0
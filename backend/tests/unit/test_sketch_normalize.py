@@ -0,0 +1,56 @@
+import pytest
+from PIL import Image
+import app as app_module
+from pipeline import fit_size, normalize_sketch
+
+@pytest.mark.parametrize("size,expected", [
+    ((4000, 3000), (1024, 768)),   # 按比例缩小并对齐到64的倍数
+    ((3000, 4000), (768, 1024)),
+    ((1000, 500), (960, 448)),     # 不放大，只向下对齐
+    ((30, 20), (64, 64)),          # 至少一个倍数
+    ((1024, 1024), (1024, 1024)),
+])
+def test_fit_size(size, expected):
+    """测试目标尺寸保持宽高比、不超过上限且为倍数"""
+    assert fit_size(*size, 1024, 1024, 64) == expected
+
+def test_fit_size_upscale():
+    """测试开启放大时小图放大到目标尺寸"""
+    assert fit_size(500, 250, 1024, 1024, 64, upscale=True) == (1024, 512)
+
+def test_normalize_flattens_alpha_and_strips_metadata(tmp_path):
+    """测试透明草图合成到白色背景、缩小并去除元数据"""
+    src = tmp_path / "sketch.png"
+    image = Image.new("RGBA", (2048, 1536), (0, 0, 0, 0))
+    image.paste((255, 0, 0, 255), (0, 0, 1024, 1536))
+    image.save(src, pnginfo=_text_info())
+
+    dst = tmp_path / "out.png"
+    assert normalize_sketch(str(src), str(dst), 1024, 1024, 64) == (1024, 768)
+    with Image.open(dst) as result:
+        assert result.mode == "RGB"
+        assert result.size == (1024, 768)
+        assert result.getpixel((10, 10)) == (255, 0, 0)
+        assert result.getpixel((1000, 10)) == (255, 255, 255)
+        assert "comment" not in result.info
+
+def _text_info():
+    from PIL.PngImagePlugin import PngInfo
+    info = PngInfo()
+    info.add_text("comment", "x" * 1000)
+    return info
+
+@pytest.mark.asyncio
+async def test_prepare_sketch_uses_template_spec(monkeypatch, tmp_path):
+    """测试模板声明了输入要求时提交规范化后的草图，关闭后提交原草图"""
+    src = tmp_path / "sketch.png"
+    Image.new("L", (2000, 1000), 255).save(src)
+    style_config = app_module.style_config_for("realistic")
+
+    path = await app_module.prepare_sketch(str(src), style_config)
+    assert path == str(tmp_path / "sketch.normalized.png")
+    with Image.open(path) as result:
+        assert (result.mode, result.size) == ("RGB", (1024, 512))
+
+    monkeypatch.setattr(app_module.config, "SKETCH_NORMALIZE", False)
+    assert await app_module.prepare_sketch(str(src), style_config) == str(src)
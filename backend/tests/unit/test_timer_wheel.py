@@ -0,0 +1,120 @@
+import pytest
+import asyncio
+import time
+import app as app_module
+from app import AppState, Session
+from sessions import TimerWheel
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+    
+    def __call__(self) -> float:
+        return self.now
+
+def run_until(wheel, clock, end, step=0.5):
+    """推进时钟，记录每个定时器触发的时间"""
+    while clock.now < end:
+        clock.now += step
+        wheel.advance()
+
+def test_fires_at_deadline():
+    """测试定时器在到期后的第一个 tick 触发，远期定时器经逐层下放后精度不变"""
+    clock = FakeClock()
+    wheel = TimerWheel(tick=1.0, slots=4, levels=3, clock=clock)
+    fired = {}
+    deadlines = {"soon": 1002.5, "later": 1037.2, "far": 1500.0, "overdue": 990.0}
+    for key, deadline in deadlines.items():
+        wheel.schedule(key, deadline, lambda key=key: fired.setdefault(key, clock.now))
+    assert len(wheel) == 4
+    
+    run_until(wheel, clock, 1600)
+    assert len(wheel) == 0
+    assert fired["overdue"] == 1001.0
+    for key in ("soon", "later", "far"):
+        assert deadlines[key] <= fired[key] < deadlines[key] + 1.0
+
+def test_reschedule_and_cancel():
+    """测试重设和取消定时器"""
+    clock = FakeClock()
+    wheel = TimerWheel(tick=1.0, slots=8, levels=2, clock=clock)
+    fired = []
+    wheel.schedule_in("a", 5, lambda: fired.append("a"))
+    wheel.schedule_in("b", 5, lambda: fired.append("b"))
+    wheel.schedule_in("a", 20, lambda: fired.append("a2"))
+    assert wheel.cancel("b")
+    assert not wheel.cancel("b")
+    
+    run_until(wheel, clock, 1010)
+    assert fired == []
+    assert wheel.deadline("a") == 1020
+    run_until(wheel, clock, 1021)
+    assert fired == ["a2"]
+
+def test_callback_can_rearm():
+    """测试回调中可以重新设置同一个定时器"""
+    clock = FakeClock()
+    wheel = TimerWheel(tick=1.0, clock=clock)
+    fired = []
+    
+    def rearm():
+        fired.append(clock.now)
+        if len(fired) < 3:
+            wheel.schedule_in("k", 10, rearm)
+    
+    wheel.schedule_in("k", 10, rearm)
+    run_until(wheel, clock, 1100, step=1.0)
+    assert fired == [1010.0, 1020.0, 1030.0]
+
+@pytest.mark.asyncio
+async def test_idle_session_expires_on_time(monkeypatch):
+    """测试空闲会话在超时后被清理，期间有活动则顺延"""
+    monkeypatch.setattr(app_module.config, "SESSION_TIMEOUT", 0.2)
+    state = AppState()
+    state.timers = TimerWheel(tick=0.01)
+    monkeypatch.setattr(app_module, "state", state)
+    await state.timers.start()
+    try:
+        await state.create_session("idle")
+        active = await state.create_session("active")
+        await asyncio.sleep(0.12)
+        active.last_update = time.time()
+        await asyncio.sleep(0.12)
+        assert state.get_session("idle") is None
+        assert state.get_session("active") is not None
+        assert await state.store.get("idle") is None
+        await asyncio.sleep(0.2)
+        assert state.get_session("active") is None
+    finally:
+        await state.timers.stop()
+
+class FakeWebSocket:
+    def __init__(self):
+        self.closed = None
+    
+    async def close(self, code=1000, reason=""):
+        self.closed = reason
+
+@pytest.mark.asyncio
+async def test_heartbeat_timeout_closes_connection(monkeypatch):
+    """测试心跳超时断开连接，按时收到心跳的连接保持"""
+    monkeypatch.setattr(app_module.config, "HEARTBEAT_TIMEOUT", 0.1)
+    state = AppState()
+    state.timers = TimerWheel(tick=0.01)
+    monkeypatch.setattr(app_module, "state", state)
+    sessions = {}
+    for session_id in ("silent", "alive"):
+        session = sessions[session_id] = Session(session_id=session_id, websocket=FakeWebSocket())
+        state.active_sessions[session_id] = session
+        app_module.watch_heartbeat(session, session.websocket)
+    await state.timers.start()
+    try:
+        for _ in range(4):
+            await asyncio.sleep(0.05)
+            sessions["alive"].last_heartbeat = time.time()
+        assert sessions["silent"].websocket.closed == "Heartbeat timeout"
+        assert not sessions["silent"].is_alive
+        assert sessions["alive"].websocket.closed is None
+        assert ("heartbeat", "alive") in state.timers
+    finally:
+        await state.timers.stop()
@@ -0,0 +1,68 @@
+import time
+import pytest
+from monitoring import RollupSeries, TimeSeries, MetricsCollector
+
+def test_rollup_aggregates_window():
+    """测试窗口汇总"""
+    series = RollupSeries(resolution=1, size=10)
+    for t, value in [(100.1, 1.0), (100.9, 3.0), (103.5, 5.0)]:
+        series.add(value, t)
+    
+    assert series.aggregate(5, now=104) == {"count": 3, "sum": 9.0, "avg": 3.0, "min": 1.0, "max": 5.0}
+    assert series.aggregate(2, now=104)["count"] == 1
+    assert [bucket["count"] for bucket in series.history(10, now=104)] == [2, 1]
+
+def test_rollup_memory_is_bounded():
+    """测试环形覆盖旧桶"""
+    series = RollupSeries(resolution=1, size=10)
+    for t in range(1000):
+        series.add(1.0, t)
+    
+    assert series.aggregate(1000, now=999)["count"] == 10
+    # 早于覆盖范围的数据点被丢弃
+    series.add(100.0, 5)
+    assert series.aggregate(10, now=999)["max"] == 1.0
+
+def test_timeseries_picks_tier():
+    """测试按窗口选择汇总粒度"""
+    series = TimeSeries(tiers=((1, 60), (60, 60)))
+    now = 10019.0  # 与分钟桶对齐
+    for i in range(600):
+        series.add(float(i % 10), now - i)
+    
+    assert series.tier_for(30).resolution == 1
+    assert series.tier_for(600).resolution == 60
+    assert series.aggregate(30, now=now)["count"] == 30
+    assert series.aggregate(600, now=now)["count"] == 600
+    assert series.total == 600
+    assert series.last_value == 9.0
+
+def test_metrics_collector_recent_requests():
+    """测试最近请求汇总"""
+    collector = MetricsCollector(tiers=((1, 600), (60, 60)))
+    collector.record_request("/api/health", "GET", 200, 0.1)
+    collector.record_request("/api/health", "GET", 200, 0.3)
+    collector.record_request("/api/upload", "POST", 500, 0.5)
+    
+    summary = collector.get_metrics_summary()
+    assert summary["requests"]["total"] == 3
+    recent = summary["requests"]["recent"]
+    assert recent["count"] == 3
+    assert recent["avg_duration"] == pytest.approx(0.3)
+    assert recent["max_duration"] == 0.5
+    assert recent["errors"] == 1
+
+def test_record_request_is_constant_cost():
+    """测试写入和窗口查询代价不随数据量增长"""
+    collector = MetricsCollector()
+    start = time.perf_counter()
+    for _ in range(20000):
+        collector.record_request("/", "GET", 200, 0.01)
+    per_insert = (time.perf_counter() - start) / 20000
+    
+    start = time.perf_counter()
+    collector.get_metrics_summary()
+    query_time = time.perf_counter() - start
+    
+    assert per_insert < 1e-4
+    assert query_time < 0.05
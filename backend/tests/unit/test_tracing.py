@@ -0,0 +1,78 @@
+import json
+import base64
+import pytest
+import app as app_module
+from monitoring import Tracer, to_otlp
+
+def test_disabled_tracer_is_noop():
+    """测试未启用时不记录任何内容"""
+    tracer = Tracer(enabled=False)
+    trace = tracer.start_trace("s")
+    assert trace is None
+    with tracer.activate(trace):
+        with tracer.span("decode") as span:
+            assert span is None
+    tracer.finish(trace)
+    assert tracer.recent() == []
+
+def test_nested_spans_and_ring_buffer():
+    """测试嵌套阶段和环形缓冲区"""
+    tracer = Tracer(max_traces=2)
+    for session_id in ["a", "b", "c"]:
+        trace = tracer.start_trace(session_id)
+        with tracer.activate(trace):
+            with tracer.span("send_to_comfyui") as outer:
+                with tracer.span("comfyui_submit") as inner:
+                    pass
+                with pytest.raises(ValueError):
+                    with tracer.span("result_fetch"):
+                        raise ValueError("boom")
+        tracer.finish(trace)
+    
+    assert inner.parent_id == outer.span_id
+    assert outer.parent_id is None
+    recent = tracer.recent()
+    assert [t["session_id"] for t in recent] == ["c", "b"]
+    assert [s["name"] for s in recent[0]["spans"]] == ["send_to_comfyui", "comfyui_submit", "result_fetch"]
+    assert recent[0]["spans"][2]["attributes"]["error"] == "ValueError"
+    assert tracer.recent(session_id="b")[0]["session_id"] == "b"
+
+def test_otlp_file_export(tmp_path):
+    """测试导出为OTLP JSON行"""
+    path = tmp_path / "traces.jsonl"
+    tracer = Tracer(export_path=str(path))
+    trace = tracer.start_trace("s", source="binary")
+    with tracer.activate(trace):
+        with tracer.span("decode"):
+            pass
+    tracer.finish(trace)
+    
+    document = json.loads(path.read_text().splitlines()[0])
+    spans = document["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert spans[0]["traceId"] == trace.trace_id
+    assert spans[1]["parentSpanId"] == spans[0]["spanId"]
+    assert to_otlp(trace)["resourceSpans"][0]["scopeSpans"][0]["spans"][1]["name"] == "decode"
+
+def test_sketch_trace_end_to_end(ws_client, monkeypatch):
+    """测试草图处理的trace_id出现在状态消息中并可通过调试端点查询"""
+    monkeypatch.setattr(app_module, "tracer", Tracer())
+    client, session, submitted = ws_client
+    png = b"\x89PNG\r\n\x1a\n" + b"\x00" * 32
+    with client.websocket_connect("/api/ws/s1") as websocket:
+        websocket.send_json({
+            "type": "sketch_update",
+            "sketch_data": "data:image/png;base64," + base64.b64encode(png).decode()
+        })
+        messages = [websocket.receive_json()]
+        while messages[-1].get("status") != "completed":
+            messages.append(websocket.receive_json())
+    
+    trace_id = messages[-1]["trace_id"]
+    assert trace_id
+    assert all(m["trace_id"] == trace_id for m in messages if "trace_id" in m)
+    
+    traces = client.get("/api/debug/traces", params={"session_id": "s1"}).json()["traces"]
+    assert traces[0]["trace_id"] == trace_id
+    assert traces[0]["status"] == "ok"
+    names = [span["name"] for span in traces[0]["spans"]]
+    assert names == ["decode", "queue", "send_to_comfyui", "deliver"]
@@ -0,0 +1,113 @@
+import pytest
+import os
+import json
+from comfyui import WorkflowTemplateCache
+
+WORKFLOW = {
+    "prompt": {
+        "3": {"class_type": "KSampler", "inputs": {"seed": 1, "positive": ["6", 0], "negative": ["7", 0]}},
+        "6": {"class_type": "CLIPTextEncode", "inputs": {"text": "positive", "clip": ["4", 1]}},
+        "7": {"class_type": "CLIPTextEncode", "inputs": {"text": "negative", "clip": ["4", 1]}},
+        "9": {"class_type": "LoadImage", "inputs": {"image": "PLACEHOLDER_PATH", "upload": "image"}},
+        "11": {"class_type": "SaveImage", "inputs": {"filename_prefix": "output", "images": ["10", 0]}}
+    }
+}
+
+def write_workflow(path, workflow, mtime=None):
+    """写入工作流文件"""
+    with open(path, "w") as f:
+        json.dump(workflow, f)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+@pytest.fixture
+def workflow_dir(tmp_path):
+    """创建包含默认风格的工作流目录"""
+    write_workflow(tmp_path / "realistic.json", WORKFLOW)
+    return tmp_path
+
+@pytest.fixture
+def cache(workflow_dir):
+    """不节流的模板缓存"""
+    return WorkflowTemplateCache(str(workflow_dir), check_interval=0)
+
+def test_placeholders_are_indexed(cache):
+    """测试加载时记录需要替换的输入"""
+    template = cache.get("realistic")
+    assert template.image_inputs == [("9", "image")]
+    assert template.seed_inputs == [("3", "seed")]
+    assert template.text_inputs == [("6", "text")]
+
+def test_build_copies_only_patched_nodes(cache):
+    """测试生成工作流不修改模板且共享未替换的节点"""
+    template = cache.get("realistic")
+    workflow = cache.build("realistic", image="uploads/a.png", seed=42, positive_prompt="a cat")
+    
+    assert workflow["prompt"]["9"]["inputs"]["image"] == "uploads/a.png"
+    assert workflow["prompt"]["3"]["inputs"]["seed"] == 42
+    assert workflow["prompt"]["6"]["inputs"]["text"] == "a cat"
+    assert workflow["prompt"]["11"] is template.prompt["11"]
+    assert template.prompt["9"]["inputs"]["image"] == "PLACEHOLDER_PATH"
+    assert template.prompt["3"]["inputs"]["seed"] == 1
+
+def test_unknown_style_falls_back_to_default(cache):
+    """测试未知风格回退到默认风格"""
+    workflow = cache.build("missing", image="a.png")
+    assert workflow["prompt"]["9"]["inputs"]["image"] == "a.png"
+
+def test_missing_default_raises(tmp_path):
+    """测试没有可用模板时报错"""
+    cache = WorkflowTemplateCache(str(tmp_path), check_interval=0)
+    with pytest.raises(FileNotFoundError):
+        cache.build("realistic", image="a.png")
+
+def test_hot_reload(cache, workflow_dir):
+    """测试文件新增、修改、删除后自动重新加载"""
+    assert cache.styles() == ["realistic"]
+    original = cache.get("realistic")
+    
+    write_workflow(workflow_dir / "sketch.json", WORKFLOW)
+    assert cache.styles() == ["realistic", "sketch"]
+    assert cache.get("realistic") is original
+    
+    changed = json.loads(json.dumps(WORKFLOW))
+    changed["prompt"]["6"]["inputs"]["text"] = "updated"
+    write_workflow(workflow_dir / "realistic.json", changed, mtime=1)
+    assert cache.get("realistic").prompt["6"]["inputs"]["text"] == "updated"
+    
+    os.remove(workflow_dir / "sketch.json")
+    assert cache.styles() == ["realistic"]
+
+def test_invalid_update_keeps_previous_template(cache, workflow_dir):
+    """测试修改后的模板无法解析时保留旧版本"""
+    original = cache.get("realistic")
+    with open(workflow_dir / "realistic.json", "w") as f:
+        f.write("{invalid")
+    assert cache.get("realistic") is original
+
+def test_reload_is_throttled(workflow_dir):
+    """测试检查间隔内不重复扫描目录"""
+    cache = WorkflowTemplateCache(str(workflow_dir), check_interval=3600)
+    assert cache.styles() == ["realistic"]
+    write_workflow(workflow_dir / "sketch.json", WORKFLOW)
+    assert cache.styles() == ["realistic"]
+    cache.reload()
+    assert cache.styles() == ["realistic", "sketch"]
+
+def test_repository_workflows_are_indexed():
+    """测试仓库自带的工作流都能找到草图占位符"""
+    cache = WorkflowTemplateCache("workflow", check_interval=0)
+    for style in cache.styles():
+        assert cache.get(style).image_inputs
+
+def test_input_spec_is_parsed_and_not_submitted(cache, workflow_dir):
+    """测试模板的输入图像声明被解析，生成的工作流不包含该字段"""
+    assert cache.get("realistic").input_spec is None
+    write_workflow(
+        workflow_dir / "realistic.json",
+        {**WORKFLOW, "input": {"width": 1024, "height": 768, "multiple": 64}},
+        mtime=1_000_000_000,
+    )
+    spec = cache.get("realistic").input_spec
+    assert (spec.width, spec.height, spec.multiple, spec.mode, spec.upscale) == (1024, 768, 64, "RGB", False)
+    assert "input" not in cache.build("realistic", image="a.png")